@@ -0,0 +1,98 @@
+"""Benchmarks the float precision policies of the compiled solver on batched CIE and neutral cooling solves.
+
+Usage: python benchmark_precision.py [number of cells]
+
+Each policy is timed by the best of a few solves after a first one that compiles it, and compared against float64.
+With "mixed", the solutions are also compared against those of float64, which the refinement is meant to match.
+On CPU, where float32 arithmetic is not much faster than float64, expect "mixed" to be no faster than float64."""
+
+import sys
+from time import perf_counter
+
+PRECISIONS = "float64", "float32", "mixed"
+# absolute tolerance of the solves: with none, trace abundances heading for the floor never converge in float64, so
+# that many cells run to the iteration limit and the timings mostly measure that limit
+ATOL = 1e-10
+
+
+def cie_problem(num_cells: int):
+    """Returns the CIE network, and the knowns and guesses on a grid of temperatures"""
+    import numpy as np
+    from jaco.processes import CollisionalIonization, GasPhaseRecombination
+
+    processes = [CollisionalIonization(s) for s in ("H", "He", "He+")] + [
+        GasPhaseRecombination(i) for i in ("H+", "He+", "He++")
+    ]
+    system = sum(processes)
+    Tgrid = np.logspace(3, 6, num_cells)
+    ones = np.ones_like(Tgrid)
+    knowns = {"T": Tgrid, "n_Htot": ones}
+    guesses = {"H+": 0.9 * ones, "He+": 1e-2 * ones, "He++": 1e-2 * ones}
+    return system, knowns, guesses
+
+
+def neutral_cooling_problem(num_cells: int):
+    """Returns the neutral ISM thermochemistry network of the tests, and the knowns and guesses on a grid of
+    densities"""
+    import numpy as np
+    import sympy as sp
+    from jaco.data import SolarAbundances
+    from jaco.processes import (
+        FreeFreeEmission,
+        LineCoolingSimple,
+        CollisionalIonization,
+        GasPhaseRecombination,
+        Ionization,
+    )
+
+    processes = (
+        [CollisionalIonization(s) for s in ("H", "He", "He+")]
+        + [GasPhaseRecombination(i) for i in ("H+", "He+", "He++")]
+        + [FreeFreeEmission(i) for i in ("H+", "He+", "He++")]
+        + [LineCoolingSimple(i) for i in ("H", "He+")]
+    )
+    system = sum(processes)
+    n_Htot, T = sp.Symbol("n_Htot"), sp.Symbol("T")
+    system.heat += 1e-27 * n_Htot  # photoelectric heating
+    system += Ionization(species="H", rate_per_volume=2e-16 * n_Htot)  # cosmic rays
+    system.heat -= 1e-27 * n_Htot * sp.exp(-91.211 / T) * (4890 / sp.sqrt(T) * 3e-4 * n_Htot + 0.47 * T**0.15 * n_Htot)
+
+    ngrid = np.logspace(-2, 3, num_cells)
+    ones = np.ones_like(ngrid)
+    y = SolarAbundances.x("He")
+    guesses = {"T": 100 * ones, "H+": 0.5 * ones, "He+": y * 0.01 * ones, "He++": y * 0.01 * ones}
+    return system, {"n_Htot": ngrid}, guesses
+
+
+def best_time(solver, knowns, guesses, repeats=5):
+    """Returns the solution and the least wall time of a few solves, after one that compiles the solver"""
+    sol = solver(knowns, guesses)
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        solver(knowns, guesses)
+        times.append(perf_counter() - start)
+    return sol, min(times)
+
+
+def main():
+    import numpy as np
+
+    num_cells = int(sys.argv[1]) if len(sys.argv) > 1 else 10**5
+    print(f"{num_cells} cells")
+    for name, problem in ("CIE", cie_problem), ("neutral cooling", neutral_cooling_problem):
+        system, knowns, guesses = problem(num_cells)
+        base = sol_base = None
+        for precision in PRECISIONS:
+            solver = system.compile(knowns, guesses, precision=precision, atol=ATOL)
+            sol, time = best_time(solver, knowns, guesses)
+            base, sol_base = base or time, sol_base or sol
+            line = f"{name}, {precision}: {time:.3g}s, speedup {base / time:.2f}"
+            if precision == "mixed":
+                error = max(np.max(np.abs(sol[s] / sol_base[s] - 1), where=sol_base[s] > 1e-6, initial=0) for s in sol)
+                line += f", largest relative difference from float64 {error:.2g}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmarks the scaling of a batched CIE solve with the number of host CPU devices that the batch is sharded across.
+
+Usage: python benchmark_sharding.py [number of cells]
+
+Each device count is timed in its own process, since the number of host devices is fixed when JAX starts up. Only
+device counts up to the number of cores are timed: with more host devices than cores, the XLA CPU runtime can stall."""
+
+import os
+import sys
+import subprocess
+from time import perf_counter
+
+
+def run(num_devices: int, num_cells: int):
+    """Times the solve of num_cells cells sharded across num_devices devices, printing the best of a few solves"""
+    import numpy as np
+    from jaco.processes import CollisionalIonization, GasPhaseRecombination
+
+    processes = [CollisionalIonization(s) for s in ("H", "He", "He+")] + [
+        GasPhaseRecombination(i) for i in ("H+", "He+", "He++")
+    ]
+    system = sum(processes)
+    Tgrid = np.logspace(3, 6, num_cells)
+    ones = np.ones_like(Tgrid)
+    knowns = {"T": Tgrid, "n_Htot": ones}
+    guesses = {"H+": 0.9 * ones, "He+": 1e-2 * ones, "He++": 1e-2 * ones}
+    solver = system.compile(knowns, guesses, devices=num_devices)
+    solver(knowns, guesses)  # compile
+    times = []
+    for _ in range(5):
+        start = perf_counter()
+        solver(knowns, guesses)
+        times.append(perf_counter() - start)
+    print(min(times))
+
+
+def main():
+    num_cells = int(sys.argv[1]) if len(sys.argv) > 1 else 2**20
+    num_cores = os.cpu_count()
+    print(f"{num_cells} cells, {num_cores} cores")
+    base = None
+    for num_devices in [2**i for i in range(num_cores.bit_length()) if 2**i <= num_cores]:
+        env = os.environ | {
+            "XLA_FLAGS": f"--xla_force_host_platform_device_count={num_devices}",
+            "JAX_PLATFORMS": "cpu",
+        }
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", str(num_devices), str(num_cells)],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        time = float(output.split()[-1])
+        base = base or time
+        print(f"{num_devices} devices: {time:.3g}s, speedup {base / time:.2f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        main()
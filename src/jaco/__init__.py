@@ -3,3 +3,5 @@ from .numerics import *
 from .process import Process
 from .equation_system import EquationSystem
 from .equation import Equation
+from .compiled_solver import CompiledSolver
+from .table import LookupTable
@@ -0,0 +1,208 @@
+"""Persistent on-disk cache of compiled solvers, content-addressed by a hash of the network equations and the solver
+signature"""
+
+import os
+import types
+import hashlib
+import warnings
+import inspect
+import importlib
+from importlib.metadata import version
+import sympy as sp
+import jax
+from jax import export
+
+
+def cache_dir_default():
+    """Returns the cache directory set by the JACO_CACHE_DIR environment variable, if any"""
+    return os.environ.get("JACO_CACHE_DIR")
+
+
+def system_hash(system, knowns, unknowns, time_dependent=[], **options) -> str:
+    """
+    Returns a canonical hash of a system of equations and the signature of the solver to be compiled for it.
+
+    Parameters
+    ----------
+    system: EquationSystem
+        The system of equations
+    knowns: iterable
+        Names of the known quantities
+    unknowns: iterable
+        Names of the quantities to solve for
+    time_dependent: list, optional
+        Names of the time-dependent quantities
+    **options:
+        Any further options affecting the compiled solver, e.g. tol, careful_steps
+
+    Returns
+    -------
+    hash: str
+        Hex digest of the SHA-256 hash
+    """
+    h = hashlib.sha256()
+    h.update(f"jaco {version('jaco')} jax {jax.__version__} x64 {jax.config.jax_enable_x64}\n".encode())
+    h.update(repr((sorted(knowns), sorted(unknowns), sorted(time_dependent), sorted(options.items()))).encode())
+    for k in sorted(system):
+        h.update(f"\n{k}: {sp.srepr(system[k])}".encode())
+    return h.hexdigest()
+
+
+def global_names(code) -> set:
+    """Returns the set of global names referred to by a code object, including any nested code objects"""
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            names.update(global_names(c))
+    return names
+
+
+def serialize_function(func):
+    """Returns a picklable description of a lambdified function: its source code and the names it refers to"""
+    namespace = {}
+    for name in global_names(func.__code__):
+        if name not in func.__globals__:  # builtins
+            continue
+        value = func.__globals__[name]
+        if isinstance(value, types.ModuleType):
+            namespace[name] = ("module", value.__name__)
+        elif callable(value) and getattr(value, "__module__", None):
+            namespace[name] = ("attribute", value.__module__, getattr(value, "__qualname__", value.__name__))
+        else:
+            namespace[name] = ("value", value)
+    return func.__name__, inspect.getsource(func), namespace
+
+
+def deserialize_function(spec):
+    """Reconstructs a function from the description returned by serialize_function, by executing its source code, so
+    this must only be given descriptions from a trusted source, like any pickle"""
+    name, source, namespace_spec = spec
+    namespace = {}
+    for k, (kind, *value) in namespace_spec.items():
+        match kind:
+            case "module":
+                namespace[k] = importlib.import_module(value[0])
+            case "attribute":
+                obj = importlib.import_module(value[0])
+                for attr in value[1].split("."):
+                    obj = getattr(obj, attr)
+                namespace[k] = obj
+            case "value":
+                namespace[k] = value[0]
+    exec(source, namespace)
+    return namespace[name]
+
+
+def executable_args(*arg_shapes) -> list:
+    """Returns the abstract arguments of an executable exported by serialize_executable, with a symbolic leading (batch)
+    dimension N, for argument shapes given as for serialize_executable"""
+    N = export.symbolic_shape("N")[0]
+    dtype = jax.numpy.zeros(()).dtype
+    args = []
+    for shape in arg_shapes:
+        if len(shape) == 2 and isinstance(shape[0], tuple):
+            args.append(jax.ShapeDtypeStruct((N, *shape[0]), shape[1]))
+        else:
+            args.append(jax.ShapeDtypeStruct((N, *shape), dtype))
+    return args
+
+
+def serialize_executable(func, *arg_shapes):
+    """Exports a jitted function to serialized StableHLO, with a symbolic leading (batch) dimension for all
+    arguments.
+
+    Parameters
+    ----------
+    func: callable
+        Jitted function to export
+    *arg_shapes: tuple
+        Shapes of each argument, not including the batch dimension. Arguments whose dtype is not the default float
+        type can be given as (shape, dtype) tuples.
+
+    Returns
+    -------
+    serialized: bytearray or None
+        The serialized executable, or None if serialization is not available (requires the flatbuffers package)
+    """
+    try:
+        return export.export(func)(*executable_args(*arg_shapes)).serialize()
+    except ImportError:
+        return None
+
+
+def deserialize_executable(serialized, *arg_shapes):
+    """Returns a jitted function from the serialized output of serialize_executable, checking that it takes arguments of
+    the given shapes (as for serialize_executable) if any. Only the StableHLO computation is read, and no Python code.
+    """
+    exported = export.deserialize(serialized)
+    if arg_shapes:
+        expected = [(a.shape[1:], a.dtype) for a in executable_args(*arg_shapes)]
+        if [(a.shape[1:], a.dtype) for a in exported.in_avals] != expected:
+            raise ValueError(f"Executable takes arguments {exported.in_avals}, not {expected}.")
+    return jax.jit(exported.call)
+
+
+def enable_compilation_cache(cache_dir):
+    """Points the JAX persistent compilation cache at cache_dir, unless the user has already set one up"""
+    if jax.config.jax_compilation_cache_dir is None:
+        jax.config.update("jax_compilation_cache_dir", os.path.join(cache_dir, "xla"))
+        jax.config.update("jax_persistent_cache_min_compile_time_secs", 0)
+
+
+def cached_compile(system, cache_dir, knowns, unknowns, time_dependent=[], verbose=False, **options):
+    """
+    Returns a CompiledSolver for the system, with its Newton solve loaded from the on-disk cache if an identical system
+    and signature has been compiled before, and otherwise exported to the cache. Only the exported StableHLO of the
+    Newton solve is cached: the rest of the solver is always rebuilt from the equations, so that no Python code is ever
+    loaded from the cache directory, which may be shared. Cache entries that cannot be used are ignored with a warning.
+
+    Parameters
+    ----------
+    system: EquationSystem
+        The system of equations
+    cache_dir: str
+        Path of the cache directory
+    knowns: iterable
+        Names of the known quantities
+    unknowns: iterable
+        Names of the quantities to solve for
+    time_dependent: list, optional
+        Names of the time-dependent quantities
+    **options:
+        Any further options passed to CompiledSolver
+
+    Returns
+    -------
+    solver: CompiledSolver
+        The compiled solver
+    """
+    from .compiled_solver import CompiledSolver
+
+    os.makedirs(cache_dir, exist_ok=True)
+    enable_compilation_cache(cache_dir)
+    path = os.path.join(cache_dir, system_hash(system, knowns, unknowns, time_dependent, **options) + ".jax")
+    solver = CompiledSolver(system, knowns, unknowns, time_dependent, verbose=verbose, **options)
+
+    if os.path.isfile(path):
+        try:
+            with open(path, "rb") as F:
+                solver.import_rootsolve(F.read())
+            solver.printv(f"Loaded compiled Newton solve from {path}")
+            return solver
+        except Exception as e:  # stale or corrupted cache entry: just export it again
+            warnings.warn(f"Ignoring the cached Newton solve {path}, which could not be loaded: {e}")
+
+    serialized = solver.export_rootsolve()
+    if serialized is None:  # cannot be exported, so only its XLA compilation is cached
+        return solver
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as F:
+            F.write(serialized)
+        os.replace(tmp_path, path)  # atomic, so concurrent jobs never see a partially-written file
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+    # use the exported version from here on, so that its XLA compilation is cached for the next process
+    solver.import_rootsolve(serialized)
+    return solver
@@ -0,0 +1,1152 @@
+"""Implementation of CompiledSolver: a reusable numerical solver for an EquationSystem with a fixed signature of known
+quantities, unknowns and time-dependent quantities"""
+
+from contextlib import nullcontext
+import warnings
+import numpy as np
+import sympy as sp
+import jax
+from jax import numpy as jnp
+from .symbols import x_, sanitize_symbols
+from .data import SolarAbundances
+from .equation import Equation
+from .numerics import newton_rootsolve, compacting_rootsolve, sparse_jacfwd, sparse_lu_solver
+from .numerics import bucketed_batches, pad_batch, padding_mask, auto_chunk_size, stream_batches, continuation_sweep
+from .numerics import bucket_size, batch_mesh
+from .numerics import pseudo_transient_continuation, bracketed_newton, unconverged
+from .cache import serialize_function, deserialize_function, serialize_executable, deserialize_executable
+
+# values assumed for quantities found in the network that are neither specified nor solved for.
+# This should eventually be specified at the model level.
+prescriptions = {"y": SolarAbundances.x("He"), "Y": SolarAbundances.mass_fraction["He"], "Z": 1.0, "C_2": 1.0}
+
+
+# attributes of CompiledSolver holding lambdified functions of (X, params), and of the auxiliary variables if any
+LAMBDIFIED_FUNCS = ("rhs_func", "tolerance_func", "funcjac", "auxiliary_func")
+# attributes of CompiledSolver holding jitted functions, which are re-traced rather than pickled
+JITTED_FUNCS = (
+    "rootsolve_sensitivities",
+    "continuation_step",
+    "residual_batch",
+    "newton_step_converged",
+    "heat_newton_step",
+    "escalation_solves",
+)
+# with the opt-in jacobian="auto", the symbolic Jacobian is used for systems with more unknowns than this
+SYMBOLIC_JACOBIAN_MIN_UNKNOWNS = 8
+# with the opt-in sparse="auto", the sparsity of the Jacobian is exploited for systems with more unknowns than this
+SPARSE_MIN_UNKNOWNS = 16
+# allowed values of the precision option
+PRECISIONS = ("default", "float32", "float64", "mixed")
+# per-cell status codes of a solve: converged, stopped at the iteration limit, with non-finite values, or stalled with
+# a residual larger than that of the guess, away from a root
+STATUS_CONVERGED, STATUS_MAX_ITER, STATUS_NONFINITE, STATUS_STALLED = 0, 1, 2, 3
+# iteration limit of the Newton solve (the default of newton_rootsolve): solves that take this many have not converged
+NEWTON_MAX_ITER = 100
+# with resolve_failed=True, the solver options tried in turn on the cells that are still failing, re-solving them from
+# their original guesses: more careful steps, a line search, log variables, and pseudo-transient continuation
+RESOLVE_ESCALATION = ({"careful_steps": 50}, {"line_search": True}, {"log_variables": True}, {"method": "ptc"})
+# with method="ptc", the maximum number of pseudo-time steps, the iteration limit of each step, and that of the Newton
+# solves tried between steps, which is low so that they are only accepted close to the solution being approached
+PTC_MAX_STEPS = 100
+PTC_MAX_ITER = 10
+PTC_SOLVE_MAX_ITER = 3
+# with method="ptc", the least absolute tolerance of the steps and of the final Newton solve, which need not resolve
+# trace abundances down to round-off noise
+PTC_STEP_ATOL = 1e-10
+# with method="bisection", the temperature bracket searched for thermal equilibrium, and the iteration limit of the
+# warm-started chemistry solves, beyond which the chemistry is re-solved from the original guesses
+BISECTION_T_MIN = 1.0
+BISECTION_T_MAX = 1e9
+BISECTION_CHEMISTRY_MAX_ITER = 10
+
+
+def matches(name: str, symbol) -> bool:
+    """Whether a user-facing quantity name (e.g. "H+" or "x_H+" or "T") refers to a symbol"""
+    return name == str(symbol) or f"x_{name}" == str(symbol)
+
+
+class CompiledSolver:
+    """
+    Numerical solver for an EquationSystem with a fixed set of known quantities, unknowns and time-dependent
+    quantities.
+
+    All of the symbolic work (network reduction, lambdification of the RHS and tolerance functions) is done once on
+    construction, and the Newton solve is jitted, so repeated solves with new numerical values pay no symbolic or
+    tracing cost. Instances are normally obtained from EquationSystem.compile or Process.compile.
+
+    Parameters
+    ----------
+    system: EquationSystem
+        The system of equations to solve
+    knowns: iterable
+        Names of the quantities that will be specified numerically, e.g. "T", "n_Htot"
+    unknowns: iterable
+        Names of the quantities to solve for, e.g. "H+", "T"
+    time_dependent: list, optional
+        Names of the quantities whose time derivatives are retained and discretized with a backward difference
+    tol: float, optional
+        Desired relative error in chemical abundances (default: 1e-3)
+    atol: float, optional
+        Absolute tolerance: changes in the unknowns and abundances smaller than this count as converged, so that trace
+        abundances at the level of round-off noise do not hold up convergence (default: 0)
+    careful_steps: int, optional
+        Number of careful initial steps in the Newton solve before full step size is used (default: 20, or 1 with
+        log_variables=True, where the steps are already bounded)
+    buckets: str or iterable, optional
+        If specified, batches of inputs are padded up to one of a fixed set of batch sizes so that varying batch sizes
+        do not trigger recompilation: either "pow2" for powers of 2, or an iterable of allowed batch sizes. Batches
+        larger than the largest allowed size are split into chunks of that size. (default: None, do not pad)
+    iters_per_round: int, optional
+        If specified, solve with compacting_rootsolve: iterate in rounds of this many Newton iterations, compacting
+        the batch down to the unconverged entries after each round, so that a few slowly-converging entries do not
+        hold up the whole batch. Compacted batches are padded according to buckets (default: "pow2").
+    chunk_size: int or str, optional
+        If specified, stream the inputs through the solver in chunks of this many cells, overlapping host-to-device
+        transfer with computation and writing into preallocated host arrays, so that memory use is bounded for very
+        large batches. If "auto", use the largest power of 2 that fits in memory_budget. (default: None, no chunking)
+    memory_budget: int, optional
+        Memory budget in bytes used to choose the chunk size automatically (default: 1GiB)
+    jacobian: str, optional
+        How to compute the Jacobian in the Newton iteration: "symbolic" to differentiate the system symbolically and
+        lambdify the Jacobian together with the RHS, "jacfwd" for forward-mode autodiff of the lambdified RHS, or
+        "auto" to use the symbolic Jacobian for systems of more than SYMBOLIC_JACOBIAN_MIN_UNKNOWNS unknowns, a rough
+        heuristic (default: "jacfwd")
+    sparse: bool or str, optional
+        Whether to exploit the structural sparsity pattern of the Jacobian: only its nonzero entries are evaluated
+        (with one forward-mode pass per group of structurally independent columns if jacobian="jacfwd"), and the
+        Newton step is solved by sparse LU factorization (see sparse_lu_solver). "auto" enables this for systems of
+        more than SPARSE_MIN_UNKNOWNS unknowns, a rough heuristic (default: False)
+    method: str, optional
+        Newton variant: "newton" to evaluate and factorize the Jacobian every iteration, or "chord" or "broyden" to
+        reuse it for up to jac_reuse iterations, re-evaluating it when the iteration stops contracting, or "ptc" for
+        pseudo-transient continuation: implicit pseudo-time steps towards steady state with the backward-difference
+        time derivatives of time_dependent, switching to Newton as soon as it converges. "ptc" is the most robust to
+        poor guesses, does not need careful_steps, and ignores buckets, iters_per_round and chunk_size. Or
+        "bisection" for thermal equilibrium: a bracketed search in log T for the root of the net heating, by Newton
+        steps safeguarded with bisection, solving the chemistry at fixed T with Newton at each point, which converges
+        within a bounded number of steps wherever heating exceeds cooling at 1K and cooling exceeds heating at 1e9K.
+        (default: "newton")
+    jac_reuse: int, optional
+        Maximum number of iterations to reuse a Jacobian for with method="chord" or "broyden" (default: 5)
+    line_search: bool, optional
+        Whether to globalize the Newton iteration with a backtracking line search that takes full Newton steps
+        whenever they make progress, in which case careful_steps is ignored (default: False)
+    log_variables: bool, optional
+        Whether to iterate on the logarithms of the unknowns (abundances and temperature) rather than the unknowns
+        themselves, which keeps them positive without clipping and bounds the steps in quantities spanning many
+        orders of magnitude. The RHS and Jacobian are still evaluated at the unknowns themselves, so the inputs and
+        solutions are unchanged. (default: False)
+    precision: str, optional
+        Floating-point precision policy: "float32" or "float64" to iterate in that precision regardless of the global
+        JAX configuration, "mixed" to iterate in float32 and then refine the solution with Newton steps in float64
+        until it converges to tol, or "default" to use the default JAX float type. "mixed" is meant for accelerators
+        whose float64 throughput is a small fraction of their float32 throughput, e.g. consumer GPUs. On CPU, float32
+        is not fast enough for it to pay off, and it warns: it is no faster than "float64" even when the refinement
+        takes a single step (see scripts/benchmark_precision.py) (default: "default")
+    refine_steps: int, optional
+        With precision="mixed", the number of float64 Newton steps taken on all cells before the batch is compacted
+        down to those that have not yet converged, e.g. cells whose float32 residual underflowed (default: 2)
+    resolve_failed: bool, optional
+        Whether to re-solve the cells that fail to converge from their original guesses with increasingly robust
+        settings (see RESOLVE_ESCALATION) until they converge, so that only the failures pay for the robustness. The
+        last resort of pseudo-transient continuation is skipped with time_dependent, and its solver is only compiled
+        once some cells have failed with every other setting. (default: False)
+    devices: int, str or list, optional
+        Devices across which to shard the batch of each Newton solve, so that each device iterates on its own part of
+        the batch independently: a number of devices, a list of devices, or "all". The cores of a host CPU can be
+        exposed as devices with XLA_FLAGS=--xla_force_host_platform_device_count=<cores>. (default: None, solve on the
+        default device)
+    auxiliary: bool, optional
+        Whether to keep the abundances eliminated by the conservation laws as auxiliary variables that are evaluated
+        once per cell, rather than substituting their definitions into every equation (see
+        EquationSystem.do_conservation_reductions), which keeps the size of the generated code and its evaluation cost
+        proportional to the size of the network (default: False)
+    stoichiometry: bool or str, optional
+        Whether to factor the RHS as S @ r (see EquationSystem.stoichiometry): the distinct rates r are lambdified and
+        differentiated once each, however many equations they enter, and the RHS and Jacobian are assembled from them
+        with the sparse integer stoichiometry matrix S. "auto" does this if any rates are shared between equations.
+        (default: False)
+    verbose: bool, optional
+        Whether to print information about the setup and solution of the system
+    """
+
+    def __init__(
+        self,
+        system,
+        knowns,
+        unknowns,
+        time_dependent=[],
+        tol=1e-3,
+        atol=0,
+        careful_steps=None,
+        buckets=None,
+        iters_per_round=None,
+        chunk_size=None,
+        memory_budget=2**30,
+        jacobian="jacfwd",
+        sparse=False,
+        method="newton",
+        jac_reuse=5,
+        line_search=False,
+        log_variables=False,
+        precision="default",
+        refine_steps=2,
+        resolve_failed=False,
+        devices=None,
+        auxiliary=False,
+        stoichiometry=False,
+        verbose=False,
+    ):
+        self.verbose = verbose
+        self.buckets = buckets
+        self.iters_per_round = iters_per_round
+        self.chunk_size = chunk_size
+        self.memory_budget = memory_budget
+        if jacobian not in ("auto", "symbolic", "jacfwd"):
+            raise ValueError(f"Unrecognized Jacobian method {jacobian}")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unrecognized precision {precision}: must be one of {PRECISIONS}")
+        if precision == "mixed" and jax.default_backend() == "cpu":
+            warnings.warn('precision="mixed" is no faster than "float64" on CPU, and only delivers the same accuracy.')
+        self.precision = precision
+        self.refine_steps = refine_steps
+        self.resolve_failed = resolve_failed
+        self.devices = devices
+        self.mesh = self.device_mesh()
+        self.auxiliary = auxiliary
+        self.knowns = list(knowns)
+        self.unknowns = list(unknowns)
+        self.time_dependent = list(time_dependent)
+        self.tol = tol
+        self.atol = atol
+        if careful_steps is None:
+            careful_steps = 1 if log_variables else 20
+        self.careful_steps = careful_steps
+        self.method = method
+        self.jac_reuse = jac_reuse
+        self.line_search = line_search
+        self.log_variables = log_variables
+        if method == "ptc" and self.time_dependent:
+            raise ValueError("Pseudo-transient continuation solves for steady state, so cannot have time_dependent.")
+        if method == "bisection" and (self.time_dependent or "T" not in self.unknowns or "u" in self.unknowns):
+            raise ValueError("Bisection solves for thermal equilibrium, so needs T unknown and no time_dependent.")
+
+        system = system.copy()
+        if "u" in self.unknowns or "T" in self.time_dependent:
+            system["u"] = Equation(0, system.eos.internal_energy - sp.Symbol("u"))
+        subsystem = system.reduced(self.knowns, self.time_dependent, auxiliary)
+        self.subsystem = subsystem
+        auxiliary_symbols = list(subsystem.auxiliary)
+        # the auxiliary variables are not free: the system depends on the symbols of their definitions instead
+        symbols = subsystem.symbols.difference(auxiliary_symbols)
+        symbols = symbols.union(*(subsystem.auxiliary[a].free_symbols for a in auxiliary_symbols))
+
+        # are there any symbols for which we can make a reasonable assumption?
+        self.assumed_values = {}
+        if len(symbols) > len(subsystem) + len(self.knowns):
+            undetermined_symbols = [
+                s for s in symbols if not any(matches(name, s) for name in self.unknowns + self.knowns)
+            ]
+            self.printv(f"Undetermined symbols: {undetermined_symbols}")
+            for s in undetermined_symbols:
+                if str(s) in prescriptions:
+                    self.assumed_values[str(s)] = prescriptions[str(s)]
+                    self.printv(f"{s} not specified; assuming {s}={prescriptions[str(s)]}.")
+
+        self.printv(
+            f"Free symbols: {symbols}\nKnown values: {self.knowns}\nAssumed values: {list(self.assumed_values)}\nEquations solved: {list(subsystem.rhs)}"
+        )
+        if len(symbols) != len(self.knowns) + len(self.assumed_values) + len(subsystem):
+            raise ValueError(
+                f"Number of free symbols is {len(symbols)} != number of knowns {len(self.knowns)} + number of assumptions {len(self.assumed_values)} + number of equations {len(subsystem)}\n"
+            )
+        else:
+            self.printv(
+                f"It's solvin time. Solving for {set(self.unknowns)} based on input {set(self.knowns)} and assumptions about {set(self.assumed_values)}"
+            )
+
+        # establish the order of the solved variables and known parameters in the numerical arrays
+        self.unknown_symbols, self.unknown_names = [], []
+        self.param_symbols, self.param_names = [], []
+        for s in symbols:
+            for g in self.unknowns:
+                if matches(g, s):
+                    self.unknown_symbols.append(s)
+                    self.unknown_names.append(g)
+            for k in self.knowns + list(self.assumed_values):
+                if matches(k, s):
+                    self.param_symbols.append(s)
+                    self.param_names.append(k)
+
+        self.lambda_args = (self.unknown_symbols, self.param_symbols)
+        self.auxiliary_func = None
+        if auxiliary_symbols:  # the lambdified functions take the values of the auxiliary variables too
+            self.auxiliary_func = self.lambdify([subsystem.auxiliary[a] for a in auxiliary_symbols])
+            self.lambda_args += (auxiliary_symbols,)
+        if jacobian == "auto":  # symbolic Jacobian only pays off once it is sparse enough to beat dense autodiff
+            jacobian = "symbolic" if len(self.unknown_symbols) > SYMBOLIC_JACOBIAN_MIN_UNKNOWNS else "jacfwd"
+        self.jacobian = jacobian
+        self.sparse = len(self.unknown_symbols) > SPARSE_MIN_UNKNOWNS if sparse == "auto" else sparse
+        # order the equations so that each species' equation lines up with its abundance on the Jacobian diagonal,
+        # which is what the fixed pivots of the sparse solver rely on
+        keys = list(subsystem.rhs)
+        diagonal = [k for s in self.unknown_symbols for k in keys if matches(k, s)]
+        self.equation_keys = diagonal + [k for k in keys if k not in diagonal]
+        rhs = dict(zip(keys, subsystem.rhs_scaled))
+        rhs = [rhs[k] for k in self.equation_keys]
+        self.jac_pattern = subsystem.sparsity_pattern(self.unknown_symbols, self.equation_keys)
+        self.printv(f"Jacobian has {self.jac_pattern.sum()}/{self.jac_pattern.size} structurally nonzero entries")
+
+        # with stoichiometry, the lambdified functions evaluate the distinct rates r, and the RHS is assembled as S @ r
+        if stoichiometry:
+            rates, S = subsystem.stoichiometry(self.equation_keys)
+        if stoichiometry == "auto":  # only pays off if some rates are shared between equations
+            stoichiometry = np.count_nonzero(S) > S.shape[1]
+        self.stoichiometry = stoichiometry
+        self.rate_terms, self.jac_rate_terms = None, None
+        if stoichiometry:
+            self.printv(f"RHS factored into {S.shape[1]} rates from {np.count_nonzero(S)} terms")
+            self.rate_terms = [[(j, int(S[i, j])) for j in np.flatnonzero(S[i])] for i in range(len(S))]
+            rhs = rates
+
+        self.rhs_func = self.lambdify(rhs)
+        self.funcjac = None
+        if self.jacobian == "symbolic":  # only differentiate the structurally nonzero entries
+            pattern = self.jac_pattern
+            if stoichiometry:  # differentiate each rate once, and assemble the Jacobian as S @ dr/dX
+                pattern = np.array([[x in subsystem.dependencies(r) for x in self.unknown_symbols] for r in rates])
+                self.jac_rate_terms = self.stoichiometric_jacobian_terms(S, pattern, self.jac_pattern)
+            jac = [subsystem.total_derivative(rhs[i], self.unknown_symbols[j]) for i, j in zip(*np.nonzero(pattern))]
+            self.funcjac = self.lambdify([rhs, jac])  # lambdified together so that CSE spans both
+
+        # default: converge on all abundances solved for
+        tolerance_vars = [x_(s) for s in subsystem.chemical_species if x_(s) not in subsystem.auxiliary]
+        if "T" in self.unknowns:
+            tolerance_vars += [sp.Symbol("T")]
+        if "u" in self.unknowns:
+            tolerance_vars += [sp.Symbol("u"), subsystem["heat"].rhs]  # converge on the internal energy and cooling rate
+        self.tolerance_func = self.lambdify(tolerance_vars)
+
+        self.substitution_funcs = []  # functions for recovering the quantities eliminated from the system
+        for expr, sub in reversed(subsystem.substitutions):
+            if expr in self.unknown_symbols or "n_" in str(expr):
+                continue
+            args = list(sub.free_symbols)
+            self.substitution_funcs.append((expr, args, sp.lambdify(args, sub)))
+
+        self.setup_sparse()
+        self.rootsolve = self.jit_rootsolve()
+        self.setup_jitted()
+        self.pseudo_transient = self.pseudo_transient_solver(system) if method == "ptc" else None
+        # as the last resort of resolve_failed, the pseudo-transient solver is only built for the first batch that
+        # needs it, from a copy of the system as it is now
+        escalate_ptc = resolve_failed and method != "ptc" and not self.time_dependent
+        self.ptc_system = system.copy() if escalate_ptc else None
+        self.chemistry = self.chemistry_solver(system) if method == "bisection" else None
+
+    def __getstate__(self):
+        """Replaces the generated functions with picklable representations so that the solver can be pickled, e.g. to
+        send it to other processes. Like any pickle, the result must only be loaded from a trusted source, since the
+        lambdified functions are restored from their source code."""
+        state = self.__dict__.copy()
+        del state["sparse_jac"], state["linsolve"]  # rebuilt from the sparsity pattern
+        del state["mesh"]  # rebuilt from devices
+        for name in JITTED_FUNCS:
+            del state[name]
+        for name in LAMBDIFIED_FUNCS:
+            if state[name] is not None:
+                state[name] = serialize_function(state[name])
+        state["substitution_funcs"] = [(e, a, serialize_function(f)) for e, a, f in self.substitution_funcs]
+        state["rootsolve"] = self.export_rootsolve()
+        return state
+
+    def __setstate__(self, state):
+        """Reconstructs the generated functions from their pickled representations"""
+        self.__dict__.update(state)
+        for name in LAMBDIFIED_FUNCS:
+            if state[name] is not None:
+                setattr(self, name, deserialize_function(state[name]))
+        self.substitution_funcs = [(e, a, deserialize_function(f)) for e, a, f in state["substitution_funcs"]]
+        self.mesh = self.device_mesh()
+        self.setup_sparse()
+        self.setup_jitted()
+        if state["rootsolve"] is None:  # executable could not be serialized, so re-trace it
+            self.rootsolve = self.jit_rootsolve()
+        else:
+            self.import_rootsolve(state["rootsolve"])
+
+    def export_rootsolve(self):
+        """Returns the jitted Newton solve exported to serialized StableHLO for the precision it is run in, or None if
+        it cannot be exported: sharded executables are tied to the devices, and exporting needs flatbuffers"""
+        if self.mesh is not None:
+            return None
+        with self.precision_context():
+            return serialize_executable(self.rootsolve, *self.rootsolve_shapes())
+
+    def import_rootsolve(self, serialized):
+        """Replaces the jitted Newton solve with one exported by export_rootsolve, checking that it takes the same
+        arguments"""
+        with self.precision_context():
+            self.rootsolve = deserialize_executable(serialized, *self.rootsolve_shapes())
+
+    def rootsolve_shapes(self):
+        """Returns the shapes of the guess, parameter and mask arguments of the jitted Newton solve, without the batch
+        dimension, as taken by serialize_executable"""
+        return (len(self.unknown_symbols),), (len(self.param_symbols),), ((), bool)
+
+    def device_mesh(self):
+        """Returns the device mesh across which the Newton solves are sharded, or None if they are not"""
+        if self.devices is None:
+            return None
+        return batch_mesh(None if self.devices == "all" else self.devices)
+
+    def setup_sparse(self):
+        """Sets up the functions exploiting the sparsity pattern of the Jacobian, if enabled"""
+        self.sparse_jac, self.linsolve = None, None
+        if self.sparse:
+            if self.funcjac is None:
+                self.sparse_jac = sparse_jacfwd(self.f_numerical, self.jac_pattern)
+            self.linsolve = sparse_lu_solver(self.jac_pattern)
+
+    def setup_jitted(self):
+        """Sets up the jitted functions other than the Newton solve, which are traced on first use"""
+        self.rootsolve_sensitivities = self.jit_sensitivities()
+        self.continuation_step = self.jit_continuation_step()
+        self.residual_batch = jax.jit(jax.vmap(lambda X, params: self.f_numerical(X, *params)))
+        self.newton_step_converged = self.jit_newton_step_converged()
+        self.heat_newton_step = self.jit_heat_newton_step()
+        self.escalation_solves = {}  # jitted Newton solves with the options of each stage of RESOLVE_ESCALATION
+
+    def jit_rootsolve(self):
+        """Returns the jitted Newton solve of the system as a function of the guess, parameter and mask arrays"""
+
+        def rootsolve(guesses, params, mask):
+            return newton_rootsolve(
+                self.f_numerical,
+                guesses,
+                params,
+                return_num_iter=True,
+                return_stats=True,
+                mask=mask,
+                mesh=self.mesh,
+                **self.newton_options,
+            )
+
+        return jax.jit(rootsolve)
+
+    def jit_sensitivities(self):
+        """Returns the jitted function of the guess and parameter arrays returning the solution, and the shape (N,n,n_p)
+        array of its derivatives with respect to the parameters, differentiating the Newton solve implicitly with one
+        forward-mode pass per parameter"""
+
+        def rootsolve_sensitivities(guesses, params):
+            def solve(params):
+                return newton_rootsolve(self.f_numerical, guesses, params, **self.newton_options)
+
+            n_p = params.shape[1]
+            seeds = jnp.broadcast_to(jnp.eye(n_p, dtype=params.dtype)[:, None, :], (n_p,) + params.shape)
+            return jax.vmap(lambda seed: jax.jvp(solve, (params,), (seed,)), out_axes=(None, -1))(seeds)
+
+        return jax.jit(rootsolve_sensitivities)
+
+    def jit_continuation_step(self):
+        """Returns the jitted Newton solve used for continuation steps, as a function of the guess, parameter and mask
+        arrays and the iteration limit. No careful steps are taken, since the guesses are already close to the solution.
+        """
+
+        def continuation_step(guesses, params, mask, max_iter):
+            return newton_rootsolve(
+                self.f_numerical,
+                guesses,
+                params,
+                return_num_iter=True,
+                mask=mask,
+                max_iter=max_iter,
+                mesh=self.mesh,
+                **(self.newton_options | dict(careful_steps=1)),
+            )
+
+        return jax.jit(continuation_step)
+
+    def jit_newton_step_converged(self):
+        """Returns the jitted function of the solution and parameter arrays returning whether a full Newton step from
+        each solution is within the convergence tolerance of the Newton solve, i.e. whether it is a genuine root rather
+        than a point the iteration stalled at"""
+
+        def newton_step_converged(X, params):
+            dx = jnp.linalg.solve(jax.jacfwd(self.f_numerical)(X, *params), self.f_numerical(X, *params))
+            within_tol = ~unconverged(X, dx, 0, params, self.tolerance_numerical, self.tol, 1, self.atol)
+            return jnp.all(jnp.isfinite(dx)) & within_tol
+
+        return jax.jit(jax.vmap(newton_step_converged))
+
+    def jit_heat_newton_step(self):
+        """Returns the jitted function of the solution and parameter arrays returning the net heating and the Newton
+        step in log T on it, for method="bisection". The step is the temperature component of the Newton step of the
+        full system whose residuals other than the heating are zeroed: at a solution of the chemistry, this is the
+        step -heat/(d heat/dT) along the chemical equilibrium, by the Schur complement of the chemistry Jacobian."""
+
+        def heat_newton_step(X, params):
+            heat, T = self.equation_keys.index("heat"), self.unknown_names.index("T")
+            F = self.f_numerical(X, *params)
+            J = jax.jacfwd(self.f_numerical)(X, *params)
+            dX = -jnp.linalg.solve(J, jnp.zeros_like(F).at[heat].set(F[heat]))
+            return F[heat], dX[T] / X[T]
+
+        return jax.jit(jax.vmap(heat_newton_step))
+
+    def chemistry_solver(self, system):
+        """Returns the solver for the chemistry at fixed temperature used by method="bisection": the same system, with
+        T known, so that the heat equation is dropped"""
+        return CompiledSolver(
+            system,
+            self.knowns + ["T"],
+            [s for s in self.unknowns if s != "T"],
+            tol=self.tol,
+            atol=self.atol,
+            careful_steps=self.careful_steps,
+            jacobian=self.jacobian,
+            sparse=self.sparse,
+            line_search=self.line_search,
+            log_variables=True,
+            devices=self.devices,
+            auxiliary=self.auxiliary,
+            stoichiometry=self.stoichiometry,
+            verbose=self.verbose,
+        )
+
+    def pseudo_transient_solver(self, system):
+        """Returns the solver for the implicit pseudo-time steps of method="ptc": the same system, with the abundances
+        and the temperature (if solved for) made time-dependent, from the previous state *_0 over a step Δt. The steps
+        are solved in log variables, which keeps them positive, and in float64, since the rates far from steady state
+        can be too small to resolve in float32."""
+        species = [s[2:] if s.startswith("x_") else s for s in self.unknowns if s not in ("T", "u")]
+        knowns = self.knowns + [f"{s}_0" for s in species] + ["Δt"]
+        unknowns, time_dependent = list(self.unknowns), species
+        if "T" in self.unknowns:  # the heat equation is stepped in the internal energy u
+            knowns.append("u_0")
+            unknowns += [] if "u" in unknowns else ["u"]
+            time_dependent = species + ["T"]
+        return CompiledSolver(
+            system,
+            knowns,
+            unknowns,
+            time_dependent,
+            tol=self.tol,
+            atol=max(self.atol, PTC_STEP_ATOL),
+            careful_steps=1,
+            jacobian=self.jacobian,
+            sparse=self.sparse,
+            line_search=self.line_search,
+            log_variables=True,
+            precision="float64",
+            devices=self.devices,
+            auxiliary=self.auxiliary,
+            stoichiometry=self.stoichiometry,
+            verbose=self.verbose,
+        )
+
+    def precision_context(self):
+        """Context manager setting the float precision that the Newton iteration runs in"""
+        if self.precision == "default":
+            return nullcontext()
+        return jax.enable_x64(self.precision == "float64")
+
+    @property
+    def newton_options(self):
+        """Keyword arguments passed to the Newton solvers"""
+        return dict(
+            jacfunc=self.jac_numerical if self.funcjac is not None else self.sparse_jac,
+            tolfunc=self.tolerance_numerical,
+            rtol=self.tol,
+            atol=self.atol,
+            careful_steps=self.careful_steps,
+            nonnegative=True,
+            linsolve=self.linsolve,
+            method="newton" if self.method in ("ptc", "bisection") else self.method,
+            jac_reuse=self.jac_reuse,
+            line_search=self.line_search,
+            log_variables=self.log_variables,
+        )
+
+    def printv(self, *a, **k):
+        """Print only if verbose=True"""
+        if self.verbose:
+            print(*a, **k)
+
+    def lambdify(self, expr):
+        """Turns an expression into a function of (X, params), and of the values of the auxiliary variables if any, for
+        numerical evaluation"""
+        return sp.lambdify(sanitize_symbols(self.lambda_args), sanitize_symbols(expr), modules="jax", cse=True)
+
+    def lambda_inputs(self, X, params):
+        """Returns the arguments of the lambdified functions for the unknowns X and parameters params, including the
+        values of the auxiliary variables, if any, which are evaluated once here"""
+        if self.auxiliary_func is None:
+            return X, params
+        return X, params, self.auxiliary_func(X, params)
+
+    @staticmethod
+    def stoichiometric_sum(terms, values):
+        """Returns the sum of coeff * values[j] over the (j, coeff) pairs in terms, i.e. one entry of S @ values"""
+        return sum((values[j] if coeff == 1 else coeff * values[j] for j, coeff in terms), start=0)
+
+    @staticmethod
+    def stoichiometric_jacobian_terms(S, rate_pattern, jac_pattern):
+        """
+        Returns the terms of the structurally nonzero entries of the Jacobian S @ dr/dX, for assembling them from the
+        structurally nonzero derivatives of the rates with stoichiometric_sum
+
+        Parameters
+        ----------
+        S: numpy.ndarray
+            Shape (num_equations, num_rates) stoichiometry matrix
+        rate_pattern: numpy.ndarray
+            Shape (num_rates, num_unknowns) boolean sparsity pattern of dr/dX, whose nonzeros are numbered in the order
+            of np.nonzero
+        jac_pattern: numpy.ndarray
+            Shape (num_equations, num_unknowns) boolean sparsity pattern of the Jacobian
+
+        Returns
+        -------
+        terms: list
+            For each nonzero of jac_pattern in the order of np.nonzero, the list of (index of rate derivative, coeff)
+        """
+        index = {(j, k): p for p, (j, k) in enumerate(zip(*np.nonzero(rate_pattern)))}
+        return [
+            [(index[j, k], int(S[i, j])) for j in np.flatnonzero(S[i]) if (j, k) in index]
+            for i, k in zip(*np.nonzero(jac_pattern))
+        ]
+
+    def f_numerical(self, X, *params):
+        """JAX function to rootfind"""
+        values = self.rhs_func(*self.lambda_inputs(X, params))
+        if self.rate_terms is not None:  # assemble S @ r
+            values = [self.stoichiometric_sum(terms, values) for terms in self.rate_terms]
+        return jnp.array(values)
+
+    def jac_numerical(self, X, *params):
+        """JAX function returning the symbolically-computed Jacobian of f_numerical"""
+        rows, cols = np.nonzero(self.jac_pattern)
+        values = self.funcjac(*self.lambda_inputs(X, params))[1]
+        if self.jac_rate_terms is not None:  # assemble S @ dr/dX
+            values = [self.stoichiometric_sum(terms, values) for terms in self.jac_rate_terms]
+        values = jnp.array(values, dtype=X.dtype)
+        return jnp.zeros(self.jac_pattern.shape, X.dtype).at[rows, cols].set(values)
+
+    def tolerance_numerical(self, X, *params):
+        """Solution will terminate if the relative change in this quantity is < tol"""
+        return jnp.array(self.tolerance_func(*self.lambda_inputs(X, params)))
+
+    def numerical_inputs(self, knowns, guesses):
+        """Assembles the arrays of initial guesses and parameters to pass to the numerical solver"""
+        num_params = np.array([len(np.array(guesses[g])) for g in guesses] + [len(np.array(knowns[k])) for k in knowns])
+        if not np.all(num_params == num_params[0]):
+            raise ValueError("Input parameters and initial guesses must all have the same shape.")
+        num_params = num_params[0]
+
+        values = knowns | {k: np.repeat(v, num_params) for k, v in self.assumed_values.items()}
+        dtype = {"default": jnp.zeros(()).dtype, "float32": np.float32}.get(self.precision, np.float64)
+        guessvals = np.array([guesses[g] for g in self.unknown_names], dtype=dtype).T
+        paramvals = np.array([values[k] for k in self.param_names], dtype=dtype).T
+        return guessvals, paramvals
+
+    def __call__(self, knowns, guesses, symbolic_keys=False, return_status=False):
+        """
+        Solves the system for a new set of numerical values of the known quantities.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, with the same names as those the solver was compiled for
+        guesses: dict
+            Dict of unknown quantity names and their initial guesses, with the same names as those the solver was
+            compiled for
+        symbolic_keys: bool, optional
+            Whether to return the solution keyed by sympy symbols instead of strings
+        return_status: bool, optional
+            Whether to also return the status of each cell
+
+        Returns
+        -------
+        soldict: dict
+            Dict of solved quantities, including those eliminated from the system by conservation laws
+        status: numpy.ndarray
+            If return_status=True, the array of status codes of the cells: STATUS_CONVERGED, STATUS_MAX_ITER,
+            STATUS_NONFINITE or STATUS_STALLED
+        """
+        guessvals, paramvals = self.numerical_inputs(knowns, guesses)
+        sol, num_iter, stats = self.solve_arrays(guessvals, paramvals)
+        if len(num_iter):
+            self.printv(f"num_iter average={num_iter.mean()} min={num_iter.min()} max={num_iter.max()}")
+            self.printv(
+                f"Jacobian evaluations average={stats['num_jac'].mean()} "
+                f"factorizations average={stats['num_factor'].mean()}"
+            )
+        self.printv(f"{np.sum(stats['status'] != STATUS_CONVERGED)} not converged")
+        soldict = self.package_solution(sol, paramvals, symbolic_keys)
+        return (soldict, stats["status"]) if return_status else soldict
+
+    def sensitivities(self, knowns, guesses, symbolic_keys=False):
+        """
+        Solves the system like __call__, and also returns the derivatives of the solved quantities with respect to each
+        known quantity (and any assumed values), by implicit differentiation of the Newton solve.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, with the same names as those the solver was compiled for
+        guesses: dict
+            Dict of unknown quantity names and their initial guesses, with the same names as those the solver was
+            compiled for
+        symbolic_keys: bool, optional
+            Whether to return the solution keyed by sympy symbols instead of strings
+
+        Returns
+        -------
+        soldict: dict
+            Dict of solved quantities, as returned by __call__
+        sensitivities: dict
+            Dict whose entry [unknown][known] is the array of derivatives of that unknown with respect to that known
+            quantity, for each unknown the solver was compiled for
+        """
+        guessvals, paramvals = self.numerical_inputs(knowns, guesses)
+        with self.precision_context():
+            sol, dsol = jax.tree.map(np.asarray, self.rootsolve_sensitivities(guessvals, paramvals))
+        sensitivities = {
+            u: {k: dsol[:, i, j] for j, k in enumerate(self.param_names)} for i, u in enumerate(self.unknown_names)
+        }
+        return self.package_solution(sol, paramvals, symbolic_keys), sensitivities
+
+    def race(self, knowns, guesses, symbolic_keys=False, return_status=False):
+        """
+        Solves the system from several alternative guesses for each input at once, keeping for each input the solution
+        with the smallest residual. The alternatives are solved together as a single batch, so this
+        costs about as much as solving them one after the other, but takes one pass instead of re-solving failures.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, with the same names as those the solver was compiled for
+        guesses: list
+            List of K dicts of alternative guesses for the unknowns, e.g. from EquationSystem.racing_guesses
+        symbolic_keys: bool, optional
+            Whether to return the solution keyed by sympy symbols instead of strings
+        return_status: bool, optional
+            Whether to also return the status of each cell, that of the alternative kept
+
+        Returns
+        -------
+        soldict: dict
+            Dict of solved quantities, as returned by __call__
+        status: numpy.ndarray
+            If return_status=True, the array of status codes of the cells, as returned by __call__
+        """
+        if self.method in ("ptc", "bisection"):
+            raise ValueError(f"Racing guesses needs a Newton method, not {self.method}.")
+        inputs = [self.numerical_inputs(knowns, g) for g in guesses]
+        guessvals, paramvals = np.stack([g for g, _ in inputs]), inputs[0][1]
+        sol, num_iter, stats = self.race_arrays(guessvals, paramvals)
+        if len(num_iter):
+            self.printv(f"num_iter average={num_iter.mean()} min={num_iter.min()} max={num_iter.max()}")
+        soldict = self.package_solution(sol, paramvals, symbolic_keys)
+        return (soldict, stats["status"]) if return_status else soldict
+
+    def race_arrays(self, guessvals, paramvals):
+        """
+        Solves a stack of alternative arrays of guesses for the same parameters as a single batch, returning the same
+        as solve_arrays for the alternative with the smallest residual for each input, with the iterations counted over
+        all alternatives. The residual rather than the iteration count decides, since the Newton iteration can stall
+        on a spurious fixed point, or fail to meet its tolerance on the step at round-off level.
+
+        Parameters
+        ----------
+        guessvals: array_like
+            Shape (K, N, n) array of K alternative initial guesses for the unknowns
+        paramvals: array_like
+            Shape (N, n_p) array of parameter values
+        """
+        guessvals, paramvals = np.asarray(guessvals), np.asarray(paramvals)
+        K, N = guessvals.shape[:2]
+        params = np.tile(paramvals, (K, 1))
+        sol, num_iter, stats = jax.tree.map(np.asarray, self.solve_arrays(guessvals.reshape(K * N, -1), params))
+        with self.precision_context():
+            F0, F = (
+                np.abs(np.asarray(self.residual_batch(X.reshape(K * N, -1), params.astype(X.dtype)))).reshape(K, N, -1)
+                for X in (guessvals, sol)
+            )
+        # compare the residuals of each equation relative to the largest among the guesses, which puts equations in
+        # different units on the same footing
+        scale = np.max(np.where(np.isfinite(F0), F0, 0), axis=0)
+        residual = np.max(F / np.where(scale > 0, scale, 1), axis=2)
+        finite = np.all(np.isfinite(sol.reshape(K, N, -1)), axis=2) & np.isfinite(residual)
+        best = np.argmin(np.where(finite, residual, np.inf), axis=0)
+        self.printv(f"Racing {K} guesses: won by {np.bincount(best, minlength=K)}; {(~finite.any(0)).sum()} non-finite")
+        total = lambda a: a.reshape(K, N).sum(0)
+        stats = {k: total(v) for k, v in stats.items() if k != "status"} | {
+            "status": stats["status"].reshape(K, N)[best, np.arange(N)]
+        }
+        return sol.reshape(K, N, -1)[best, np.arange(N)], total(num_iter), stats
+
+    def continuation(
+        self,
+        knowns,
+        guesses,
+        parameter="T",
+        reverse=False,
+        max_iter=20,
+        max_halvings=6,
+        symbolic_keys=False,
+        return_status=False,
+    ):
+        """
+        Solves the system over a grid of values of the known quantities by natural-parameter continuation: the grid is
+        swept along one known quantity with the others fixed, seeding each point with the converged solution at the
+        previous one and halving the step where that fails, so only the first point on each line is solved from the
+        given guesses. See numerics.continuation_sweep.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, with the same names as those the solver was compiled for
+        guesses: dict
+            Dict of unknown quantity names and their initial guesses, with the same names as those the solver was
+            compiled for
+        parameter: str, optional
+            Name of the known quantity to continue in, which must be positive (default: "T")
+        reverse: bool, optional
+            Whether to sweep from the largest to the smallest value of the parameter, e.g. to start from the
+            fully-ionized state at high temperature (default: False)
+        max_iter: int, optional
+            Number of iterations after which a continuation step is considered to have failed and is halved
+            (default: 20)
+        max_halvings: int, optional
+            Maximum number of times a step can be halved before a point is solved from its guess instead (default: 6)
+        symbolic_keys: bool, optional
+            Whether to return the solution keyed by sympy symbols instead of strings
+        return_status: bool, optional
+            Whether to also return the status of each cell
+
+        Returns
+        -------
+        soldict: dict
+            Dict of solved quantities, as returned by __call__
+        status: numpy.ndarray
+            If return_status=True, the array of status codes of the cells, as returned by __call__
+        """
+        if parameter not in self.param_names:
+            raise ValueError(f"Cannot continue in {parameter}: not one of the known quantities {self.param_names}")
+        guessvals, paramvals = self.numerical_inputs(knowns, guesses)
+        with self.precision_context():
+            sol, num_iter, converged = continuation_sweep(
+                lambda X, p, mask: self.continuation_step(X, p, mask, max_iter),
+                guessvals,
+                paramvals,
+                self.param_names.index(parameter),
+                max_iter=max_iter,
+                cold_solve=lambda X, p, mask: self.solve_batch(X, p, mask),
+                reverse=reverse,
+                max_halvings=max_halvings,
+            )
+        self.printv(f"num_iter average={num_iter.mean()} max={num_iter.max()}; {(~converged).sum()} not converged")
+        soldict = self.package_solution(sol, paramvals, symbolic_keys)
+        if return_status:
+            with self.precision_context():
+                return soldict, self.solve_status(sol, num_iter, guessvals, paramvals, converged)
+        return soldict
+
+    def solve_arrays(self, guessvals, paramvals):
+        """
+        Runs the jitted solver on arrays of guesses and parameters, applying chunking, padding to bucket sizes, or
+        compaction, and the precision policy, as specified in the solver options.
+
+        Parameters
+        ----------
+        guessvals: array_like
+            Shape (N, n) array of initial guesses for the unknowns
+        paramvals: array_like
+            Shape (N, n_p) array of parameter values
+
+        Returns
+        -------
+        sol: array_like
+            Shape (N, n) array of solutions
+        num_iter: array_like
+            Shape (N,) array of the number of iterations taken
+        stats: dict
+            Shape (N,) arrays of the number of Jacobian evaluations "num_jac" and factorizations "num_factor", and of
+            the status code of each cell "status"
+        """
+        # results are returned as numpy arrays, since JAX arrays of a precision other than the default cannot be
+        # used outside of the precision context
+        with self.precision_context():
+            sol, num_iter, stats = jax.tree.map(np.asarray, self.iterate_arrays(guessvals, paramvals))
+            stats["status"] = self.solve_status(sol, num_iter, guessvals, paramvals, stats.pop("converged", None))
+            if self.resolve_failed:
+                sol, num_iter, stats = self.resolve_arrays(sol, num_iter, stats, guessvals, paramvals)
+        if self.precision == "mixed":
+            with jax.enable_x64(True):
+                sol = self.refine_arrays(sol.astype(np.float64), np.asarray(paramvals, np.float64))
+        return sol, num_iter, stats
+
+    def solve_status(self, sol, num_iter, guessvals, paramvals, converged=None):
+        """Returns the array of status codes of solutions taking num_iter iterations from guessvals, which converged
+        within the Newton iteration limit unless the solver reports whether they converged. Solutions at which the
+        residual is not finite are failures too, e.g. those clipped to a temperature at which the rates underflow, as
+        are those at which the residual of any equation is larger than at the guess and a further Newton step would
+        still be outside the tolerance, where the iteration has stalled on a spurious fixed point, e.g. with abundances
+        clipped to the floor. Solutions within the tolerance are never stalled, whatever their residual, since that
+        of a guess close to the solution, e.g. a warm start, is only round-off noise."""
+        converged = np.asarray(num_iter) < NEWTON_MAX_ITER if converged is None else np.asarray(converged)
+        status = np.where(converged, STATUS_CONVERGED, STATUS_MAX_ITER)
+        paramvals = np.asarray(paramvals, sol.dtype)
+        F0, F = (np.abs(np.asarray(self.residual_batch(np.asarray(X, sol.dtype), paramvals))) for X in (guessvals, sol))
+        stalled = np.any(F > F0, axis=1)
+        if np.any(stalled):
+            stalled[stalled] = ~np.asarray(self.newton_step_converged(sol[stalled], paramvals[stalled]))
+        status = np.where(stalled, STATUS_STALLED, status)
+        finite = np.all(np.isfinite(sol), axis=1) & np.all(np.isfinite(F), axis=1)
+        return np.where(finite, status, STATUS_NONFINITE)
+
+    def resolve_arrays(self, sol, num_iter, stats, guessvals, paramvals):
+        """Re-solves the cells of a solution that failed from their original guesses with each set of options in
+        RESOLVE_ESCALATION in turn, until they converge, returning the same as solve_arrays"""
+        sol, num_iter, stats = np.array(sol), np.array(num_iter), {k: np.array(v) for k, v in stats.items()}
+        guessvals, paramvals = np.asarray(guessvals), np.asarray(paramvals)
+        for options in RESOLVE_ESCALATION:
+            failed = np.flatnonzero(stats["status"] != STATUS_CONVERGED)
+            if not len(failed):
+                break
+            if options.get("method") == "ptc":
+                if self.ptc_system is None:
+                    continue
+                if self.pseudo_transient is None:
+                    self.printv("Building the pseudo-transient solver")
+                    self.pseudo_transient = self.pseudo_transient_solver(self.ptc_system)
+                X, n, result = self.pseudo_transient_arrays(guessvals[failed], paramvals[failed])
+                status = self.solve_status(X, n, guessvals[failed], paramvals[failed], result["converged"])
+            else:
+                X, n = self.escalation_solve(options, guessvals[failed], paramvals[failed])
+                status = self.solve_status(X, n, guessvals[failed], paramvals[failed])
+            converged = status == STATUS_CONVERGED
+            self.printv(f"Re-solving {len(failed)} failed cells with {options}: {converged.sum()} converged")
+            sol[failed[converged]], stats["status"][failed[converged]] = X[converged], STATUS_CONVERGED
+            for counts in (num_iter, stats["num_jac"], stats["num_factor"]):
+                counts[failed] += n
+        return sol, num_iter, stats
+
+    def escalation_solve(self, options, guessvals, paramvals):
+        """Solves arrays of guesses and parameters with the Newton options overridden by options, padded to a power of
+        2 so that the jitted solve is only traced for a few batch sizes, returning the solutions and iteration counts"""
+        key = repr(sorted(options.items()))
+        if key not in self.escalation_solves:
+
+            def solve(guesses, params, mask):
+                return newton_rootsolve(
+                    self.f_numerical,
+                    guesses,
+                    params,
+                    return_num_iter=True,
+                    mask=mask,
+                    mesh=self.mesh,
+                    **(self.newton_options | options),
+                )
+
+            self.escalation_solves[key] = jax.jit(solve)
+        N = len(guessvals)
+        size = bucket_size(N)
+        solve = self.escalation_solves[key]
+        X, n = solve(pad_batch(guessvals, size), pad_batch(paramvals, size), padding_mask(N, size))
+        return np.asarray(X)[:N], np.asarray(n)[:N]
+
+    def iterate_arrays(self, guessvals, paramvals):
+        """Runs the Newton iteration on arrays of guesses and parameters, returning the same as solve_arrays"""
+        N = len(guessvals)
+        if N == 0:  # nothing to solve, but the outputs still have the shapes and dtypes of those of the solve
+            outputs = jax.eval_shape(self.rootsolve, guessvals, paramvals, padding_mask(0, 0))
+            return jax.tree.map(lambda a: np.empty(a.shape, a.dtype), outputs)
+        if self.method == "ptc":
+            return self.pseudo_transient_arrays(guessvals, paramvals)
+        if self.method == "bisection":
+            return self.bisection_arrays(guessvals, paramvals)
+        if self.chunk_size:
+            return stream_batches(self.solve_batch, (guessvals, paramvals), self.chunk_length(N))
+        if not self.buckets or self.iters_per_round:
+            return self.solve_batch(guessvals, paramvals, padding_mask(N, N))
+
+        results = []
+        for start, stop, size in bucketed_batches(N, self.buckets):
+            result = self.solve_batch(
+                pad_batch(guessvals[start:stop], size),
+                pad_batch(paramvals[start:stop], size),
+                padding_mask(stop - start, size),
+            )
+            results.append(jax.tree.map(lambda a: a[: stop - start], result))
+        return jax.tree.map(lambda *a: jnp.concatenate(a), *results)
+
+    def chunk_length(self, N):
+        """Returns the number of entries per chunk when solving a batch of N in chunks, resolving chunk_size="auto" from
+        the memory use of the compiled solve without overwriting the option, so that it is re-tuned wherever the solver
+        is loaded"""
+        chunk_size = self.chunk_size or N
+        if chunk_size == "auto":
+            with self.precision_context():
+                inputs = np.zeros((1, len(self.unknown_symbols))), np.zeros((1, len(self.param_symbols)))
+                chunk_size = auto_chunk_size(self.rootsolve, inputs, self.memory_budget)
+            self.printv(f"Solving in chunks of {chunk_size}")
+        return max(min(chunk_size, N), 1)
+
+    def pseudo_transient_arrays(self, guessvals, paramvals):
+        """Solves arrays of guesses and parameters by pseudo-transient continuation, returning the same as solve_arrays.
+        See numerics.pseudo_transient_continuation."""
+        ptc = self.pseudo_transient
+        guessvals, paramvals = np.asarray(guessvals), np.asarray(paramvals)
+        columns = [ptc.unknown_names.index(s) for s in self.unknown_names]
+        previous = {f"{s[2:] if s.startswith('x_') else s}_0": i for i, s in enumerate(self.unknown_names)}
+
+        def step_inputs(X, dtau):
+            """Assembles the guesses and parameters of the pseudo-time step of size dtau from the state X"""
+            X_step = np.zeros((len(X), len(ptc.unknown_names)), X.dtype)
+            X_step[:, columns] = X
+            params = np.ones((len(X), len(ptc.param_names)), X.dtype)
+            for j, name in enumerate(ptc.param_names):
+                if name in self.param_names:
+                    params[:, j] = paramvals[:, self.param_names.index(name)]
+                elif name in previous:
+                    params[:, j] = X[:, previous[name]]
+                elif name == "Δt":
+                    params[:, j] = dtau
+            if "u_0" in ptc.param_names:  # the residual of the equation u = u(T, x) at u=0 is the internal energy
+                u = ptc.unknown_names.index("u")
+                X_step[:, u] = 0
+                X_step[:, u] = np.asarray(ptc.residual_batch(X_step, params))[:, ptc.equation_keys.index("u")]
+                params[:, ptc.param_names.index("u_0")] = X_step[:, u]
+            return X_step, params
+
+        def step(X, params, dtau, mask):
+            with ptc.precision_context():
+                X_step, step_params = step_inputs(X.astype(np.float64), dtau)
+                X_new, num_iter = ptc.continuation_step(X_step, step_params, mask, PTC_MAX_ITER)
+                return np.asarray(X_new)[:, columns].astype(X.dtype), np.asarray(num_iter)
+
+        # start from the pseudo-time step on which the fastest-changing abundance changes by order unity
+        F = np.abs(np.asarray(self.residual_batch(guessvals, paramvals)))
+        n_Htot = paramvals[:, self.param_names.index("n_Htot")] if "n_Htot" in self.param_names else np.ones(len(F))
+        keys = self.equation_keys
+        own = {j: i for j, s in enumerate(self.unknown_symbols) for i, k in enumerate(keys) if matches(k, s)}
+        cols, rows = list(own), list(own.values())  # the abundances and their rate equations
+        with np.errstate(divide="ignore", invalid="ignore"):
+            timescales = np.where(F[:, rows] > 0, n_Htot[:, None] * np.abs(guessvals[:, cols]) / F[:, rows], np.inf)
+        dtau = np.min(timescales, axis=1, initial=np.inf)
+        dtau = np.where(np.isfinite(dtau) & (dtau > 0), dtau, 1)
+
+        sol, num_iter, converged = pseudo_transient_continuation(
+            step,
+            lambda X, params, mask: step(X, params, np.full(len(X), np.inf), mask),  # a step of infinite size is Newton
+            self.residual_batch,
+            guessvals,
+            paramvals,
+            dtau,
+            max_steps=PTC_MAX_STEPS,
+            max_iter=PTC_MAX_ITER,
+            solve_max_iter=PTC_SOLVE_MAX_ITER,
+        )
+        self.printv(f"Pseudo-transient continuation: {(~converged).sum()} not converged")
+        return sol, num_iter, {"num_jac": num_iter, "num_factor": num_iter, "converged": converged}
+
+    def bisection_arrays(self, guessvals, paramvals):
+        """Solves arrays of guesses and parameters for thermal equilibrium by a bracketed search in log T, solving the
+        chemistry at each temperature, returning the same as solve_arrays. See numerics.bracketed_newton."""
+        chem = self.chemistry
+        guessvals, paramvals = np.asarray(guessvals), np.asarray(paramvals)
+        T = self.unknown_names.index("T")
+        columns = [self.unknown_names.index(s) for s in chem.unknown_names]
+        sources = [(self.param_names + ["T"]).index(s) for s in chem.param_names]
+        X = guessvals.copy()
+        warm = np.zeros(len(X), dtype=bool)  # whether the chemistry has been solved at a previous temperature
+
+        def run(solver, X_chem, params, mask, limit):
+            """Solves the chemistry for a batch, returning the solutions, iteration counts and whether each converged"""
+            sol, n = (np.asarray(a) for a in solver(X_chem, params, mask)[:2])
+            return sol, n, (n < limit) & np.all(np.isfinite(sol), axis=1)
+
+        def evaluate(logT, mask):
+            X[:, T] = np.exp(logT)
+            params = np.c_[paramvals, X[:, T]][:, sources].astype(X.dtype)
+            # warm-start the chemistry from its solution at the previous temperature, falling back to the guesses
+            warm_solve = lambda *args: chem.continuation_step(*args, BISECTION_CHEMISTRY_MAX_ITER)
+            sol, n, ok = run(warm_solve, X[:, columns], params, mask & warm, BISECTION_CHEMISTRY_MAX_ITER)
+            cold = mask & ~(warm & ok)
+            if cold.any():
+                sol_cold, n_cold, ok_cold = run(chem.solve_batch, guessvals[:, columns], params, cold, np.inf)
+                # solves stuck at a spurious fixed point give a heating rate of arbitrary sign, which would mislead the
+                # bracketing, unlike those only held up by trace abundances
+                ok_cold &= chem.solve_status(sol_cold, n_cold, guessvals[:, columns], params) != STATUS_STALLED
+                sol, n = np.where(cold[:, None], sol_cold, sol), n + np.where(cold, n_cold, 0)
+                ok = np.where(cold, ok_cold, ok)
+            X[:, columns] = np.where((mask & ok)[:, None], sol, X[:, columns])
+            warm[mask] = ok[mask]
+            heat, step = (np.asarray(a) for a in self.heat_newton_step(X, paramvals.astype(X.dtype)))
+            return np.where(ok, heat, np.nan), step, n
+
+        logT, num_iter, converged = bracketed_newton(
+            evaluate,
+            np.log(guessvals[:, T]),
+            np.full(len(X), np.log(BISECTION_T_MIN)),
+            np.full(len(X), np.log(BISECTION_T_MAX)),
+            self.tol,
+        )
+        X[:, T] = np.exp(logT)
+        self.printv(f"Bisection: {(~converged).sum()} not converged")
+        return X, num_iter, {"num_jac": num_iter, "num_factor": num_iter, "converged": converged}
+
+    def refine_arrays(self, sol, paramvals):
+        """Refines an array of solutions to tol with plain Newton steps, in chunks if chunk_size is set"""
+        options = self.newton_options | dict(careful_steps=1, method="newton", line_search=False, log_variables=False)
+        chunk_size = self.chunk_length(len(sol))
+        for start in range(0, len(sol), chunk_size):
+            sol[start : start + chunk_size] = compacting_rootsolve(
+                self.f_numerical,
+                sol[start : start + chunk_size],
+                paramvals[start : start + chunk_size],
+                iters_per_round=self.refine_steps,
+                buckets=self.buckets or "pow2",
+                **options,
+            )
+        return sol
+
+    def solve_batch(self, guessvals, paramvals, mask):
+        """Solves a single batch of inputs, excluding the entries where mask is False"""
+        if self.iters_per_round:
+            return compacting_rootsolve(
+                self.f_numerical,
+                guessvals,
+                paramvals,
+                return_num_iter=True,
+                return_stats=True,
+                iters_per_round=self.iters_per_round,
+                buckets=self.buckets or "pow2",
+                mask=mask,
+                **self.newton_options,
+            )
+        return self.rootsolve(guessvals, paramvals, mask)
+
+    def package_solution(self, sol, paramvals, symbolic_keys=False):
+        """Takes the output of newton_rootsolve and packages it into a dict containing the system solution for all
+        variables, including substitutions for eliminated variables.
+        """
+        soldict = {s: sol[:, i] for i, s in enumerate(self.unknown_symbols)}
+        # do a reverse-pass on the substitutions we made to get all quantities
+        values_to_subs = soldict | {s: paramvals[:, i] for i, s in enumerate(self.param_symbols)}
+        for expr, args, func in self.substitution_funcs:
+            soldict[expr] = values_to_subs[expr] = func(*[values_to_subs[s] for s in args])
+
+        if symbolic_keys:
+            return soldict
+        soldict = {str(k): v for k, v in soldict.items()}
+        # if we specified abundances with x_ notation, return same
+        if np.any(["x_" in k for k in self.unknowns]):
+            return soldict
+        # otherwise return with input format where keys are simple species strings
+        return {k.replace("x_", ""): v for k, v in soldict.items()}
@@ -4,18 +4,18 @@ import sympy as sp
 from .species_strings import species_mass, species_charge, species_counts, total_atom_abundance
 from .symbols import d_dt, dt, n_, x_, t, BDF, n_Htot, sanitize_symbols
 from .eos import EOS
-from .data import SolarAbundances
 from .data.atoms import atoms
-from jax import numpy as jnp
 
 # import jax
 from importlib.metadata import version
 
 # jax.config.update("jax_enable_x64", True)
 import numpy as np
-from .numerics import newton_rootsolve
 from astropy import units
 from .equation import Equation
+from .compiled_solver import CompiledSolver
+from .initial_guess import LinearizedGuess, LIMITING_STATES
+from .cache import cached_compile, cache_dir_default
 from sympy.codegen.ast import Assignment, Comment
 
 
@@ -28,6 +28,16 @@ class EquationSystem(dict):
             new[k] = self[k]
         return new
 
+    @staticmethod
+    def equation_symbols(equation):
+        """Returns the set of symbols in an equation, including the name of the quantity whose time derivative is on
+        the LHS, and leaving out time"""
+        symbols = set(equation.free_symbols)
+        if equation.lhs.atoms(sp.Function):  # yoink the n_ out of the LHS
+            symbols.add(str(equation.lhs.atoms(sp.Function)).replace("(t)", "").replace("{", "").replace("}", ""))
+        symbols.discard(t)
+        return symbols
+
     def __getitem__(self, __key: str):
         """Dict getitem method where we initialize a differential equation for the conservation of a species if the key
         does not exist"""
@@ -36,6 +46,52 @@ class EquationSystem(dict):
             # need to make sure that d/dt's don't add up when composing equations
         return super().__getitem__(__key)
 
+    def __setitem__(self, __key, __value):
+        """Dict setitem method that also invalidates the solvers compiled for the system and updates the symbol index"""
+        self.compiled_solvers.clear()
+        if __key in self:
+            self.unindex_symbols(__key)
+        super().__setitem__(__key, __value)
+        self.index_symbols(__key)
+
+    def __delitem__(self, __key):
+        """Dict delitem method that also invalidates the solvers compiled for the system and updates the symbol index"""
+        self.compiled_solvers.clear()
+        self.unindex_symbols(__key)
+        super().__delitem__(__key)
+
+    @property
+    def symbol_index(self):
+        """Dict mapping each symbol in the system to the set of keys of the equations it appears in, kept up to date
+        as equations are set and deleted"""
+        if "_symbol_index" not in self.__dict__:  # also when unpickling, which sets the items before the attributes
+            self._symbol_index, self._equation_symbols, self._chemical_species = {}, {}, None
+        return self._symbol_index
+
+    def index_symbols(self, key):
+        """Adds the symbols of the equation of a key to the symbol index"""
+        index = self.symbol_index
+        self._equation_symbols[key] = symbols = self.equation_symbols(super().__getitem__(key))
+        for s in symbols:
+            if s not in index:
+                index[s] = set()
+                self._chemical_species = None
+            index[s].add(key)
+
+    def unindex_symbols(self, key):
+        """Removes the symbols of the equation of a key from the symbol index"""
+        index = self.symbol_index
+        for s in self._equation_symbols.pop(key, ()):
+            index[s].discard(key)
+            if not index[s]:
+                del index[s]
+                self._chemical_species = None
+
+    def equations_with(self, symbol):
+        """Returns the set of keys of the equations in which a symbol (or the name of a time-differentiated quantity)
+        appears"""
+        return set(self.symbol_index.get(symbol, ()))
+
     def __add__(self, other):
         """Return a dict whose values are the sum of the values of the operands"""
         keys = self.keys() | other.keys()
@@ -44,34 +100,163 @@ class EquationSystem(dict):
             new[k] = self[k] + other[k]
         return new
 
+    @classmethod
+    def compose(cls, systems):
+        """
+        Returns the system whose equations are the sums of those of a number of systems, as obtained by adding them
+        up with +, but in time linear in the total number of terms: the RHS of each equation is built with a single
+        sympy Add of the terms from all of the systems, instead of re-adding the partial sums pairwise.
+
+        Parameters
+        ----------
+        systems: iterable
+            EquationSystems to sum
+
+        Returns
+        -------
+        system: EquationSystem
+            The summed system
+        """
+        lhs, terms = {}, {}
+        for system in systems:
+            for k, e in system.items():
+                if k not in lhs:
+                    lhs[k], terms[k] = e.lhs, []
+                elif e.lhs != lhs[k]:
+                    raise ValueError(
+                        "Tried to sum incompatible equations. Equation summation only defined for differential equations with the same LHS."
+                    )
+                terms[k].append(e.rhs)
+        new = cls()
+        for k in lhs:  # not evaluated, since deciding whether the sides are equal is most of the cost of construction
+            new[k] = Equation(lhs[k], sp.Add(*terms[k]), evaluate=False)
+        return new
+
     @property
     def symbols(self):
         """Returns the set of all symbols in the equations"""
-        all = set()
-        for e in self.values():
-            all.update(e.free_symbols)
-            if e.lhs.atoms(sp.Function):  # yoink the n_ out of the LHS
-                all.update([str(e.lhs.atoms(sp.Function)).replace("(t)", "").replace("{", "").replace("}", "")])
-        if t in all:  # leave time out
-            all.remove(t)
-        return all
+        return set(self.symbol_index)
 
     @property
     def jacobian(self):
         """Returns a dict of dicts representing the Jacobian of the RHS of the system. Keys are the names of the
         conserved quantities and subkeys are the variable of differentiation.
         """
-        return {k: {s: sp.diff(e.rhs, s) for s in self.symbols} for k, e in self.items()}
+        symbols = self.symbols
+        return {
+            k: {s: sp.diff(e.rhs, s) if s in e.rhs.free_symbols else sp.S.Zero for s in symbols}
+            for k, e in self.items()
+        }
+
+    def sparsity_pattern(self, variables, keys=None):
+        """
+        Returns the structural sparsity pattern of the Jacobian of the RHS of the system with respect to a set of
+        variables, i.e. which equations depend on which variables at all.
+
+        Parameters
+        ----------
+        variables: list
+            Symbols (or their names) to differentiate with respect to, in the order of the columns
+        keys: list, optional
+            Keys of the equations in the order of the rows (default: all equations, in the order of rhs)
+
+        Returns
+        -------
+        pattern: numpy.ndarray
+            Shape (len(keys), len(variables)) boolean array that is True where the equation depends on the variable
+        """
+        rhs = self.rhs
+        keys = list(rhs) if keys is None else keys
+        variables = [sp.Symbol(v) if isinstance(v, str) else v for v in variables]
+        dependencies = {k: self.dependencies(rhs[k]) for k in keys}
+        return np.array([[v in dependencies[k] for v in variables] for k in keys], dtype=bool)
+
+    def stoichiometry(self, keys=None):
+        """
+        Factors the RHS of the system as S @ r: a vector r of the distinct rate terms found in the equations, and an
+        integer stoichiometry matrix S, so that a rate shared by several equations (e.g. that of a reaction, which
+        enters the equation of each species taking part in it with its stoichiometric coefficient) appears only once.
+
+        Parameters
+        ----------
+        keys: list, optional
+            Keys of the equations in the order of the rows (default: all equations, in the order of rhs)
+
+        Returns
+        -------
+        rates: list
+            Distinct rate terms, in the order of the columns
+        S: numpy.ndarray
+            Shape (len(keys), len(rates)) integer array of the coefficient of each rate in each equation
+        """
+        rhs = self.rhs
+        keys = list(rhs) if keys is None else keys
+        columns, entries = {}, []
+        for i, k in enumerate(keys):
+            for term in sp.Add.make_args(rhs[k]):
+                coeff, rate = term.as_coeff_Mul(rational=True)
+                if not coeff.is_Integer:  # keep fractional factors in the rate
+                    coeff, rate = sp.sign(coeff), abs(coeff) * rate
+                if rate.could_extract_minus_sign():  # so that a rate entering with either sign is the same rate
+                    coeff, rate = -coeff, -rate
+                entries.append((i, columns.setdefault(rate, len(columns)), int(coeff)))
+        S = np.zeros((len(keys), len(columns)), dtype=int)
+        for i, j, coeff in entries:
+            S[i, j] += coeff
+        return list(columns), S
+
+    def dependencies(self, expr):
+        """Returns the set of symbols that an expression depends on, through any auxiliary variables it contains"""
+        auxiliary = getattr(self, "auxiliary", {})
+        symbols = expr.free_symbols
+        return symbols.difference(auxiliary).union(*(auxiliary[a].free_symbols for a in symbols if a in auxiliary))
+
+    def total_derivative(self, expr, symbol):
+        """Returns the derivative of an expression with respect to a symbol, including the dependence through any
+        auxiliary variables it contains by the chain rule, leaving the auxiliary variables in the result"""
+        auxiliary = getattr(self, "auxiliary", {})
+        derivative = sp.diff(expr, symbol)
+        for a in expr.free_symbols:
+            if a in auxiliary and symbol in auxiliary[a].free_symbols:
+                derivative += sp.diff(expr, a) * sp.diff(auxiliary[a], symbol)
+        return derivative
 
     def subs(self, expr, replacement):
-        """Substitute symbolic expressions throughout the whole network."""
-        for k, e in self.items():
-            self[k] = e.subs(expr, replacement)
+        """Substitute symbolic expressions throughout the whole network. Only the equations that contain expr are
+        touched if it is a symbol."""
+        keys = self.equations_with(expr) if isinstance(expr, sp.Symbol) else list(self)
+        for k in keys:
+            self[k] = super().__getitem__(k).subs(expr, replacement)
 
-    def reduced(self, knowns, time_dependent=[]):
+    def substitute(self, substitutions):
+        """
+        Applies a sequence of substitutions throughout the whole network, with the same result as calling subs for
+        each in turn, but in a single traversal of each equation that contains any of the substituted symbols: the
+        sequence is first resolved into a simultaneous mapping, by making each replacement in the later replacements,
+        which is then applied with xreplace.
+
+        Parameters
+        ----------
+        substitutions: list
+            List of (symbol, replacement) pairs, applied in order. Being applied with xreplace, these must be symbols
+            or exact subexpressions, rather than patterns to match algebraically as with subs.
+        """
+        mapping = {}
+        for expr, replacement in reversed(substitutions):
+            mapping[expr] = replacement.xreplace(mapping) if isinstance(replacement, sp.Basic) else replacement
+        if all(isinstance(expr, sp.Symbol) for expr in mapping):
+            keys = set().union(*(self.equations_with(expr) for expr in mapping))
+        else:
+            keys = list(self)
+        for k in keys:
+            e = super().__getitem__(k)
+            # not evaluated, since deciding whether the sides are equal is most of the cost of construction
+            self[k] = Equation(e.lhs.xreplace(mapping), e.rhs.xreplace(mapping), evaluate=False)
+
+    def reduced(self, knowns, time_dependent=[], auxiliary=False):
         subsystem = self.copy()
         subsystem.set_time_dependence(time_dependent)
-        subsystem.do_conservation_reductions(time_dependent)
+        subsystem.do_conservation_reductions(time_dependent, auxiliary)
         if "T" in (str(k) for k in knowns) and "T" not in time_dependent:
             del subsystem["heat"]
         return subsystem
@@ -92,9 +277,22 @@ class EquationSystem(dict):
             if "u" not in self:
                 self["u"] = Equation(0, sp.Symbol("u") - self.eos.internal_energy)
 
-    def do_conservation_reductions(self, time_dependent_vars):
-        """Eliminate equations from the system using known conservation laws."""
-        self.substitutions = []
+    def do_conservation_reductions(self, time_dependent_vars, auxiliary=False):
+        """
+        Eliminate equations from the system using known conservation laws: the electron abundance by charge
+        neutrality, and the abundance of each atom by the conservation of its total abundance.
+
+        Parameters
+        ----------
+        time_dependent_vars: list
+            Names of the quantities whose time derivatives are retained, which are not eliminated
+        auxiliary: bool, optional
+            Whether to keep the eliminated abundances in the equations as auxiliary variables, whose definitions in
+            terms of the remaining abundances are stored in the dict self.auxiliary, instead of substituting them into
+            every equation. The definitions can then be evaluated once rather than once per occurrence, and the
+            equations stay the size of the original network. (default: False)
+        """
+        self.substitutions, self.auxiliary = [], {}
 
         # since we have n_Htot let's convert all other n's to x's
         for s in self.symbols:
@@ -134,8 +332,14 @@ class EquationSystem(dict):
             self.substitutions.append((x_(i), xtot - x_total))
             del self[i]
 
-        for expr, sub in self.substitutions:
-            self.subs(expr, sub)
+        if not auxiliary:
+            self.substitute(self.substitutions)
+            return
+        renames = [(s, sub) for s, sub in self.substitutions if str(s).startswith("n_")]
+        self.substitute(renames)
+        for s, sub in reversed(self.substitutions):  # each elimination is made in the ones before it
+            if not str(s).startswith("n_"):
+                self.auxiliary[s] = sp.sympify(sub).xreplace(self.auxiliary)
 
     @property
     def rhs(self):
@@ -153,27 +357,148 @@ class EquationSystem(dict):
 
     @property
     def chemical_species(self):
-        """Returns a tuple of all chemical species detected within the network"""
-        # strategy: look for things with n_ or x_, but not photons
-        species = set()
-        for s in self.symbols:
-            if not ("x_" in str(s) or "n_" in str(s)):
-                continue
-            s = str(s).replace("x_", "").replace("n_", "")
-            if species_mass(s) != 0:
-                species.add(s)
-        return tuple(species)
+        """Returns a tuple of all chemical species detected within the network, which is cached until the set of
+        symbols changes"""
+        if self.__dict__.get("_chemical_species") is None:
+            # strategy: look for things with n_ or x_, but not photons
+            species = set()
+            for s in self.symbols:
+                if not ("x_" in str(s) or "n_" in str(s)):
+                    continue
+                s = str(s).replace("x_", "").replace("n_", "")
+                if species_mass(s) != 0:
+                    species.add(s)
+            self._chemical_species = tuple(species)
+        return self._chemical_species
+
+    def compile(
+        self,
+        knowns,
+        unknowns,
+        time_dependent=[],
+        tol=1e-3,
+        careful_steps=None,
+        verbose=False,
+        cache_dir=None,
+        **options,
+    ):
+        """
+        Returns a reusable, jitted numerical solver for the system with a fixed signature of known quantities,
+        unknowns, and time-dependent quantities. Solvers are cached, so repeated calls with the same signature return
+        the same object until the system is modified.
+
+        Parameters
+        ----------
+        knowns: iterable
+            Names of the quantities that will be specified numerically, e.g. "T", "n_Htot"
+        unknowns: iterable
+            Names of the quantities to solve for, e.g. "H+", "T"
+        time_dependent: list, optional
+            Names of the quantities whose time derivatives are retained
+        tol: float, optional
+            Desired relative error in chemical abundances (default: 1e-3)
+        careful_steps: int, optional
+            Number of careful initial steps in the Newton solve before full step size is used (default: 20, or 1 with
+            log_variables=True)
+        cache_dir: str, optional
+            Directory of the persistent on-disk cache of compiled solvers, which lets a fresh process skip the tracing
+            and XLA compilation of the Newton solve of a system that has been compiled before. The symbolic reduction
+            and lambdification are still redone, since no Python code is loaded from the cache. Defaults to the
+            JACO_CACHE_DIR environment variable if set; otherwise solvers are only cached in memory.
+        **options:
+            Further solver options passed to CompiledSolver, e.g. buckets
+
+        Returns
+        -------
+        solver: CompiledSolver
+            Callable solver taking dicts of numerical knowns and guesses and returning the solution dict
+        """
+        options = {"tol": tol, "careful_steps": careful_steps} | options
+        key = (frozenset(knowns), frozenset(unknowns), tuple(sorted(time_dependent)), repr(sorted(options.items())))
+        if key not in self.compiled_solvers:
+            cache_dir = cache_dir or cache_dir_default()
+            if cache_dir:
+                solver = cached_compile(self, cache_dir, knowns, unknowns, time_dependent, verbose=verbose, **options)
+            else:
+                solver = CompiledSolver(self, knowns, unknowns, time_dependent, verbose=verbose, **options)
+            self.compiled_solvers[key] = solver
+        solver = self.compiled_solvers[key]
+        solver.verbose = verbose
+        return solver
+
+    def initial_guesses(self, knowns, guesses={}, time_dependent=[]):
+        """
+        Returns guesses for all of the abundances solved for given a set of known quantities, by solving the subsystem
+        that is linear in the abundances at fixed electron abundance (see LinearizedGuess), vectorized over the inputs.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, e.g. "T", "n_Htot"
+        guesses: dict, optional
+            Dict of guesses for any other unknowns, e.g. T if it is solved for, which are kept as they are
+        time_dependent: list, optional
+            Names of the quantities whose time derivatives are retained
+
+        Returns
+        -------
+        guesses: dict
+            Dict of guesses for all of the unknowns, which can be passed to solve or to a CompiledSolver
+        """
+        return self.guess_generator(knowns, time_dependent)(knowns, guesses)
+
+    def racing_guesses(self, knowns, guesses={}, time_dependent=[]):
+        """
+        Returns a list of alternative guesses for all of the abundances solved for, to be raced against each other by
+        passing them together to solve: the guesses of initial_guesses, and those of the limiting states of the gas
+        in which every element is ionized, neutral, or molecular (if there are molecules). See
+        LinearizedGuess.limiting.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, e.g. "T", "n_Htot"
+        guesses: dict, optional
+            Dict of guesses for any other unknowns, e.g. T if it is solved for, which are kept as they are
+        time_dependent: list, optional
+            Names of the quantities whose time derivatives are retained
+
+        Returns
+        -------
+        guesses: list
+            List of dicts of guesses for all of the unknowns
+        """
+        generator = self.guess_generator(knowns, time_dependent)
+        states = [s for s in LIMITING_STATES if s != "molecular" or generator.has_molecules]
+        return [generator(knowns, guesses)] + [generator.limiting(knowns, guesses, state) for state in states]
+
+    def guess_generator(self, knowns, time_dependent=[]):
+        """Returns the LinearizedGuess for a set of known quantities, which is cached like the compiled solvers"""
+        key = ("guess", frozenset(knowns), tuple(sorted(time_dependent)))
+        if key not in self.compiled_solvers:
+            self.compiled_solvers[key] = LinearizedGuess(self, knowns, time_dependent)
+        return self.compiled_solvers[key]
+
+    @property
+    def compiled_solvers(self):
+        """Dict of solvers and guess generators compiled for this system, keyed by their signature"""
+        if "_compiled_solvers" not in self.__dict__:
+            self._compiled_solvers = {}
+        return self._compiled_solvers
 
     def solve(
         self,
         knowns,
-        guesses,
+        guesses=None,
         time_dependent=[],
         dt=None,
         verbose=False,
         tol=1e-3,
-        careful_steps=20,
+        careful_steps=None,
         symbolic_keys=False,
+        continuation=None,
+        return_status=False,
+        **options,
     ):
         """
         Solves for equilibrium after substituting a set of known quantities, e.g. temperature, metallicity,
@@ -185,169 +510,71 @@ class EquationSystem(dict):
             Dict of symbolic quantities and their values that will be plugged into the network solve as known quantities.
             Can be arrays if you want to substitute multiple values. If T is included here, we solve for chemical
             equilibrium. If T is not included, solve for thermochemical equilibrium.
-        guesses: dict
+        guesses: dict, optional
             Dict of symbolic quantities and their values that will be plugged into the network solve as guesses for the
-            unknown quantities. Can be arrays if you want to substitute multiple values. Will default to trying sensible
-            guesses for recognized quantities (NOT IMPLEMENTED YET)
+            unknown quantities. Can be arrays if you want to substitute multiple values. If no abundances are given,
+            they are guessed automatically with initial_guesses, in which case only guesses for any other unknowns
+            (e.g. T) need to be given. Or a list of such dicts of alternative guesses (e.g. from racing_guesses), which
+            are solved together in a single batch, keeping for each input the solution with the smallest residual.
+            See CompiledSolver.race.
         tol: float, optional
             Desired relative error in chemical abundances (default: 1e-3)
         careful_steps: int, optional
             Number of careful initial steps in the Newton solve before full step size is used - try increasing this if
-            your solve has trouble converging.
+            your solve has trouble converging. (default: 20, or 1 with log_variables=True)
+        continuation: str or dict, optional
+            If specified, solve a grid of known values by continuation in the known quantity of this name (e.g. "T"),
+            seeding each point with the solution at its neighbour instead of solving every point from the guesses; or a
+            dict of keyword arguments to CompiledSolver.continuation, e.g. {"parameter": "T", "reverse": True}
+        return_status: bool, optional
+            Whether to also return the array of status codes of the cells, which are compiled_solver.STATUS_CONVERGED
+            (0) for those that converged (default: False)
+        **options:
+            Further solver options passed to CompiledSolver, e.g. buckets, or method="ptc" to solve by pseudo-transient
+            continuation, which is robust to poor guesses, or method="bisection" to bracket the temperature of thermal
+            equilibrium, or resolve_failed=True to re-solve the cells that fail with increasingly robust settings, or
+            devices="all" to shard the batch across all devices
 
         Returns
         -------
         soldict: dict
             Dict of species and their equilibrium abundances relative to H or raw number densities (depending on
             value of normalize_to_H)
+        status: numpy.ndarray
+            If return_status=True, the array of status codes of the cells
         """
-
-        def printv(*a, **k):
-            """Print only if locally verbose=True"""
-            if verbose:
-                print(*a, **k)
-
-        # first: check knowns and guesses are all same size
-        num_params = np.array([len(np.array(guesses[g])) for g in guesses] + [len(np.array(knowns[g])) for g in knowns])
-        if not np.all(num_params == num_params[0]):
-            raise ValueError("Input parameters and initial guesses must all have the same shape.")
-        num_params = num_params[0]
-
+        knowns = dict(knowns)
+        racing = isinstance(guesses, (list, tuple))
         if dt is not None:
-            knowns["Δt"] = np.repeat(dt.to(units.s), num_params)
-
-        if "u" in guesses or "T" in time_dependent:
-            self["u"] = Equation(0, self.eos.internal_energy - sp.Symbol("u"))
-        subsystem = self.reduced(knowns, time_dependent)
-        symbols = subsystem.symbols
-        num_equations = len(subsystem)
-
-        # are there any symbols for which we can make a reasonable assumption or directly solve the steady-state approximation?
-        # TODO: need to reject symbols in knowns that are not found in the network
-        prescriptions = {"y": SolarAbundances.x("He"), "Y": SolarAbundances.mass_fraction["He"], "Z": 1.0, "C_2": 1.0}
-        assumed_values = {}
-        if len(symbols) > num_equations + len(knowns):
-            undetermined_symbols = symbols.difference(set(sp.Symbol(g) for g in guesses))
-            printv(f"Undetermined symbols: {undetermined_symbols}")
-            for s in undetermined_symbols:
-                # if we have a prescription for this quantity, plug it in here. This should eventually be specified at the model level.
-                if str(s) in prescriptions:
-                    # case 1: we have given a value, which we should add to the list of knowns
-                    assumed_values[str(s)] = np.repeat(prescriptions[str(s)], num_params)
-                    printv(f"{s} not specified; assuming {s}={prescriptions[str(s)]}.")
-                    symbols = subsystem.symbols
-                    # case 2: we have given an expression in terms of the other available quantities: we need to subs it
-
-        # ok now we should have number of symbols unknowns + knowns
-        printv(
-            f"Free symbols: {symbols}\nKnown values: {list(knowns)}\nAssumed values: {list(assumed_values)}\nEquations solved: {list(subsystem.rhs)}"
+            num_params = max(np.size(v) for v in (knowns | ((guesses[0] if racing else guesses) or {})).values())
+            knowns["Δt"] = np.repeat(dt.to(units.s).value, num_params)
+        chemical_species = self.chemical_species
+        alternatives = []
+        for g in guesses if racing else [guesses]:
+            if not any(k.replace("x_", "") in chemical_species for k in g or {}):
+                g = self.initial_guesses(knowns, g or {}, time_dependent)
+            alternatives.append(g)
+        guesses = alternatives[0]
+
+        solver = self.compile(
+            knowns, guesses, time_dependent, tol=tol, careful_steps=careful_steps, verbose=verbose, **options
         )
-        if len(symbols) != len(knowns | assumed_values) + len(subsystem):
-            raise ValueError(
-                f"Number of free symbols is {len(symbols)} != number of knowns {len(knowns)} + number of assumptions {len(assumed_values)} + number of equations {len(subsystem)}\n"
-            )
-        else:
-            printv(
-                f"It's solvin time. Solving for {set(guesses)} based on input {set(knowns)} and assumptions about {set(assumed_values)}"
+        if racing:
+            if continuation is not None:
+                raise ValueError("Alternative guesses cannot be raced when solving by continuation.")
+            return solver.race(knowns, alternatives, symbolic_keys=symbolic_keys, return_status=return_status)
+        if continuation is not None:
+            if isinstance(continuation, str):
+                continuation = {"parameter": continuation}
+            return solver.continuation(
+                knowns, guesses, symbolic_keys=symbolic_keys, return_status=return_status, **continuation
             )
+        return solver(knowns, guesses, symbolic_keys=symbolic_keys, return_status=return_status)
 
-        guessvals = {}
-        paramvals = {}
-        for s in subsystem.symbols:
-            for g in guesses:
-                if g == str(s) or f"x_{g}" == str(s):
-                    guessvals[s] = guesses[g]
-            for k in knowns | assumed_values:
-                if k == str(s) or f"x_{k}" == str(s):
-                    paramvals[s] = (knowns | assumed_values)[k]
-
-        # tuple: first is list of solved variables, second is list of known parameters
-        lambda_args = (list(guessvals.keys()), list(paramvals.keys()))
-        # bounds = len(lambda_args[0]) * [sp.oo]  # default upper bound is infinity
-        # for i, x in enumerate(lambda_args[0]):
-        #     if "x_" in str(x) and str(x).split("x_")[1] in self.chemical_species:
-        #         bounds[i] = species_max_abundance(str(x).split("x_")[1])
-
-        def lambdify(expr):
-            """Turns an expression into a function for numerical evaluation"""
-            return sp.lambdify(sanitize_symbols(lambda_args), sanitize_symbols(expr), modules="jax", cse=True)
-
-        func = lambdify(subsystem.rhs_scaled)
-        #        maxfunc = lambdify(bounds)
-
-        tolerance_vars = [x_(s) for s in subsystem.chemical_species]  # default: converge on all abundances
-        if "T" in guesses:
-            tolerance_vars += [sp.Symbol("T")]
-        if "u" in guesses:
-            tolerance_vars += [sp.Symbol("u"), subsystem["heat"].rhs]
-            # , subsystem["heat"]]  # converge on the internal energy and  cooling rate
-        tolfunc = lambdify(tolerance_vars)  # sp.lambdify(lambda_args, tolerance_vars, modules="jax", cse=True)
-
-        def f_numerical(X, *params):
-            """JAX function to rootfind"""
-            return jnp.array(func(X, params))
-
-        def tolerance_func(X, *params):
-            """Solution will terminate if the relative change in this quantity is < tol"""
-            return jnp.array(tolfunc(X, params))
-
-        # def max_func(X, *params):
-        #     """Function that returns upper bounds"""
-        #     return jnp.array(maxfunc(X, params))
-
-        sol, num_iter = newton_rootsolve(
-            f_numerical,
-            jnp.array([g for g in guessvals.values()]).T,
-            jnp.array([p for p in paramvals.values()]).T,
-            tolfunc=tolerance_func,
-            #            maxfunc=max_func,
-            rtol=tol,
-            careful_steps=careful_steps,
-            nonnegative=True,
-            return_num_iter=True,
-        )
-        printv(f"num_iter average={num_iter.mean()} min={num_iter.min()} max={num_iter.max()}")
-
-        soldict = self.package_solution(sol, guessvals, guesses, paramvals, subsystem, symbolic_keys)
-
-        return soldict
-
-    def package_solution(self, sol, guessvals, guesses, paramvals, subsystem, symbolic_keys):
-        """Takes the output of newton_rootsolve and packages it into a dict containing the system solution for all variables,
-        including substitutions for eliminated variables.
-        """
-        # now repack the solution
-        soldict = {}
-        for i, g in enumerate(guessvals):
-            soldict[g] = sol[:, i]
-        # do a reverse-pass on the substitutions we made to get all quantities
-        values_to_subs = soldict | paramvals
-        for expr, sub in reversed(subsystem.substitutions):
-            if expr in soldict:
-                continue
-            if "n_" in str(expr):
-                continue
-            soldict[expr] = sp.lambdify(list(sub.free_symbols), sub)(
-                *[values_to_subs[s] for s in list(sub.free_symbols)]
-            )  # should probably make a function of this
-            values_to_subs |= soldict
-        if not symbolic_keys:
-            soldict = {str(k): v for k, v in soldict.items()}
-            # if we have a bunch of x_'s, should also link up keys in the original input format, e.g. H->x_H
-            if np.any(["x_" in k for k in guesses]):  # if we specified abundances with x_ notation, return same
-                return soldict
-            soldict2 = {}  # otherwise return with input format where keys are simple species strings
-            for k in soldict:
-                if "x_" in str(k):
-                    soldict2[str(k).replace("x_", "")] = soldict[k]
-                else:
-                    soldict2[k] = soldict[k]
-            soldict = soldict2
-
-        return soldict
-
-    def solver_functions(self, solve_vars, time_dependent=[], return_jac=False, return_dict=False):
-        """Returns the RHS of the system to solve and its Jacobian, applying simplifications"""
+    def solver_functions(self, solve_vars, time_dependent=[], return_jac=False, return_dict=False, auxiliary=False):
+        """Returns the RHS of the system to solve and its Jacobian, applying simplifications. With auxiliary=True, the
+        abundances eliminated by the conservation laws are left in the expressions as auxiliary variables, and the
+        dict of their definitions is returned last (see do_conservation_reductions)."""
 
         solve_vars = list(solve_vars)
         if "u" in solve_vars or "T" in time_dependent:
@@ -355,10 +582,11 @@ class EquationSystem(dict):
             solve_vars.append("u")
 
         knowns = self.symbols.difference(solve_vars)
-        subsystem = self.reduced(knowns, time_dependent)
+        subsystem = self.reduced(knowns, time_dependent, auxiliary)
+        extra = (subsystem.auxiliary,) if auxiliary else ()
 
         rhs = {}
-        for s in subsystem.symbols:
+        for s in subsystem.symbols.difference(subsystem.auxiliary):
             for g in solve_vars:
                 if str(s) == "T" and "T" in solve_vars:
                     rhs[s] = subsystem.rhs["heat"]
@@ -368,25 +596,32 @@ class EquationSystem(dict):
         if return_jac:
             jac = {}
             for s, expr in rhs.items():
-                jac[s] = {s2: sp.diff(expr, s2) for s2 in rhs}
+                dependencies = subsystem.dependencies(expr)
+                jac[s] = {
+                    s2: subsystem.total_derivative(expr, s2) if s2 in dependencies else sp.S.Zero for s2 in rhs
+                }
 
             if return_dict:
-                return rhs, jac
+                return (rhs, jac) + extra
             else:
                 return (
                     list(rhs.values()),
                     [[jac[s1][s2] for s2 in rhs] for s1 in jac],
                     {s: i for i, s in enumerate(rhs)},
-                )
+                ) + extra
 
         if return_dict:
-            return rhs
+            return (rhs,) + extra if auxiliary else rhs
         else:
-            return list(rhs.values()), {s: i for i, s in enumerate(rhs)}
+            return (list(rhs.values()), {s: i for i, s in enumerate(rhs)}) + extra
 
-    def generate_code(self, solve_vars, time_dependent=[], language="Fortran", jac=True, do_cse=True):
-        """Generates numerical code that implements the system RHS and/or Jacobian in the specified language."""
-        func, jac, indices = self.solver_functions(solve_vars, time_dependent, return_jac=jac)
+    def generate_code(self, solve_vars, time_dependent=[], language="Fortran", jac=True, do_cse=True, auxiliary=False):
+        """Generates numerical code that implements the system RHS and/or Jacobian in the specified language. With
+        auxiliary=True, the abundances eliminated by the conservation laws are computed once at the start, as
+        auxiliary variables, instead of being substituted into every expression."""
+        functions = self.solver_functions(solve_vars, time_dependent, return_jac=jac, auxiliary=auxiliary)
+        func, jac, indices = functions[:3]
+        auxiliary = functions[3] if auxiliary else {}
 
         func, jac = sanitize_symbols(func), sanitize_symbols(jac)
 
@@ -425,6 +660,10 @@ class EquationSystem(dict):
         header = printer(Comment(header), language)
         codeblocks.append(header)
 
+        if auxiliary:
+            block = [printer(Assignment(*sanitize_symbols([a, d])), language) for a, d in auxiliary.items()]
+            codeblocks.append(" \n".join(block))
+
         if do_cse:
             cse, (func, jac) = sp.cse((sp.Matrix(func), sp.Matrix(jac)))
             block = []
@@ -0,0 +1,183 @@
+"""Implementation of LinearizedGuess: automatic initial guesses for the abundances solved for in an EquationSystem,
+from the subsystem that is linear in the abundances when the electron abundance is held fixed"""
+
+import numpy as np
+import sympy as sp
+import jax
+from jax import numpy as jnp
+from .symbols import x_, sanitize_symbols
+from .species_strings import species_charge, species_counts, total_atom_abundance
+from .compiled_solver import prescriptions, matches
+
+# guessed abundances are clipped to be at least this, so that the Newton iteration starts from positive values
+GUESS_FLOOR = 1e-30
+# number of fixed-point iterations on the electron abundance
+ELECTRON_ITERATIONS = 20
+# limiting states of the gas that alternative guesses can be generated for: each element entirely in its most highly
+# ionized atomic form, in its neutral atomic form, or in its most complex neutral molecule
+LIMITING_STATES = ("ionized", "neutral", "molecular")
+
+
+class LinearizedGuess:
+    """
+    Generator of initial guesses for the abundances solved for in an EquationSystem.
+
+    With the electron abundance x_e held fixed, the rates of the usual two-body processes involving electrons
+    (collisional ionization, recombination) and of the one-body processes (photo- and cosmic-ray ionization) are linear
+    in the remaining abundances, so the steady-state abundances follow from a single linear solve per cell. Terms that
+    are nonlinear in the abundances are dropped by linearizing about zero abundance. x_e is then iterated to
+    consistency with the charge of the solved abundances, damped by taking the geometric mean of successive iterates.
+    The whole procedure runs vectorized over the batch.
+
+    Parameters
+    ----------
+    system: EquationSystem
+        The system of equations to guess the solution of
+    knowns: iterable
+        Names of the quantities that will be specified numerically, e.g. "T", "n_Htot"
+    time_dependent: list, optional
+        Names of the quantities whose time derivatives are retained and discretized with a backward difference
+    """
+
+    def __init__(self, system, knowns, time_dependent=[]):
+        subsystem = system.copy()
+        subsystem.set_time_dependence(time_dependent)
+        subsystem.do_conservation_reductions(list(time_dependent) + ["e-"])  # keep x_e as a free symbol
+        self.species = [k for k in subsystem if k in subsystem.chemical_species and k != "e-"]
+        abundances = [x_(s) for s in self.species]
+        self.charges = np.array([species_charge(s) for s in self.species])
+        self.electron = x_("e-")
+        self.counts = {s: {a: n for a, n in species_counts(s).items() if a != "e-"} for s in self.species}
+        self.solve_electrons = "e-" in time_dependent
+
+        F = sp.Matrix([subsystem.rhs[s] for s in self.species])
+        at_zero = {y: 0 for y in abundances}
+        A, b = F.jacobian(abundances).xreplace(at_zero), F.xreplace(at_zero)
+        free = set().union(A.free_symbols, b.free_symbols) - {self.electron}
+        self.param_symbols = sorted(free, key=str)
+        args = sanitize_symbols([self.param_symbols, [self.electron]])
+        self.linear_func = sp.lambdify(args, sanitize_symbols([list(A), list(b)]), modules="jax", cse=True)
+        self.guess_arrays = jax.jit(jax.vmap(self.guess_cell))
+
+    def linear_solve(self, params, x_e):
+        """Returns the abundances solving the linear system for one cell at a fixed electron abundance"""
+        n = len(self.species)
+        A, b = self.linear_func(params, [x_e])
+        A = jnp.array(A, dtype=params.dtype).reshape(n, n)
+        b = jnp.array(b, dtype=params.dtype)
+        scale = jnp.max(jnp.abs(A), axis=1)  # equilibrate the rows, whose rates can differ by many orders of magnitude
+        scale = jnp.where(scale > 0, scale, 1)
+        y = jnp.linalg.solve(A / scale[:, None], -b / scale)
+        return jnp.where(jnp.isfinite(y), jnp.maximum(y, GUESS_FLOOR), GUESS_FLOOR)
+
+    def guess_cell(self, params):
+        """Returns the guessed abundances for one cell, iterating the electron abundance to consistency"""
+        if not np.any(self.charges):
+            return self.linear_solve(params, jnp.ones((), params.dtype))
+
+        def iterate(_, x_e):
+            x_e_new = jnp.maximum(jnp.dot(self.charges, self.linear_solve(params, x_e)), GUESS_FLOOR)
+            return jnp.sqrt(x_e * x_e_new)
+
+        x_e = jax.lax.fori_loop(0, ELECTRON_ITERATIONS, iterate, jnp.ones((), params.dtype))
+        return self.linear_solve(params, x_e)
+
+    def __call__(self, knowns, guesses={}):
+        """
+        Completes a dict of guesses with guesses for every abundance that is solved for and not already given.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values
+        guesses: dict, optional
+            Dict of guesses that are already known, e.g. for the temperature if it is solved for. The guesses
+            generated depend on these, but do not overwrite them.
+
+        Returns
+        -------
+        guesses: dict
+            Dict of guesses for all of the quantities solved for
+        """
+        values = knowns | guesses
+        N = max(np.size(v) for v in values.values())
+        paramvals = []
+        for s in self.param_symbols:
+            name = next((k for k in values if matches(k, s)), None)
+            if name is None and str(s) not in prescriptions:
+                raise ValueError(f"No value of {s} to guess the abundances with: specify it in knowns or guesses.")
+            value = values[name] if name is not None else prescriptions[str(s)]
+            paramvals.append(np.broadcast_to(value, (N,)))
+        paramvals = np.array(paramvals, dtype=jnp.zeros(()).dtype).T.reshape(N, len(self.param_symbols))
+
+        guessed = np.asarray(self.guess_arrays(jnp.asarray(paramvals)))
+        guesses = dict(guesses)
+        guessed = dict(zip(self.species, guessed.T))
+        if self.solve_electrons:
+            guessed["e-"] = np.maximum(sum(q * guessed[s] for q, s in zip(self.charges, self.species)), GUESS_FLOOR)
+        for s, value in guessed.items():
+            if not any(matches(k, x_(s)) for k in guesses):
+                guesses[s] = value
+        return guesses
+
+    @property
+    def has_molecules(self) -> bool:
+        """Whether any of the abundances solved for is of a molecule, so that the molecular limit differs from the
+        neutral one"""
+        return any(sum(c.values()) > 1 for c in self.counts.values())
+
+    def limiting(self, knowns, guesses={}, state="neutral"):
+        """
+        Completes a dict of guesses with guesses for every abundance that is solved for and not already given, for a
+        limiting state of the gas in which each element is entirely in one form and every other species is at the
+        guess floor.
+
+        Parameters
+        ----------
+        knowns: dict
+            Dict of known quantity names and their values, which must include the total abundances of the elements
+            other than H and He that are not assumed
+        guesses: dict, optional
+            Dict of guesses that are already known, which are not overwritten
+        state: str, optional
+            One of LIMITING_STATES: "ionized" to put each element in its most highly ionized atomic form, "neutral" in
+            its neutral atom, or "molecular" in the neutral species containing it with the most atoms (default:
+            "neutral")
+
+        Returns
+        -------
+        guesses: dict
+            Dict of guesses for all of the quantities solved for
+        """
+        if state not in LIMITING_STATES:
+            raise ValueError(f"Unrecognized limiting state {state}: must be one of {LIMITING_STATES}")
+        values = knowns | guesses
+        N = max(np.size(v) for v in values.values())
+        atoms = {s: sum(c.values()) for s, c in self.counts.items()}
+        rank = {
+            "ionized": lambda s: (atoms[s] == 1, species_charge(s)),
+            "neutral": lambda s: (atoms[s] == 1 and species_charge(s) == 0, 0),
+            "molecular": lambda s: (species_charge(s) == 0, atoms[s]),
+        }[state]
+        guessed, held = {s: np.full(N, GUESS_FLOOR) for s in self.species}, set()
+        for element in sorted(set().union(*self.counts.values())):
+            holder = max((s for s in self.species if element in self.counts[s]), key=rank)
+            if not rank(holder)[0]:  # the form eliminated by conservation, which the floor leaves the element in
+                continue
+            total = total_atom_abundance(element)
+            if isinstance(total, sp.Symbol):
+                name = next((k for k in values if matches(k, total)), None)
+                if name is None and str(total) not in prescriptions:
+                    raise ValueError(f"No value of {total} to guess the abundances with: specify it in knowns.")
+                total = values[name] if name is not None else prescriptions[str(total)]
+            # a species holding several elements is limited by the scarcest of them, so that all stay conserved
+            value = np.broadcast_to(total, (N,)) / self.counts[holder][element]
+            guessed[holder] = np.minimum(guessed[holder], value) if holder in held else value
+            held.add(holder)
+        if self.solve_electrons:
+            guessed["e-"] = np.maximum(sum(q * guessed[s] for q, s in zip(self.charges, self.species)), GUESS_FLOOR)
+        guesses = dict(guesses)
+        for s, value in guessed.items():
+            if not any(matches(k, x_(s)) for k in guesses):
+                guesses[s] = value
+        return guesses
@@ -15,7 +15,7 @@ class Model:
     @property
     def process(self) -> Process:
         """Returns the full, summed list of processes constituting the system of equations."""
-        return sum(self.processes)
+        return Process.compose(self.processes)
 
     @property
     def network(self) -> EquationSystem:
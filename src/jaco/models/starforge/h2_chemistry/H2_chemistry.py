@@ -13,6 +13,7 @@ from . import (
     cosmic_ray_dissociation,
 )
 from jaco.processes import ChemicalReaction
+from jaco.process import Process
 from ..symbols import T
 
 r16 = ChemicalReaction(
@@ -33,4 +34,4 @@ h2_chemistry_processes = [
     cosmic_ray_dissociation.cosmic_ray_dissociation("H_2"),
     r16,
 ]
-H2_chemistry = sum(h2_chemistry_processes)
+H2_chemistry = Process.compose(h2_chemistry_processes)
@@ -2,6 +2,7 @@
 
 from ..symbols import T, log_T, x_, n_Htot, H2_formation_heat_cgs
 from jaco.processes import ChemicalReaction
+from jaco.process import Process
 import sympy as sp
 
 
@@ -96,4 +97,4 @@ def H2_collisional_dissociation(collider, isotopologue="H_2"):
 
 
 colliders = "H+", "e-", "H_2", "H", "He"
-model_process = sum([H2_collisional_dissociation(c) for c in colliders])
+model_process = Process.compose(H2_collisional_dissociation(c) for c in colliders)
@@ -1,5 +1,6 @@
 import sympy as sp
 from jaco.processes import NBodyProcess
+from jaco.process import Process
 from jaco.symbols import T, T5, n_
 from jaco.data import SolarAbundances
 
@@ -40,7 +41,7 @@ def LineCoolingSimple(emitter: str, collider=None) -> NBodyProcess:
 
     if collider is None:  # if we haven't specified a collider, just take all of them and return the sum
         p = [LineCoolingSimple(emitter, c) for c in coeffs]
-        return sum(p)  # type: ignore # have to put a 0-process in here as start variable or it will try to add 0 + process
+        return Process.compose(p)
 
     process = NBodyProcess({emitter, collider})
     if collider not in line_cooling_coeffs[emitter]:
@@ -12,6 +12,7 @@ from .cosmic_ray_ionization import cosmic_ray_ionization, cosmic_ray_photoioniza
 from .photoelectric_heating import photoelectric_heating
 from .grain_assisted_recombination import grain_assisted_recombination
 from jaco.processes import inv_compton_cooling
+from jaco.process import Process
 # import h2_chemistry
 
 
@@ -32,7 +33,7 @@ def make_model():
         grain_assisted_recombination("C+"),
     ]
 
-    model = sum(processes)
+    model = Process.compose(processes)
     return model
 
     # processes += sum([cosmic_ray_ionization(s) for s in ("H", "C")])
@@ -1 +1,7 @@
 from .solvers import *
+from .batching import *
+from .continuation import *
+from .interpolation import *
+from .sparse import *
+from .bracketing import *
+from .sharding import *
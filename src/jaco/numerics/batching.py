@@ -0,0 +1,162 @@
+"""Routines for splitting and padding batches of inputs to the numerical solvers, so that varying batch sizes map
+onto a small set of array shapes and hence a small set of compiled executables"""
+
+import numpy as np
+import jax
+from jax import numpy as jnp
+
+
+def bucket_size(N: int, buckets="pow2") -> int:
+    """
+    Returns the batch size that a batch of N inputs should be padded to
+
+    Parameters
+    ----------
+    N: int
+        Number of inputs in the batch
+    buckets: str or iterable, optional
+        Either "pow2" to pad to the next power of 2, or an iterable of allowed batch sizes
+
+    Returns
+    -------
+    size: int
+        Smallest allowed batch size >= N, or the largest allowed batch size if N exceeds all of them
+    """
+    if isinstance(buckets, str):
+        if buckets != "pow2":
+            raise ValueError(f"Unrecognized bucket specification {buckets}")
+        return 1 << max(int(N) - 1, 0).bit_length()
+    buckets = sorted(buckets)
+    for b in buckets:
+        if b >= N:
+            return b
+    return buckets[-1]
+
+
+def pad_batch(array, size: int):
+    """Pads the leading (batch) dimension of an array up to size by repeating its last entry"""
+    num_pad = size - len(array)
+    if num_pad <= 0:
+        return array
+    xp = np if isinstance(array, np.ndarray) else jnp
+    return xp.concatenate([array, xp.repeat(array[-1:], num_pad, axis=0)])
+
+
+def bucketed_batches(N: int, buckets="pow2"):
+    """
+    Generates the partition of a batch of N inputs into chunks whose sizes are each padded to an allowed bucket size
+
+    Parameters
+    ----------
+    N: int
+        Number of inputs in the batch
+    buckets: str or iterable, optional
+        Either "pow2" to pad to the next power of 2, or an iterable of allowed batch sizes
+
+    Yields
+    ------
+    start, stop: int
+        Range of the inputs in the chunk
+    size: int
+        Padded batch size of the chunk
+    """
+    chunk = N if isinstance(buckets, str) else max(buckets)
+    for start in range(0, N, max(chunk, 1)):
+        stop = min(start + chunk, N)
+        yield start, stop, bucket_size(stop - start, buckets)
+
+
+def padding_mask(N: int, size: int):
+    """Returns a boolean array of length size that is True for the first N entries and False for the padding"""
+    return jnp.asarray(np.arange(size) < N)
+
+
+def auto_chunk_size(func, arrays, memory_budget=2**30, probe_size=1024):
+    """
+    Returns the largest power-of-2 chunk size for which a batched, jitted function should fit within a memory budget,
+    based on XLA's memory analysis of the function compiled for a probe batch size.
+
+    Parameters
+    ----------
+    func: callable
+        Jitted function of signature func(*arrays, mask), where all arrays and the mask share a leading batch dimension
+    arrays: list
+        Example input arrays, which only need to have the right trailing shapes and dtypes
+    memory_budget: int, optional
+        Memory budget in bytes (default: 1GiB)
+    probe_size: int, optional
+        Batch size to compile for when measuring the memory use per entry (default: 1024)
+
+    Returns
+    -------
+    chunk_size: int
+        The chunk size
+    """
+    specs = [jax.ShapeDtypeStruct((probe_size, *np.shape(a)[1:]), jnp.asarray(a).dtype) for a in arrays]
+    specs.append(jax.ShapeDtypeStruct((probe_size,), bool))
+    try:
+        memory = func.lower(*specs).compile().memory_analysis()
+        bytes_per_entry = (
+            memory.temp_size_in_bytes + memory.argument_size_in_bytes + memory.output_size_in_bytes
+        ) / probe_size
+    except (AttributeError, NotImplementedError):  # no memory analysis available for this backend
+        return probe_size * 64
+    return 1 << max(int(memory_budget / bytes_per_entry).bit_length() - 1, 0)
+
+
+def stream_batches(func, arrays, chunk_size):
+    """
+    Evaluates a batched function on a large batch of inputs in chunks of fixed size, so that memory use is bounded.
+    The next chunk is transferred to the device while the current one is being computed, and the results are written
+    into preallocated host arrays.
+
+    Parameters
+    ----------
+    func: callable
+        Function of signature func(*arrays, mask), returning an array or a pytree (e.g. tuple) of arrays sharing the
+        leading batch dimension of the inputs. Entries where mask is False are padding whose output is discarded.
+    arrays: list
+        Input arrays sharing a leading batch dimension of size N
+    chunk_size: int
+        Number of entries per chunk. The last chunk is padded up to this size so only one shape is ever compiled.
+
+    Returns
+    -------
+    result: array_like or pytree
+        The output(s) of func for the whole batch, as numpy arrays
+    """
+    N = len(arrays[0])
+    if N == 0:  # nothing to stream, but the outputs still have the shapes and dtypes that func gives them
+        outputs = jax.eval_shape(func, *arrays, padding_mask(0, 0))
+        return jax.tree.map(lambda a: np.empty(a.shape, a.dtype), outputs)
+    chunks = [(start, min(start + chunk_size, N)) for start in range(0, N, chunk_size)]
+
+    def to_device(chunk):
+        start, stop = chunk
+        inputs = [jax.device_put(pad_batch(np.asarray(a[start:stop]), chunk_size)) for a in arrays]
+        return inputs + [padding_mask(stop - start, chunk_size)]
+
+    outputs, treedef = None, None
+
+    def to_host(result, chunk):
+        """Copy a finished result into the preallocated output arrays"""
+        nonlocal outputs, treedef
+        start, stop = chunk
+        leaves, treedef = jax.tree.flatten(result)
+        if outputs is None:
+            outputs = [np.empty((N, *np.shape(r)[1:]), dtype=r.dtype) for r in leaves]
+        for out, r in zip(outputs, leaves):
+            out[start:stop] = np.asarray(r[: stop - start])
+
+    next_inputs = to_device(chunks[0])
+    pending = None
+    for i, chunk in enumerate(chunks):
+        result = func(*next_inputs)  # dispatched asynchronously
+        if i + 1 < len(chunks):
+            next_inputs = to_device(chunks[i + 1])  # transfer while the current chunk computes
+        if pending is not None:
+            to_host(*pending)
+        pending = result, chunk
+    to_host(*pending)
+
+    return jax.tree.unflatten(treedef, outputs)
@@ -0,0 +1,85 @@
+"""Bracketed root-finding for batches of scalar equations: Newton's method safeguarded by bisection, which converges
+within a bounded number of iterations for any root that is bracketed"""
+
+import numpy as np
+
+
+def bisection_max_iter(lo, hi, xtol) -> int:
+    """Returns the iteration limit of bracketed_newton: twice the number of bisections that reduce the widest bracket
+    to xtol, since each Newton step that is accepted at least halves the step before the last"""
+    width = np.max(np.asarray(hi) - np.asarray(lo))
+    return 2 * max(int(np.ceil(np.log2(max(width / xtol, 1)))), 1) + 2
+
+
+def bracketed_newton(evaluate, x, lo, hi, xtol, max_iter=None):
+    """
+    Finds a root of each of a batch of scalar functions of one variable, f, within a bracket [lo, hi] across which f
+    changes sign from positive to negative, by Newton's method safeguarded with bisection.
+
+    Each iteration narrows the bracket to the side of the current point on which f changes sign, and takes the Newton
+    step if it stays within the bracket and is at most half as long as the step before the last. Otherwise it bisects
+    the bracket, so that a root is always retained and the iteration cannot diverge or cycle. Where f cannot be
+    evaluated, the iteration backs off halfway towards the last point where it could.
+
+    Parameters
+    ----------
+    evaluate: callable
+        Function of signature evaluate(x, mask) returning the arrays of the values of f at x, of the Newton steps
+        -f/f' from x and of the cost of the evaluation (e.g. the number of iterations of an inner solve) for a batch
+        of inputs, excluding the entries where mask is False. The values may be non-finite where f cannot be evaluated,
+        in which case the entry is given up on if it could not be evaluated anywhere else.
+    x: array_like
+        Shape (N,) array of initial points, which are clipped into the brackets
+    lo, hi: array_like
+        Shape (N,) arrays of the lower and upper ends of the brackets, assumed to satisfy f(lo) > 0 > f(hi). Entries
+        whose bracket collapses without f taking both signs have no root inside it, and are not considered converged.
+    xtol: float
+        Absolute tolerance in x: an entry converges once its Newton step or its bracket is smaller than this
+    max_iter: int, optional
+        Iteration limit (default: twice the number of bisections needed to reduce the widest bracket to xtol, plus 2)
+
+    Returns
+    -------
+    x: numpy.ndarray
+        Shape (N,) array of roots: the last point at which f was evaluated for each entry
+    cost: numpy.ndarray
+        Shape (N,) array of the total cost of the evaluations spent on each entry
+    converged: numpy.ndarray
+        Shape (N,) boolean array of whether each entry converged
+    """
+    lo, hi = np.array(lo, dtype=float), np.array(hi, dtype=float)
+    x = np.clip(np.asarray(x, dtype=float), lo, hi)
+    max_iter = max_iter or bisection_max_iter(lo, hi, xtol)
+    cost = np.zeros(len(x), dtype=int)
+    converged, failed = np.zeros(len(x), dtype=bool), np.zeros(len(x), dtype=bool)
+    positive, negative = np.zeros(len(x), dtype=bool), np.zeros(len(x), dtype=bool)  # signs of f encountered
+    evaluated, x_evaluated = np.zeros(len(x), dtype=bool), x.copy()  # the last point where f could be evaluated
+    dx = dx_prev = hi - lo  # the last step and the step before it
+
+    for _ in range(max_iter):
+        active = ~(converged | failed)
+        if not active.any():
+            break
+        f, step, n = (np.asarray(a) for a in evaluate(x, active))
+        cost += np.where(active, n, 0)
+        backoff = active & ~np.isfinite(f)
+        failed |= backoff & ~evaluated
+        active &= np.isfinite(f)
+        evaluated, x_evaluated = evaluated | active, np.where(active, x, x_evaluated)
+        lo, hi = np.where(active & (f > 0), x, lo), np.where(active & (f < 0), x, hi)
+        positive, negative = positive | (active & (f > 0)), negative | (active & (f < 0))
+
+        x_newton = x + np.where(np.isfinite(step), step, np.inf)
+        bisect = ~((x_newton > lo) & (x_newton < hi)) | (np.abs(step) > np.abs(dx_prev) / 2)
+        x_new = np.where(bisect, (lo + hi) / 2, x_newton)
+        # the bracket can only collapse onto a root if f has taken both signs, otherwise onto an end of the bracket
+        newton_done = ~bisect & (np.abs(step) < xtol)
+        bisect_done = (bisect & (np.abs(x_new - x) < xtol)) | (hi - lo < xtol)
+        converged |= active & ((f == 0) | newton_done | (bisect_done & positive & negative))
+        failed |= active & bisect_done & ~converged
+        x_backoff = (x_evaluated + x) / 2
+        failed |= backoff & (np.abs(x_backoff - x_evaluated) < xtol)
+        done = converged | failed
+        dx_prev, dx = np.where(active, dx, dx_prev), np.where(active, x_new - x, dx)
+        x = np.where(active & ~done, x_new, np.where(backoff & ~done, x_backoff, x))
+    return x, cost, converged
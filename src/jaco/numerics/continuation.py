@@ -0,0 +1,269 @@
+"""Continuation methods: natural-parameter continuation, solving a system over a grid of parameter values by sweeping
+along one parameter, seeding each point from the converged solution at its neighbour, with automatic step-halving on
+failure; and pseudo-transient continuation, reaching steady state by implicit pseudo-time stepping"""
+
+import numpy as np
+
+
+def continuation_lines(params, index: int, reverse=False):
+    """
+    Partitions a grid of parameter values into lines along which one parameter varies and all others are fixed.
+
+    Parameters
+    ----------
+    params: array_like
+        Shape (N,n_p) array of parameter values
+    index: int
+        Index of the parameter to continue in
+    reverse: bool, optional
+        Whether to order each line by decreasing rather than increasing value of the continuation parameter
+
+    Returns
+    -------
+    lines: numpy.ndarray
+        Shape (L, M) integer array whose row i contains the indices of the points on line i in sweep order, padded
+        with -1 to the length M of the longest line
+    """
+    params = np.asarray(params)
+    others = np.delete(params, index, axis=1)
+    _, line = np.unique(others, axis=0, return_inverse=True)
+    line = np.ravel(line)
+    value = -params[:, index] if reverse else params[:, index]
+    order = np.lexsort((value, line))
+    splits = np.split(order, np.flatnonzero(np.diff(line[order])) + 1)
+    lines = np.full((len(splits), max(len(s) for s in splits)), -1)
+    for i, s in enumerate(splits):
+        lines[i, : len(s)] = s
+    return lines
+
+
+def continuation_sweep(
+    solve,
+    guesses,
+    params,
+    index: int,
+    max_iter=20,
+    cold_solve=None,
+    cold_max_iter=100,
+    reverse=False,
+    max_halvings=6,
+    log=True,
+):
+    """
+    Solves a system over a grid of parameter values by natural-parameter continuation in one of the parameters.
+
+    The grid is split into lines along which only the continuation parameter varies, which are swept in parallel as
+    a single batch. The first point on each line that converges from its given guess is the starting point, and each
+    subsequent point is solved starting from the converged solution at the previous point. If a step fails to
+    converge within max_iter iterations, it is halved and the point is approached through intermediate parameter
+    values, growing the step again as it succeeds. Points that still fail after max_halvings halvings are finally
+    re-solved from their original guess with cold_solve.
+
+    Parameters
+    ----------
+    solve: callable
+        Function of signature solve(guesses, params, mask) returning the arrays of solutions and iteration counts for
+        a batch of inputs (and optionally further outputs, which are ignored), excluding the entries where mask is
+        False. This should take few careful steps, since the guesses it is given are already close to the solution.
+    guesses: array_like
+        Shape (N,n) array of initial guesses, only used for the starting point of each line and for cold solves
+    params: array_like
+        Shape (N,n_p) array of parameter values
+    index: int
+        Index of the parameter to continue in
+    max_iter: int, optional
+        Iteration limit of solve: steps that take this many iterations are considered to have failed (default: 20)
+    cold_solve: callable, optional
+        Function with the same signature as solve, used to solve from the original guesses (default: solve)
+    cold_max_iter: int, optional
+        Iteration limit of cold_solve (default: 100)
+    reverse: bool, optional
+        Whether to sweep from the largest to the smallest value of the continuation parameter (default: False)
+    max_halvings: int, optional
+        Maximum number of times a step can be halved before a point is given up on (default: 6)
+    log: bool, optional
+        Whether to take intermediate steps in the logarithm of the continuation parameter, which must then be positive
+        (default: True)
+
+    Returns
+    -------
+    sol: numpy.ndarray
+        Shape (N,n) array of solutions
+    num_iter: numpy.ndarray
+        Shape (N,) array of the total number of iterations spent on each point, including intermediate steps
+    converged: numpy.ndarray
+        Shape (N,) boolean array of whether each point converged
+    """
+    cold_solve = cold_solve or solve
+    guesses, params = np.asarray(guesses), np.asarray(params)
+    lines = continuation_lines(params, index, reverse)
+    length = (lines >= 0).sum(1)
+    L = len(lines)
+    u = np.log(params[:, index]) if log else params[:, index]
+    sol, num_iter = np.array(guesses), np.zeros(len(guesses), dtype=int)
+    converged, cold = np.zeros(len(guesses), dtype=bool), np.zeros(len(guesses), dtype=bool)
+
+    def run(solver, X, p, mask, limit):
+        """Solves a batch, returning the solutions, iteration counts and whether each converged"""
+        X, n = (np.asarray(a) for a in solver(X, p, mask)[:2])
+        return X, n, (n < limit) & np.all(np.isfinite(X), axis=1)
+
+    # start each line from the first point in sweep order that can be solved from its original guess
+    k, alive = np.zeros(L, dtype=int), np.zeros(L, dtype=bool)
+    X_prev, u_prev = guesses[lines[:, 0]], u[lines[:, 0]]
+    while True:
+        pending = ~alive & (k < length)
+        if not pending.any():
+            break
+        target = lines[np.arange(L), np.minimum(k, length - 1)]
+        X, n, ok = run(cold_solve, guesses[target], params[target], pending, cold_max_iter)
+        start = target[pending]
+        sol[start], num_iter[start], converged[start], cold[start] = X[pending], n[pending], ok[pending], True
+        X_prev = np.where((pending & ok)[:, None], X, X_prev)
+        u_prev = np.where(pending & ok, u[target], u_prev)
+        alive |= pending & ok
+        k += pending
+
+    # state of each line: the last converged solution and its parameter value, and the current step, as a fraction
+    # of the interval from u_start to the next point
+    u_start, t, dt = u_prev.copy(), np.zeros(L), np.ones(L)
+    while True:
+        active = alive & (k < length)
+        if not active.any():
+            break
+        target = lines[np.arange(L), np.minimum(k, length - 1)]
+        t_try = np.minimum(t + dt, 1)
+        u_try = np.where(t_try < 1, u_start + t_try * (u[target] - u_start), u[target])
+        p = params[target].copy()
+        p[:, index] = np.exp(u_try) if log else u_try
+        X, n, ok = run(solve, X_prev, p, active, max_iter)
+        np.add.at(num_iter, target[active], n[active])
+
+        success, failure = active & ok, active & ~ok
+        X_prev = np.where(success[:, None], X, X_prev)
+        u_prev = np.where(success, u_try, u_prev)
+        t, dt = np.where(success, t_try, t), np.where(success, np.minimum(2 * dt, 1), dt / 2)
+        give_up = failure & (dt < 0.5**max_halvings)
+        arrived = success & (t_try == 1)
+        sol[target[arrived]], converged[target[arrived]] = X[arrived], True
+        # move on to the next point, starting from the last converged solution if the current one was given up on
+        done = arrived | give_up
+        k = np.where(done, k + 1, k)
+        u_start = np.where(done, u_prev, u_start)
+        t = np.where(done, 0, t)
+        dt = np.where(give_up, 1, dt)
+
+    # fall back to solving the points that could not be reached by continuation from scratch
+    failed = np.flatnonzero(~converged & ~cold)
+    if len(failed):
+        X, n, ok = run(cold_solve, guesses[failed], params[failed], np.ones(len(failed), dtype=bool), cold_max_iter)
+        sol[failed], num_iter[failed], converged[failed] = X, num_iter[failed] + n, ok
+    return sol, num_iter, converged
+
+
+def pseudo_transient_continuation(
+    step,
+    solve,
+    residual,
+    guesses,
+    params,
+    dtau,
+    max_steps=100,
+    max_iter=10,
+    solve_max_iter=10,
+    growth=10.0,
+    shrink=0.25,
+):
+    """
+    Solves a steady-state system by pseudo-transient continuation: the system is integrated towards steady state with
+    implicit pseudo-time steps, whose size adapts per entry by switched evolution relaxation (SER), growing on every
+    accepted step by the factor by which the steady-state residual falls, and at least doubling. Before each step, the
+    steady-state system is solved with a few Newton iterations from the current state, and entries for which this
+    converges to a state that a further pseudo-time step leaves in place are finished. Far from the solution the
+    implicit steps are heavily damped Newton steps, and as the steps grow they become plain Newton steps, so no
+    careful steps or close guesses are needed.
+
+    Parameters
+    ----------
+    step: callable
+        Function of signature step(X, params, dtau, mask) taking one implicit pseudo-time step of size dtau from the
+        state X, returning the arrays of new states and iteration counts for a batch of inputs (and optionally further
+        outputs, which are ignored), excluding the entries where mask is False. Steps that take max_iter iterations
+        are considered to have failed.
+    solve: callable
+        Function of signature solve(X, params, mask) solving the steady-state system from X, with the same returns as
+        step. Solves that take solve_max_iter iterations are considered to have failed.
+    residual: callable
+        Function of signature residual(X, params) returning the shape (N,m) array of steady-state residuals
+    guesses: array_like
+        Shape (N,n) array of initial states
+    params: array_like
+        Shape (N,n_p) array of parameter values
+    dtau: array_like
+        Shape (N,) array of initial pseudo-time steps
+    max_steps: int, optional
+        Maximum number of pseudo-time steps (default: 100)
+    max_iter: int, optional
+        Iteration limit of step (default: 10)
+    solve_max_iter: int, optional
+        Iteration limit of solve (default: 10)
+    growth: float, optional
+        Maximum factor by which the pseudo-time step can grow per step (default: 10)
+    shrink: float, optional
+        Factor by which the pseudo-time step is reduced after a failed step (default: 0.25)
+
+    Returns
+    -------
+    sol: numpy.ndarray
+        Shape (N,n) array of solutions
+    num_iter: numpy.ndarray
+        Shape (N,) array of the total number of iterations of step and solve spent on each entry
+    converged: numpy.ndarray
+        Shape (N,) boolean array of whether each entry converged
+    """
+    X, params = np.array(guesses), np.asarray(params)
+    dtau = np.array(dtau, dtype=float)
+    dtau_max = float(np.finfo(X.dtype).max)  # so that growing steps do not overflow the precision of the state
+    num_iter = np.zeros(len(X), dtype=int)
+    converged = np.zeros(len(X), dtype=bool)
+
+    def run(func, limit, X, *args):
+        """Evaluates a batch from the states X, returning the new states, iteration counts and whether each succeeded"""
+        X_new, n = (np.asarray(a) for a in func(X, *args)[:2])
+        F = np.asarray(residual(X_new, params))
+        ok = (n < limit) & np.all(np.isfinite(X_new), axis=1) & np.all(np.isfinite(F), axis=1)
+        return X_new, n, ok
+
+    # residuals are measured relative to those of the initial state, so that equations in different units count alike
+    F0 = np.abs(np.asarray(residual(X, params)))
+    F0 = np.where(F0 > 0, F0, 1)
+
+    def norm(X):
+        return np.max(np.abs(np.asarray(residual(X, params))) / F0, axis=1)
+
+    r = norm(X)
+    for _ in range(max_steps):
+        active = ~converged
+        if not active.any():
+            break
+        X_new, n, ok = run(solve, solve_max_iter, X, params, active)
+        num_iter += np.where(active, n, 0)
+        # a steady state is left in place by a pseudo-time step, which rejects spurious fixed points of the solve
+        _, n, steady = run(step, 2, X_new, params, np.minimum(dtau, dtau_max).astype(X.dtype), active & ok)
+        num_iter += np.where(active & ok, n, 0)
+        finished = active & ok & steady
+        X[finished], converged = X_new[finished], converged | finished
+
+        active = ~converged
+        if not active.any():
+            break
+        X_new, n, ok = run(step, max_iter, X, params, np.minimum(dtau, dtau_max).astype(X.dtype), active)
+        num_iter += np.where(active, n, 0)
+        accepted = active & ok
+        r_new = np.where(accepted, norm(np.where(accepted[:, None], X_new, X)), r)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.clip(np.nan_to_num(r / r_new, nan=1.0, posinf=growth), 2, growth)
+        X = np.where(accepted[:, None], X_new, X)
+        dtau = np.where(accepted, dtau * ratio, np.where(active, dtau * shrink, dtau))
+        r = r_new
+    return X, num_iter, converged
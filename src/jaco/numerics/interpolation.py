@@ -0,0 +1,64 @@
+"""Multilinear interpolation on rectilinear grids, written against the array API shared by numpy and jax.numpy so that
+the same routine can be used on the host or jitted"""
+
+import numpy as np
+
+
+def grid_cell(axis, x, xp=np):
+    """
+    Locates points along one axis of a rectilinear grid
+
+    Parameters
+    ----------
+    axis: array_like
+        Shape (M,) increasing array of grid coordinates, M >= 2
+    x: array_like
+        Shape (N,) array of coordinates of the points
+    xp: module, optional
+        Array module to compute with: numpy or jax.numpy (default: numpy)
+
+    Returns
+    -------
+    index: array_like
+        Shape (N,) array of the index i of the grid interval [axis[i], axis[i+1]] containing each point, clamped to
+        the first and last intervals for points off the grid
+    weight: array_like
+        Shape (N,) array of the fractional position of each point within its interval, clamped to [0,1] so that the
+        table is extended as a constant beyond its edges
+    """
+    axis = xp.asarray(axis)
+    index = xp.clip(xp.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+    weight = xp.clip((x - axis[index]) / (axis[index + 1] - axis[index]), 0, 1)
+    return index, weight
+
+
+def multilinear_interpolate(axes, data, points, xp=np):
+    """
+    Interpolates tabulated data multilinearly on a rectilinear grid
+
+    Parameters
+    ----------
+    axes: list
+        List of d increasing arrays of grid coordinates, each of length at least 2
+    data: array_like
+        Shape (M_1, ..., M_d, q) array of q quantities tabulated on the grid
+    points: array_like
+        Shape (N,d) array of the coordinates of the points to interpolate to
+    xp: module, optional
+        Array module to compute with: numpy or jax.numpy, in which case this can be jitted (default: numpy)
+
+    Returns
+    -------
+    values: array_like
+        Shape (N,q) array of the interpolated quantities
+    """
+    data = xp.asarray(data)
+    cells = [grid_cell(axis, points[:, i], xp) for i, axis in enumerate(axes)]
+    values = 0
+    for corner in np.ndindex(*(2,) * len(axes)):  # sum over the 2^d corners of the enclosing cell
+        weight, index = 1, []
+        for (i, w), c in zip(cells, corner):
+            weight = weight * (w if c else 1 - w)
+            index.append(i + c)
+        values = values + weight[:, None] * data[tuple(index)]
+    return values
@@ -0,0 +1,57 @@
+"""Routines for distributing batches of inputs to the numerical solvers across several devices, e.g. the cores of a
+host CPU exposed as separate devices with XLA_FLAGS=--xla_force_host_platform_device_count=<number of cores>"""
+
+import numpy as np
+import jax
+from jax.sharding import Mesh, PartitionSpec
+from .batching import pad_batch
+
+BATCH_AXIS = "batch"
+
+
+def batch_mesh(devices=None) -> Mesh:
+    """
+    Returns a one-dimensional device mesh over which to shard the batch dimension of the solvers
+
+    Parameters
+    ----------
+    devices: int or list, optional
+        Devices to use: a list of devices, or the number of devices to take from jax.devices() (default: all devices)
+    """
+    if devices is None:
+        devices = jax.devices()
+    elif isinstance(devices, int):
+        devices = jax.devices()[:devices]
+    return Mesh(np.array(devices), (BATCH_AXIS,))
+
+
+def sharded_map(func, mesh: Mesh):
+    """
+    Wraps a function of a batch of inputs so that the batch is split evenly across the devices of a mesh, and each
+    device evaluates func on its own shard independently. This only applies to functions that treat the entries of a
+    batch independently, e.g. the Newton iteration: each device then runs its own loop until its own entries have
+    converged, without synchronizing with the others.
+
+    Parameters
+    ----------
+    func: callable
+        Function of any number of arrays whose leading dimension is the batch, returning a pytree of such arrays
+    mesh: Mesh
+        Device mesh, as returned by batch_mesh
+
+    Returns
+    -------
+    sharded_func: callable
+        Function with the same signature as func. Batches that do not divide evenly across the mesh are padded by
+        repeating their last entry, and the padding is removed from the outputs.
+    """
+    spec = PartitionSpec(mesh.axis_names)
+
+    def sharded_func(*arrays):
+        N = arrays[0].shape[0]
+        size = -(-N // mesh.size) * mesh.size
+        arrays = tuple(pad_batch(a, size) for a in arrays)
+        out = jax.shard_map(func, mesh=mesh, in_specs=(spec,) * len(arrays), out_specs=spec, check_vma=False)(*arrays)
+        return jax.tree.map(lambda a: a[:N], out)
+
+    return sharded_func
@@ -1,4 +1,16 @@
+import numpy as np
 import jax, jax.numpy as jnp
+from functools import partial
+from .batching import bucket_size, auto_chunk_size, stream_batches
+from .sharding import sharded_map
+
+BIG, SMALL = 1e37, 1e-37
+MAX_BACKTRACKS = 10  # maximum number of step halvings in the line search
+ARMIJO_C = 1e-4  # sufficient decrease parameter of the line search
+BOUNDARY_FRACTION = 0.999999  # with nonnegative=True, the fraction of the distance to zero that a line search step
+# may cover at most, i.e. a step reduces a component by at most a factor 1e6 (and stays off the bound in float32)
+LOG_BIG, LOG_SMALL = float(np.log(BIG)), float(np.log(SMALL))
+LOG_STEP_FLOOR = 1e-4  # with log_variables, a single step can reduce a quantity by at most this factor
 
 
 def newton_rootsolve(
@@ -9,10 +21,20 @@ def newton_rootsolve(
     tolfunc=None,
     #    maxfunc=None,
     rtol=1e-6,
+    atol=0,
     max_iter=100,
     careful_steps=1,
     nonnegative=False,
     return_num_iter=False,
+    mask=None,
+    linsolve=None,
+    method="newton",
+    jac_reuse=5,
+    contraction=0.5,
+    return_stats=False,
+    line_search=False,
+    log_variables=False,
+    mesh=None,
 ):
     """
     Solve the system f(X,p) = 0 for X, where both f and X can be vectors of arbitrary length and p is a set of fixed
@@ -35,71 +57,675 @@ def newton_rootsolve(
     rtol: float, optional
         Relative tolerance - iteration will terminate if relative change in all quantities is less than this value.
     atol: float, optional
-        Absolute tolerance: iteration will terminate if the value computed by tolfunc goes below this value.
+        Absolute tolerance: changes in X and in the value computed by tolfunc smaller than this count as converged,
+        so that components at the level of round-off noise do not hold up convergence (default: 0)
     careful_steps: int, optional
         Number of "careful" initial steps to take, gradually ramping up the step size in the Newton iteration
+    mask: array_like, optional
+        Shape (N,) boolean array: entries where this is False (e.g. padding) are not iterated and are returned as the
+        initial guess
+    linsolve: callable, optional
+        Function of signature linsolve(J, b) solving the linear system J x = b for the Newton step, e.g. a sparse
+        solver from sparse_lu_solver (default: jnp.linalg.solve)
+    method: str, optional
+        "newton" to evaluate and factorize the Jacobian on every iteration, "chord" to reuse the factorization of the
+        last Jacobian evaluated, or "broyden" to update the inverse of the last Jacobian evaluated with Broyden's
+        rank-one update. In the latter two, the Jacobian is re-evaluated after jac_reuse iterations, or as soon as
+        the iteration stops contracting. (default: "newton")
+    jac_reuse: int, optional
+        Maximum number of iterations that a Jacobian is reused for with method="chord" or "broyden" (default: 5)
+    contraction: float, optional
+        With method="chord" or "broyden", the Jacobian is re-evaluated if the norm of f decreases by less than this
+        factor in an iteration (default: 0.5)
+    return_stats: bool, optional
+        Whether to also return a dict of the number of Jacobian evaluations "num_jac" and factorizations "num_factor"
+        done for each entry
+    line_search: bool, optional
+        Whether to globalize the Newton iteration with a backtracking line search, which takes the full Newton step
+        whenever it makes progress and halves it otherwise, instead of ramping up the step over careful_steps
+        iterations (which is then ignored). Only applies to method="newton". (default: False)
+    log_variables: bool, optional
+        Whether to iterate on ln(X) instead of X, for positive quantities spanning many orders of magnitude, e.g.
+        abundances. func, jacfunc and tolfunc are still functions of X, and the Newton step dX is computed as usual,
+        but it is taken as the change ln(1 + dX/X) in ln(X), limiting the decrease in X to a factor LOG_STEP_FLOOR
+        per step, so that X stays positive without being clipped. Guesses and solutions are still values of X. Note
+        that the relative precision of X is then limited to about |ln(X)| times the machine epsilon. (default: False)
+    mesh: jax.sharding.Mesh, optional
+        Device mesh, e.g. from batch_mesh, across which to shard the batch: each device then iterates on its own part
+        of the batch independently, until its own entries have converged (default: iterate on the default device)
+
+    Notes
+    -----
+    With line_search, convergence is judged on the part of each step that survives clipping to the allowed range, so
+    that components pinned at a bound (e.g. an abundance that wants to go negative) do not hold up convergence.
+    Otherwise it is judged on the full step.
+
+    The solution is differentiable with respect to params (and anything else func closes over) by the implicit function
+    theorem, via jax.lax.custom_root: derivatives are not propagated through the iterations, and cost one linear solve
+    with the Jacobian at the solution per cell, in forward or reverse mode.
 
     Returns
     -------
     X: array_like
         Shape (N,n) array of solutions
     """
-    BIG, SMALL = 1e37, 1e-37
+    guesses, params = prepare_inputs(guesses, params, nonnegative)
+    if mask is None:
+        mask = jnp.ones(guesses.shape[0], dtype=bool)
+
+    def iterate(_, guesses):
+        """Runs the Newton iteration, returning the solution and the (num_iter, counts) statistics"""
+        X0 = jnp.log(guesses.clip(SMALL)) if log_variables else guesses
+        run = partial(
+            newton_iterate,
+            func,
+            jacfunc=jacfunc,
+            tolfunc=tolfunc,
+            rtol=rtol,
+            atol=atol,
+            careful_steps=careful_steps,
+            nonnegative=nonnegative,
+            linsolve=linsolve,
+            method=method,
+            jac_reuse=jac_reuse,
+            contraction=contraction,
+            line_search=line_search,
+            log_variables=log_variables,
+        )
+        if mesh is not None:
+            run = sharded_map(run, mesh)
+        X, _, num_iter, counts, _ = run(
+            X0,
+            initial_step(X0, log_variables),
+            jnp.zeros(guesses.shape[0], dtype=int),
+            jnp.zeros((guesses.shape[0], 2), dtype=int),
+            params,
+            jnp.where(jnp.asarray(mask), max_iter, 0),
+        )
+        # integer auxiliary outputs get tangents of the wrong type in custom_root, so pass them as floats
+        return (jnp.exp(X) if log_variables else X), (num_iter.astype(X.dtype), counts.astype(X.dtype))
+
+    X, (num_iter, counts) = jax.lax.custom_root(
+        lambda X: jax.vmap(lambda X, p: func(X, *p))(X, params), guesses, iterate, batched_tangent_solve, has_aux=True
+    )
+    num_iter, counts = num_iter.astype(int), counts.astype(int)
+    result = (X,)
+    if return_num_iter:
+        result += (num_iter,)
+    if return_stats:
+        result += (solver_stats(counts),)
+    return result if len(result) > 1 else X
+
 
+def prepare_inputs(guesses, params, nonnegative=False, log_variables=False):
+    """Converts guesses and params to arrays of shape (N,n) and (N,n_p), clipping the guesses if nonnegative, and
+    taking their logarithms if log_variables"""
     guesses = jnp.array(guesses)
-    guesses = jnp.where(nonnegative, guesses.clip(SMALL), guesses)
+    if log_variables:
+        guesses = jnp.log(guesses.clip(SMALL))
+    else:
+        guesses = jnp.where(nonnegative, guesses.clip(SMALL), guesses)
     params = jnp.array(params)
     if len(guesses.shape) < 2:
         guesses = jnp.atleast_2d(guesses).T
     if len(params.shape) < 2:
         params = jnp.atleast_2d(params).T
+    return guesses, params
+
+
+def initial_step(guesses, log_variables=False):
+    """A notional last step, large enough that the iteration does not count as converged before it has started"""
+    if log_variables:
+        return jnp.full_like(guesses, 100.0)
+    return 100 * guesses
+
+
+def batched_tangent_solve(g, y):
+    """
+    Solves the linear systems J_i x_i = y_i of a batch of independent systems, given the linear map g(x) = (J_i x_i)
+    over the batch, for the implicit differentiation of the solution in newton_rootsolve. g is block-diagonal, so each
+    column of all the J_i can be found with a single evaluation of g.
+
+    Parameters
+    ----------
+    g: callable
+        Linear function mapping a shape (N,n) array x to the array of J_i x_i
+    y: array_like
+        Shape (N,n) array of right-hand sides
+
+    Returns
+    -------
+    x: array_like
+        Shape (N,n) array of solutions
+    """
+    seeds = jnp.broadcast_to(jnp.eye(y.shape[1], dtype=y.dtype)[:, None, :], (y.shape[1],) + y.shape)
+    J = jnp.moveaxis(jax.vmap(g)(seeds), 0, -1)  # shape (N,n,n)
+    return jnp.linalg.solve(J, y[..., None])[..., 0]
+
+
+def solver_stats(counts) -> dict:
+    """Converts the (N,2) array of Jacobian evaluation and factorization counts into a dict"""
+    return {"num_jac": counts[:, 0], "num_factor": counts[:, 1]}
+
+
+def step_factor(num_iter, careful_steps):
+    """Fraction of the full Newton step to take, ramping up to 1 over the careful steps"""
+    return jnp.min(jnp.array([(num_iter + 1.0) / careful_steps, 1.0]))
+
+
+def step_scale(X, log_variables=False):
+    """Scale that steps in the iterate X are measured relative to: X itself, or 1 if it holds logarithms, whose
+    changes are already relative"""
+    if log_variables:
+        return jnp.ones_like(X)
+    return jnp.abs(X)
+
+
+def unconverged(X, dx, num_iter, params, tolfunc, rtol, careful_steps, atol=0, log_variables=False):
+    """Check if a single iterate is still outside the desired tolerance."""
+    fac = step_factor(num_iter, careful_steps)
+    tol2, tol1 = tolfunc(X, *params), tolfunc(X - dx, *params)
+    tolcheck = jnp.any(jnp.abs(tol1 - tol2) > fac * (rtol * jnp.abs(tol1) + atol))
+    return jnp.any(jnp.abs(dx) > fac * (rtol * step_scale(X, log_variables) + atol)) & tolcheck
+
+
+def take_step(X, dx, nonnegative, log_variables=False):
+    """Returns the iterate X + dx, clipped to the allowed range, or X if the step is not finite"""
+    dx_finite = jnp.all(jnp.isfinite(dx))
+    if log_variables:  # X holds logarithms
+        return jnp.where(dx_finite, (X + dx).clip(LOG_SMALL, LOG_BIG), X)
+    return jnp.where(dx_finite, jnp.where(nonnegative, (X + dx).clip(SMALL), (X + dx).clip(-BIG, BIG)), X)
+
+
+def projected_step(X, dx, nonnegative, log_variables=False):
+    """Returns the part of the step dx that survives clipping to the allowed range, so that components pinned at a
+    bound do not count as unconverged. Non-finite steps are returned as they are."""
+    return jnp.where(jnp.all(jnp.isfinite(dx)), take_step(X, dx, nonnegative, log_variables) - X, dx)
+
+
+def log_step(logX, dX):
+    """Maps a step dX in the quantities X = exp(logX) to the change in logX, limiting the decrease in a single step to
+    a factor LOG_STEP_FLOOR"""
+    return jnp.log(jnp.maximum(1 + dX * jnp.exp(-logX), LOG_STEP_FLOOR))
+
+
+def backtrack(simplified_step, X, dx, nonnegative, rtol=0, log_variables=False):
+    """
+    Backtracking line search on the Newton step dx, using an Armijo-type sufficient decrease condition on the natural
+    level function: the step fraction alpha is halved until the simplified Newton correction at X + alpha dx (i.e.
+    computed with the Jacobian at X) is smaller than (1 - ARMIJO_C alpha) times the Newton correction at X, or already
+    within the tolerance. Corrections are measured relative to X, so that the test is insensitive to the scaling of
+    the equations and unknowns.
+
+    Parameters
+    ----------
+    simplified_step: callable
+        Function returning the simplified Newton correction at a given point
+    X: array_like
+        Shape (n,) current iterate
+    dx: array_like
+        Shape (n,) Newton step at X
+    nonnegative: bool
+        Whether the iterates are constrained to be positive
+    rtol: float, optional
+        Relative tolerance: steps to a point where the relative correction is below this are always accepted, so
+        that round-off near convergence does not trigger backtracking
+    log_variables: bool, optional
+        Whether X holds the logarithms of the quantities, in which case the corrections are still in the quantities
+        themselves, and steps are taken with log_step
+
+    Returns
+    -------
+    alpha: float
+        The accepted step fraction, or the smallest one tried if none passed the test
+    """
+    scale = (jnp.exp(X) if log_variables else jnp.abs(X)) + SMALL
+    level = jnp.max(jnp.abs(dx) / scale)
+
+    def rejected(alpha):
+        step = log_step(X, alpha * dx) if log_variables else alpha * dx
+        dx_bar = simplified_step(take_step(X, step, nonnegative, log_variables))
+        level_new = jnp.max(jnp.abs(dx_bar) / scale)
+        return ~(level_new <= jnp.maximum((1 - ARMIJO_C * alpha) * level, rtol))  # also rejects non-finite values
+
+    def halve(arg):
+        alpha, k, _ = arg
+        return 0.5 * alpha, k + 1, rejected(0.5 * alpha)
+
+    alpha = jnp.ones((), X.dtype)
+    if nonnegative and not log_variables:  # fraction-to-boundary rule: do not start out by stepping onto the bound
+        alpha = jnp.minimum(alpha, BOUNDARY_FRACTION * jnp.min(jnp.where(dx < 0, X / -dx, 1.0)))
+    alpha, _, _ = jax.lax.while_loop(
+        lambda arg: arg[2] & (arg[1] < MAX_BACKTRACKS), halve, (alpha, jnp.zeros((), int), rejected(alpha))
+    )
+    return alpha
+
+
+def factorization(linsolve=None, method="chord"):
+    """
+    Returns the functions used to factorize a Jacobian once and then solve with it repeatedly
+
+    Parameters
+    ----------
+    linsolve: callable, optional
+        The linear solver: if it exposes separate linsolve.factor and linsolve.backsolve stages (e.g. those from
+        sparse_lu_solver) these are used, otherwise the Jacobian itself is stored and linsolve called on every solve
+    method: str, optional
+        "chord" to store a factorization of J, or "broyden" to store its inverse
+
+    Returns
+    -------
+    factor: callable
+        Function factor(J) returning the factorization
+    backsolve: callable
+        Function backsolve(factors, b) returning the solution of J x = b
+    refactors: bool
+        Whether backsolve refactorizes on every call
+    """
+    if method == "broyden":
+        return jnp.linalg.inv, lambda H, b: H @ b, False
+    if linsolve is None:
+        return jax.scipy.linalg.lu_factor, lambda lu, b: jax.scipy.linalg.lu_solve(lu, b), False
+    if hasattr(linsolve, "factor"):
+        return linsolve.factor, linsolve.backsolve, False
+    return (lambda J: J), linsolve, True
+
+
+def broyden_update(H, s, y):
+    """Broyden's ("good") rank-one update of an inverse Jacobian H, given the step s and the change y in f"""
+    Hy = H @ y
+    denom = s @ Hy
+    ok = jnp.isfinite(denom) & (jnp.abs(denom) > SMALL)
+    return jnp.where(ok, H + jnp.outer(s - Hy, s @ H) / jnp.where(ok, denom, 1.0), H)
+
+
+@partial(
+    jax.jit,
+    static_argnames=(
+        "func",
+        "jacfunc",
+        "tolfunc",
+        "rtol",
+        "atol",
+        "careful_steps",
+        "nonnegative",
+        "linsolve",
+        "method",
+        "jac_reuse",
+        "contraction",
+        "line_search",
+        "log_variables",
+    ),
+)
+def newton_iterate(
+    func,
+    X,
+    dx,
+    num_iter,
+    counts,
+    params,
+    iter_limit,
+    jacfunc=None,
+    tolfunc=None,
+    rtol=1e-6,
+    atol=0,
+    careful_steps=1,
+    nonnegative=False,
+    linsolve=None,
+    method="newton",
+    jac_reuse=5,
+    contraction=0.5,
+    line_search=False,
+    log_variables=False,
+):
+    """
+    Advances a batch of Newton iterations for the system f(X,p) = 0 from a given state, until each either converges or
+    reaches its iteration limit. This is the kernel of newton_rootsolve, exposed so that the iteration can be stopped
+    and resumed.
+
+    Parameters
+    ----------
+    func: callable
+        A JAX function of signature f(X,params) that implements the function we wish to rootfind
+    X: array_like
+        Shape (N,n) array of current iterates, or their logarithms if log_variables
+    dx: array_like
+        Shape (N,n) array of the last Newton steps taken
+    num_iter: array_like
+        Shape (N,) array of the number of iterations taken so far
+    counts: array_like
+        Shape (N,2) array of the number of Jacobian evaluations and factorizations so far
+    params: array_like
+        Shape (N,n_p) array of parameters
+    iter_limit: array_like
+        Shape (N,) array of the number of iterations at which to stop
+    jacfunc, tolfunc, rtol, atol, careful_steps, nonnegative, linsolve, method, jac_reuse, contraction, line_search,
+    log_variables:
+        As for newton_rootsolve
 
+    Returns
+    -------
+    X, dx, num_iter, counts: array_like
+        The new state of the iteration
+    converged: array_like
+        Shape (N,) boolean array: whether the iteration has converged
+    """
     if jacfunc is None:
         jac = jax.jacfwd(func)
+    else:
+        jac = jacfunc
 
     if tolfunc is None:
 
         def tolfunc(X, *params):
             return X
 
+    if log_variables:  # iterate on ln(X), evaluating everything at X
+
+        def of_logX(f):
+            return lambda logX, *params: f(jnp.exp(logX), *params)
+
+        func, jac, tolfunc = of_logX(func), of_logX(jac), of_logX(tolfunc)
+        step_map = log_step
+    else:
+
+        def step_map(X, dx):
+            return dx
+
     # if maxfunc is None:
 
     #     def maxfunc(X, *params):
     #         return jnp.repeat(jnp.inf, len(X))
 
-    def solve(guess, params):
+    def not_done(X, dx, num_iter, params):
+        return unconverged(X, dx, num_iter, params, tolfunc, rtol, careful_steps, atol, log_variables)
+
+    if method in ("chord", "broyden"):
+        return quasi_newton_iterate(
+            func,
+            jac,
+            not_done,
+            X,
+            dx,
+            num_iter,
+            counts,
+            params,
+            iter_limit,
+            careful_steps=careful_steps,
+            nonnegative=nonnegative,
+            log_variables=log_variables,
+            step_map=step_map,
+            factorization=factorization(linsolve, method),
+            method=method,
+            jac_reuse=jac_reuse,
+            contraction=contraction,
+        )
+    elif method != "newton":
+        raise ValueError(f"Unrecognized Newton method {method}")
+
+    if line_search:  # the line search takes the place of the careful steps
+        factor, backsolve, _ = factorization(linsolve)
+        careful_steps = 1
+
+    if linsolve is None:
+        linsolve = jnp.linalg.solve
+
+    def solve(X, dx, num_iter, params, limit):
         """Function to be called in parallel that solves the root problem for one guess and set of parameters"""
 
         def iter_condition(arg):
             """Iteration condition for the while loop: check if we are within desired tolerance."""
             X, dx, num_iter = arg
-            fac = jnp.min(jnp.array([(num_iter + 1.0) / careful_steps, 1.0]))
-            tol2, tol1 = tolfunc(X, *params), tolfunc(X - dx, *params)
-            tolcheck = jnp.any(jnp.abs(tol1 - tol2) > rtol * jnp.abs(tol1) * fac)
-            return jnp.any(jnp.abs(dx) > fac * rtol * jnp.abs(X)) & (num_iter < max_iter) & tolcheck
+            return not_done(X, dx, num_iter, params) & (num_iter < limit)
 
         def X_new(arg):
             """Returns the next Newton iterate and the difference from previous guess."""
             X, _, num_iter = arg
-            fac = jnp.min(jnp.array([(num_iter + 1.0) / careful_steps, 1.0]))
+            fac = step_factor(num_iter, careful_steps)
             J = jac(X, *params)
             #  condition number is nice but possibly very slow due to batching, e.g. https://github.com/jax-ml/jax/issues/11321
             # there is no reason for this from a pure FLOPS standpoint!
             #            cond = jsp.linalg.cond(J)  # , p=2)
             #            dx = jnp.where(cond < 1e30, -jnp.linalg.solve(J, func(X, *params)) * fac, jnp.zeros_like(X))
-            dx = -jnp.linalg.solve(J, func(X, *params)) * fac
-            dx_finite = jnp.all(jnp.isfinite(dx))
+            if line_search:
+                lu = factor(J)
+                dx = -backsolve(lu, func(X, *params))
+                alpha = backtrack(lambda X: -backsolve(lu, func(X, *params)), X, dx, nonnegative, rtol, log_variables)
+                X_new = take_step(X, step_map(X, alpha * dx), nonnegative, log_variables)
+                return X_new, projected_step(X, step_map(X, dx), nonnegative, log_variables), num_iter + 1
+            dx = step_map(X, -linsolve(J, func(X, *params)) * fac)
             #            upper = maxfunc(X, *params)
-            Xnew = jnp.where(dx_finite, jnp.where(nonnegative, (X + dx).clip(SMALL), (X + dx).clip(-BIG, BIG)), X)
-            return Xnew, dx, num_iter + 1
+            return take_step(X, dx, nonnegative, log_variables), dx, num_iter + 1
+
+        X, dx, num_iter_new = jax.lax.while_loop(iter_condition, X_new, (X, dx, num_iter))
+        return X, dx, num_iter_new, ~not_done(X, dx, num_iter_new, params)
 
-        init_val = guess, 100 * guess, 0
-        X, _, num_iter = jax.lax.while_loop(iter_condition, X_new, init_val)
+    X, dx, num_iter_new, converged = jax.vmap(solve)(X, dx, num_iter, params, iter_limit)
+    counts = counts + (num_iter_new - num_iter)[:, None]  # one Jacobian and one factorization per iteration
+    return X, dx, num_iter_new, counts, converged
 
-        return X, num_iter
 
-    X, num_iter = jax.vmap(solve)(guesses, params)
+def quasi_newton_iterate(
+    func,
+    jac,
+    not_done,
+    X,
+    dx,
+    num_iter,
+    counts,
+    params,
+    iter_limit,
+    careful_steps,
+    nonnegative,
+    log_variables,
+    step_map,
+    factorization,
+    method,
+    jac_reuse,
+    contraction,
+):
+    """
+    Chord/Broyden counterpart of the iteration in newton_iterate, reusing the last Jacobian evaluated. The loop runs
+    over the whole batch rather than being vmapped, so that the Jacobian is only evaluated (under a lax.cond) on
+    iterations where some entry actually needs a fresh one - under vmap both branches of a cond would be evaluated.
+    A small step taken with a stale Jacobian does not imply convergence, so convergence is only accepted after a step
+    with a freshly-evaluated Jacobian.
+    """
+    factor, backsolve, refactors = factorization
+    f = jax.vmap(lambda X, p: func(X, *p))
+    unconverged_entries = jax.vmap(not_done)
+
+    def active_entries(X, dx, num_iter, age):
+        return (unconverged_entries(X, dx, num_iter, params) | (age != 1)) & (num_iter < iter_limit)
+
+    def refresh_factors(X, refresh, factors):
+        new = jax.vmap(factor)(jax.vmap(lambda X, p: jac(X, *p))(X, params))
+        return jax.tree.map(lambda a, b: jnp.where(refresh.reshape((-1,) + (1,) * (a.ndim - 1)), a, b), new, factors)
+
+    def condition(state):
+        X, dx, num_iter, _, _, age = state[:6]
+        return jnp.any(active_entries(X, dx, num_iter, age))
+
+    def body(state):
+        X, dx, num_iter, counts, factors, age, fnorm, F_old, s = state
+        unconverged = unconverged_entries(X, dx, num_iter, params)
+        active = (unconverged | (age != 1)) & (num_iter < iter_limit)
+        F = f(X, params)
+        fnorm_new = jnp.linalg.norm(F, axis=1)
+        refresh = active & ((age >= jac_reuse) | ~(fnorm_new < contraction * fnorm) | ~unconverged)
+        if method == "broyden":
+            update = active & ~refresh
+            factors = jnp.where(update[:, None, None], jax.vmap(broyden_update)(factors, s, F - F_old), factors)
+        factors = jax.lax.cond(jnp.any(refresh), refresh_factors, lambda X, r, factors: factors, X, refresh, factors)
+        counts = counts + jnp.stack([refresh, refresh | (active & refactors)], axis=1)
+
+        fac = jax.vmap(step_factor, (0, None))(num_iter, careful_steps)
+        dx_new = step_map(X, -jax.vmap(backsolve)(factors, F) * fac[:, None])
+        X_new = jax.vmap(partial(take_step, nonnegative=nonnegative, log_variables=log_variables))(X, dx_new)
+        a = active[:, None]
+        return (
+            jnp.where(a, X_new, X),
+            jnp.where(a, dx_new, dx),
+            num_iter + active,
+            counts,
+            factors,
+            jnp.where(refresh, 1, age + active),
+            jnp.where(active, fnorm_new, fnorm),
+            jnp.where(a, F, F_old),
+            jnp.where(a, jnp.exp(X_new) - jnp.exp(X) if log_variables else X_new - X, s),  # step in X for Broyden
+        )
+
+    N, n = X.shape
+    factors = jax.tree.map(
+        lambda a: jnp.zeros((N,) + a.shape, a.dtype), jax.eval_shape(factor, jnp.zeros((n, n), X.dtype))
+    )
+    state = (X, dx, num_iter, counts, factors, jnp.full(N, jac_reuse), jnp.full(N, jnp.inf, X.dtype), X, X)
+    X, dx, num_iter, counts, _, age = jax.lax.while_loop(condition, body, state)[:6]
+    return X, dx, num_iter, counts, ~unconverged_entries(X, dx, num_iter, params) & (age == 1)
+
+
+def compacting_rootsolve(
+    func,
+    guesses,
+    params=[],
+    jacfunc=None,
+    tolfunc=None,
+    rtol=1e-6,
+    atol=0,
+    max_iter=100,
+    careful_steps=1,
+    nonnegative=False,
+    return_num_iter=False,
+    iters_per_round=10,
+    buckets="pow2",
+    mask=None,
+    linsolve=None,
+    method="newton",
+    jac_reuse=5,
+    contraction=0.5,
+    return_stats=False,
+    line_search=False,
+    log_variables=False,
+):
+    """
+    Solve the system f(X,p) = 0 for X like newton_rootsolve, but in rounds of a fixed number of iterations, after each
+    of which the entries that have not yet converged are compacted into a smaller batch. Under vmap every entry in a
+    batch iterates until the slowest one has converged, so this makes the total work scale with the typical number of
+    iterations rather than the maximum. With method="chord" or "broyden", the Jacobian is re-evaluated at the start of
+    each round.
+
+    Parameters
+    ----------
+    func, guesses, params, jacfunc, tolfunc, rtol, atol, max_iter, careful_steps, nonnegative, return_num_iter:
+        As for newton_rootsolve
+    linsolve, method, jac_reuse, contraction, return_stats, line_search, log_variables:
+        As for newton_rootsolve
+    iters_per_round: int, optional
+        Number of Newton iterations to take between compactions of the batch (default: 10)
+    buckets: str or iterable, optional
+        Allowed batch sizes that the compacted batches are padded up to, to limit recompilation: either "pow2" for
+        powers of 2, or an iterable of allowed batch sizes (default: "pow2")
+    mask: array_like, optional
+        Shape (N,) boolean array: entries where this is False (e.g. padding) are not iterated and are returned as the
+        initial guess
+
+    Returns
+    -------
+    X: array_like
+        Shape (N,n) array of solutions
+    """
+    X, params = prepare_inputs(guesses, params, nonnegative, log_variables)
+    N = X.shape[0]
+    dx = initial_step(X, log_variables)
+    num_iter = jnp.zeros(N, dtype=int)
+    counts = jnp.zeros((N, 2), dtype=int)
+    active = np.arange(N) if mask is None else np.flatnonzero(np.asarray(mask))
+
+    while len(active):
+        n = len(active)
+        size = max(bucket_size(n, buckets), n)
+        # pad with an out-of-bounds index: gathers clamp it to a valid entry, scatters drop it
+        idx = jnp.asarray(np.concatenate([active, np.full(size - n, N)]))
+        limit = jnp.where(np.arange(size) < n, jnp.minimum(num_iter[idx] + iters_per_round, max_iter), 0)
+        X_a, dx_a, num_iter_a, counts_a, converged = newton_iterate(
+            func,
+            X[idx],
+            dx[idx],
+            num_iter[idx],
+            counts[idx],
+            params[idx],
+            limit,
+            jacfunc=jacfunc,
+            tolfunc=tolfunc,
+            rtol=rtol,
+            atol=atol,
+            careful_steps=careful_steps,
+            nonnegative=nonnegative,
+            linsolve=linsolve,
+            method=method,
+            jac_reuse=jac_reuse,
+            contraction=contraction,
+            line_search=line_search,
+            log_variables=log_variables,
+        )
+        X = X.at[idx].set(X_a, mode="drop")
+        dx = dx.at[idx].set(dx_a, mode="drop")
+        num_iter = num_iter.at[idx].set(num_iter_a, mode="drop")
+        counts = counts.at[idx].set(counts_a, mode="drop")
+        still_active = np.array(~converged & (num_iter_a < max_iter))[:n]
+        active = active[still_active]
+
+    if log_variables:
+        X = jnp.exp(X)
+    result = (X,)
     if return_num_iter:
-        return X, num_iter
-    else:
-        return X
+        result += (num_iter,)
+    if return_stats:
+        result += (solver_stats(counts),)
+    return result if len(result) > 1 else X
+
+
+def chunked_rootsolve(
+    func,
+    guesses,
+    params=[],
+    chunk_size="auto",
+    memory_budget=2**30,
+    return_num_iter=False,
+    **kwargs,
+):
+    """
+    Solve the system f(X,p) = 0 for X like newton_rootsolve, but streaming the inputs through the solver in chunks of
+    fixed size so that the memory used by the batched Jacobians and intermediates stays bounded, e.g. for solving
+    10^7 cells at once. Host-to-device transfer of each chunk overlaps with computation on the previous one, and the
+    results are written into preallocated host arrays.
+
+    Parameters
+    ----------
+    func, guesses, params, return_num_iter:
+        As for newton_rootsolve
+    chunk_size: int or str, optional
+        Number of entries per chunk, or "auto" to choose the largest power of 2 that fits in memory_budget
+    memory_budget: int, optional
+        Memory budget in bytes used to choose the chunk size automatically (default: 1GiB)
+    **kwargs:
+        Further keyword arguments passed to newton_rootsolve
+
+    Returns
+    -------
+    X: numpy.ndarray
+        Shape (N,n) array of solutions
+    """
+    guesses, params = np.asarray(guesses), np.asarray(params)
+    if guesses.ndim < 2:
+        guesses = np.atleast_2d(guesses).T
+    if params.ndim < 2:
+        params = np.atleast_2d(params).T
+
+    @jax.jit
+    def solve(guesses, params, mask):
+        return newton_rootsolve(func, guesses, params, return_num_iter=return_num_iter, mask=mask, **kwargs)
+
+    if chunk_size == "auto":
+        chunk_size = auto_chunk_size(solve, (guesses, params), memory_budget)
+    return stream_batches(solve, (guesses, params), min(chunk_size, len(guesses)))
@@ -0,0 +1,314 @@
+"""Routines for exploiting the structural sparsity of Jacobians: column coloring for compressed forward-mode
+Jacobians, and LU factorization with a fixed pivot sequence and fill-in pattern determined once from the sparsity
+pattern, so that only the structurally-nonzero entries are ever touched"""
+
+import itertools
+import numpy as np
+import jax
+from jax import numpy as jnp
+
+PIVOT_THRESHOLD = 1e-3  # sparse_lu_solver falls back to a dense solve for pivots smaller than this relative to J
+LU_SEGMENTS = 8  # sparse_lu_solver runs its elimination steps in at most this many loops, padded to a common size
+
+
+def column_coloring(pattern) -> np.ndarray:
+    """
+    Greedily colors the columns of a sparsity pattern so that no two columns of the same color share a nonzero row.
+    The columns of each color can then be differentiated with a single Jacobian-vector product.
+
+    Parameters
+    ----------
+    pattern: array_like
+        Shape (m,n) boolean array of structurally nonzero entries
+
+    Returns
+    -------
+    colors: numpy.ndarray
+        Shape (n,) integer array of column colors, numbered from 0
+    """
+    pattern = np.asarray(pattern, dtype=bool)
+    n = pattern.shape[1]
+    colors = np.full(n, -1)
+    # color the densest columns first, which tends to need fewer colors
+    for j in np.argsort(-pattern.sum(0), kind="stable"):
+        neighbors = pattern[pattern[:, j]].any(0)  # columns sharing a row with j
+        taken = set(colors[neighbors & (colors >= 0)])
+        colors[j] = next(c for c in range(n) if c not in taken)
+    return colors
+
+
+def sparse_jacfwd(func, pattern):
+    """
+    Returns a function computing the Jacobian of func with one forward-mode JVP per column color instead of per
+    column, for a Jacobian with the given sparsity pattern.
+
+    Parameters
+    ----------
+    func: callable
+        Function of signature func(X, *params) returning an array of shape (m,), for X of shape (n,)
+    pattern: array_like
+        Shape (m,n) boolean array of structurally nonzero entries of the Jacobian
+
+    Returns
+    -------
+    jac: callable
+        Function of signature jac(X, *params) returning the shape (m,n) Jacobian
+    """
+    pattern = np.asarray(pattern, dtype=bool)
+    colors = column_coloring(pattern)
+    seeds = np.eye(colors.max() + 1)[colors]  # shape (n, num_colors)
+    rows, cols = np.nonzero(pattern)
+
+    def jac(X, *params):
+        def jvp(seed):
+            return jax.jvp(lambda x: func(x, *params), (X,), (seed.astype(X.dtype),))[1]
+
+        compressed = jax.vmap(jvp, in_axes=1, out_axes=1)(jnp.asarray(seeds))
+        return jnp.zeros(pattern.shape, X.dtype).at[rows, cols].set(compressed[rows, colors[cols]])
+
+    return jac
+
+
+def structural_matching(pattern) -> np.ndarray:
+    """
+    Finds a row permutation that puts a structural nonzero on every diagonal entry of a square sparsity pattern,
+    by maximum bipartite matching of rows to columns. Diagonal entries are kept where possible, since a system is
+    usually written with each equation dominated by its own variable.
+
+    Parameters
+    ----------
+    pattern: array_like
+        Shape (n,n) boolean array of structurally nonzero entries
+
+    Returns
+    -------
+    rows: numpy.ndarray
+        Shape (n,) array such that pattern[rows[j], j] is True for all j
+    """
+    pattern = np.asarray(pattern, dtype=bool)
+    n = pattern.shape[0]
+    row_of_col = np.full(n, -1)
+
+    def augment(i, visited):
+        """Try to match row i, re-matching other rows along an augmenting path if necessary"""
+        candidates = np.flatnonzero(pattern[i])
+        for j in sorted(candidates, key=lambda j: j != i):  # try the diagonal first
+            if j in visited:
+                continue
+            visited.add(j)
+            if row_of_col[j] < 0 or augment(row_of_col[j], visited):
+                row_of_col[j] = i
+                return True
+        return False
+
+    for i in np.argsort(~pattern.diagonal(), kind="stable"):  # match the rows with a diagonal entry first
+        if not augment(i, set()):
+            raise ValueError("Jacobian sparsity pattern is structurally singular.")
+    return row_of_col
+
+
+def lu_ordering(pattern):
+    """
+    Chooses a fixed pivot sequence for LU factorization of a sparsity pattern and computes the resulting fill-in.
+    Rows are first permuted to put structural nonzeros on the diagonal, then diagonal pivots are chosen greedily to
+    minimize the Markowitz count (r-1)(c-1) at each step.
+
+    Parameters
+    ----------
+    pattern: array_like
+        Shape (n,n) boolean array of structurally nonzero entries
+
+    Returns
+    -------
+    rows: numpy.ndarray
+        Shape (n,) row permutation applied before the symmetric pivot permutation
+    order: numpy.ndarray
+        Shape (n,) pivot sequence
+    filled: numpy.ndarray
+        Shape (n,n) boolean pattern of the L and U factors of the permuted matrix, including fill-in
+    """
+    pattern = np.asarray(pattern, dtype=bool)
+    rows = structural_matching(pattern)
+    P = pattern[rows]
+    n = len(P)
+    remaining = list(range(n))
+    order = []
+    F = P.copy()
+    while remaining:
+        sub = F[np.ix_(remaining, remaining)]
+        markowitz = (sub.sum(1) - 1) * (sub.sum(0) - 1)
+        k = remaining.pop(int(np.argmin(markowitz)))
+        order.append(k)
+        below, right = [i for i in remaining if F[i, k]], [j for j in remaining if F[k, j]]
+        F[np.ix_(below, right)] = True
+    order = np.array(order, dtype=int)
+    return rows, order, F[np.ix_(order, order)]
+
+
+def padded_segments(sizes, max_segments=LU_SEGMENTS):
+    """
+    Splits a sequence of steps into at most max_segments contiguous segments, within which every step is padded to
+    the largest size in the segment, minimizing the total padded size by dynamic programming.
+
+    Parameters
+    ----------
+    sizes: array_like
+        Shape (n,) sizes of the steps
+    max_segments: int, optional
+        Maximum number of segments (default: LU_SEGMENTS)
+
+    Returns
+    -------
+    bounds: list
+        Boundaries [0, ..., n] of the segments
+    """
+    sizes = np.asarray(sizes)
+    n = len(sizes)
+    cost = np.full(n + 1, np.inf)  # cost[e]: least padded size of steps [0,e) with the segments so far
+    cost[0] = 0
+    splits = []
+    for _ in range(max_segments):
+        new_cost, split = cost.copy(), np.arange(n + 1)
+        for e in range(1, n + 1):
+            padded = cost[:e] + np.maximum.accumulate(sizes[e - 1 :: -1])[::-1] * (e - np.arange(e))
+            if padded.min() < new_cost[e]:
+                new_cost[e], split[e] = padded.min(), np.argmin(padded)
+        cost = new_cost
+        splits.append(split)
+    bounds = [n]
+    for split in reversed(splits):
+        if bounds[-1] > 0:
+            bounds.append(split[bounds[-1]])
+    return sorted(set(bounds) | {0})
+
+
+def custom_batched(func):
+    """
+    Wraps a function of batches of arrays, with the batch along the leading axis of every argument, as a function of
+    single arrays whose vmap calls the batched function directly, instead of batching every operation within it.
+
+    Parameters
+    ----------
+    func: callable
+        Function of batches of arrays returning a pytree of batches
+
+    Returns
+    -------
+    wrapped: callable
+        Function of single arrays, equivalent to func on a batch of one
+    """
+
+    @jax.custom_batching.custom_vmap
+    def wrapped(*args):
+        return jax.tree.map(lambda a: a[0], func(*jax.tree.map(lambda a: a[None], args)))
+
+    @wrapped.def_vmap
+    def rule(axis_size, in_batched, *args):
+        args = jax.tree.map(
+            lambda a, batched: a if batched else jnp.broadcast_to(a, (axis_size,) + a.shape), args, tuple(in_batched)
+        )
+        out = func(*args)
+        return out, jax.tree.map(lambda _: True, out)
+
+    return wrapped
+
+
+def sparse_lu_solver(pattern, pivot_threshold=PIVOT_THRESHOLD):
+    """
+    Returns a function solving J x = b for matrices with a given sparsity pattern, by LU factorization with a fixed
+    pivot sequence chosen from the pattern. Only the structurally-nonzero entries of the factors are stored, and each
+    elimination step only gathers the entries it updates, so the cost scales with the number of nonzeros in the
+    factors rather than n^3. The steps run in a few loops over index tables padded to a common size (see
+    padded_segments) rather than being unrolled, so the size of the traced computation does not grow with n. Under
+    vmap the factorization works on the whole batch at once, with the batch along the last axis of the stored
+    entries, so that every step operates on contiguous vectors.
+
+    Numerical pivoting is not done, so a pivot smaller than pivot_threshold times the largest entry in its column of
+    J is flagged by the factorization, and the system is then solved with jnp.linalg.solve instead. Under vmap the
+    dense solve is only done (under a lax.cond) for batches where some entry has a small pivot, so it costs nothing
+    as long as the diagonal pivots chosen from the pattern are sound, as is normally the case for chemistry Jacobians.
+
+    Parameters
+    ----------
+    pattern: array_like
+        Shape (n,n) boolean array of structurally nonzero entries
+    pivot_threshold: float, optional
+        Relative size below which a pivot is considered too small for the sparse factorization (default:
+        PIVOT_THRESHOLD)
+
+    Returns
+    -------
+    solve: callable
+        Function of signature solve(J, b) for J of shape (n,n) and b of shape (n,), returning x of shape (n,). The
+        two stages are also exposed as solve.factor(J), returning the nonzero entries of the LU factors together with
+        J and whether a pivot was small, and solve.backsolve(factors, b), so that a factorization can be reused.
+    """
+    rows, order, filled = lu_ordering(pattern)
+    n = len(order)
+    perm = rows[order]  # row i of the permuted system is row perm[i] of the original
+    entries = np.argwhere(filled)
+    nnz = len(entries)
+    # position of each entry of the factors in the stored entries, padded with an extra row and column of indices to a
+    # last, always-zero entry, so that padded index tables read zeros and write to an entry that is never used
+    index = np.full((n + 1, n + 1), nnz)
+    index[entries[:, 0], entries[:, 1]] = np.arange(nnz)
+    # at step k, the rows eliminated by the pivot row (the pivot row itself first) and the columns of the pivot row
+    below = [k + np.flatnonzero(filled[k:, k]) for k in range(n)]
+    right = [k + np.flatnonzero(filled[k, k:]) for k in range(n)]
+    segments = []
+    for start, end in itertools.pairwise(padded_segments([len(C) * len(U) for C, U in zip(below, right)])):
+        steps = np.arange(start, end)
+        width_C, width_U = max(len(below[k]) for k in steps), max(len(right[k]) for k in steps)
+        C = np.array([np.pad(below[k], (0, width_C - len(below[k])), constant_values=n) for k in steps])
+        U = np.array([np.pad(right[k], (0, width_U - len(right[k])), constant_values=n) for k in steps])
+        segments.append((steps, C, U))
+    diagonal = index[np.arange(n), np.arange(n)]
+
+    def factor(J):
+        """Returns the nonzero entries of the LU factors of a batch of matrices J (L below the diagonal, with unit
+        diagonal implied, and U above), J itself, and whether any pivot was too small"""
+
+        def step(a, block):
+            R = a[block]
+            L = R[1:, 0] / R[0, 0]
+            return a.at[block].set(R.at[1:, 1:].add(-L[:, None] * R[0, 1:]).at[1:, 0].set(L)), None
+
+        a = jnp.concatenate([J[:, perm[entries[:, 0]], order[entries[:, 1]]].T, jnp.zeros((1, len(J)), J.dtype)])
+        for _, C, U in segments:
+            a, _ = jax.lax.scan(step, a, index[C[:, :, None], U[:, None, :]])
+        sound = jnp.abs(a[diagonal]).T >= pivot_threshold * jnp.abs(J).max(1)[:, order]  # False for NaN pivots too
+        return a.T, J, ~jnp.all(sound, axis=1)
+
+    def backsolve(factors, b):
+        """Solves J x = b for a batch of J and b, given the factors of J returned by factor"""
+        a, J, small_pivot = factors
+        a = a.T
+
+        def forward(y, step):
+            k, C, L = step
+            return y.at[C].add(-a[L] * y[k]), None
+
+        def backward(x, step):
+            k, U, u, d = step
+            return x.at[k].set((y[k] - jnp.sum(a[u] * x[U], axis=0)) / a[d]), None
+
+        y = jnp.zeros((n + 1, len(b)), b.dtype).at[:n].set(b[:, perm].T)
+        for k, C, _ in segments:
+            y, _ = jax.lax.scan(forward, y, (k, C[:, 1:], index[C[:, 1:], k[:, None]]))
+        x = jnp.zeros_like(y)
+        for k, _, U in reversed(segments):
+            x, _ = jax.lax.scan(backward, x, (k, U[:, 1:], index[k[:, None], U[:, 1:]], diagonal[k]), reverse=True)
+        x = jnp.zeros_like(b).at[:, order].set(x[:n].T)
+
+        def dense_solve(x):
+            return jnp.where(small_pivot[:, None], jnp.linalg.solve(J, b[..., None])[..., 0], x)
+
+        return jax.lax.cond(jnp.any(small_pivot), dense_solve, lambda x: x, x)
+
+    factor, backsolve = custom_batched(factor), custom_batched(backsolve)
+
+    def solve(J, b):
+        return backsolve(factor(J), b)
+
+    solve.factor, solve.backsolve = factor, backsolve  # so that the factorization can be reused
+    return solve
@@ -0,0 +1,72 @@
+import numpy as np
+import jax, jax.numpy as jnp
+from ..batching import bucket_size, bucketed_batches, pad_batch, auto_chunk_size
+from ..solvers import newton_rootsolve
+
+
+def test_bucket_size():
+    """Check that batch sizes are rounded up to the correct buckets"""
+    assert [bucket_size(N) for N in (1, 2, 3, 1000, 1024, 1025)] == [1, 2, 4, 1024, 1024, 2048]
+    assert [bucket_size(N, (100, 10)) for N in (1, 10, 11, 1000)] == [10, 10, 100, 100]
+    assert [b for b in bucketed_batches(250, (10, 100))] == [(0, 100, 100), (100, 200, 100), (200, 250, 100)]
+
+
+def test_padded_rootsolve():
+    """Check that padding a batch and masking out the padding does not affect the solution"""
+    N = 1000
+    a = 0.1 + np.random.rand(N)
+    func = jax.jit(lambda x, *params: x**2 - params[0])
+    sol, num_iter = newton_rootsolve(func, jnp.ones(N), a, return_num_iter=True)
+
+    size = bucket_size(N)
+    mask = np.arange(size) < N
+    guesses = pad_batch(jnp.ones((N, 1)), size)
+    params = pad_batch(jnp.atleast_2d(a).T, size)
+    sol_padded, num_iter_padded = newton_rootsolve(func, guesses, params, mask=mask, return_num_iter=True)
+
+    assert sol_padded.shape == (size, 1)
+    assert np.all(sol_padded[:N] == sol)
+    assert np.all(num_iter_padded[N:] == 0)
+
+
+def test_chunked_rootsolve():
+    """Check that streaming a batch through the solver in chunks gives the same solution as solving it at once, that
+    the automatic chunk size respects the memory budget, and that an empty batch gives empty outputs"""
+    from ..solvers import chunked_rootsolve
+
+    N = 1000
+    a = 0.1 + np.random.rand(N)
+    func = jax.jit(lambda x, *params: x**2 - params[0])
+    sol = newton_rootsolve(func, jnp.ones(N), a)
+
+    sol_chunked, num_iter = chunked_rootsolve(func, np.ones(N), a, chunk_size=300, return_num_iter=True)
+    assert isinstance(sol_chunked, np.ndarray) and sol_chunked.shape == (N, 1) and num_iter.shape == (N,)
+    assert np.all(sol_chunked == sol)
+
+    solve = jax.jit(lambda g, p, mask: newton_rootsolve(func, g, p, mask=mask))
+    chunk_size = auto_chunk_size(solve, (np.ones((N, 1)), np.ones((N, 1))), memory_budget=2**12)
+    assert 1 < chunk_size < N
+    assert np.all(chunked_rootsolve(func, np.ones(N), a, memory_budget=2**12) == sol)
+
+    sol_empty, num_iter = chunked_rootsolve(func, np.ones((0, 1)), np.ones((0, 1)), return_num_iter=True)
+    assert sol_empty.shape == (0, 1) and num_iter.shape == (0,)
+
+
+def test_sharded_rootsolve():
+    """Check that sharding a batch across several host devices gives the same solution as solving it on one device,
+    in a subprocess, since the number of host devices is fixed when JAX starts up"""
+    import os, subprocess, sys
+
+    script = """
+import numpy as np, jax, jax.numpy as jnp
+from jaco.numerics import newton_rootsolve, batch_mesh
+a = 0.1 + np.random.default_rng(0).random(1001)
+func = jax.jit(lambda x, *params: x**2 - params[0])
+sol, num_iter = newton_rootsolve(func, jnp.ones(1001), a, return_num_iter=True)
+mesh = batch_mesh()
+sol_sharded, num_iter_sharded = newton_rootsolve(func, jnp.ones(1001), a, return_num_iter=True, mesh=mesh)
+assert mesh.size == 4 and sol_sharded.shape == (1001, 1)
+assert np.all(sol_sharded == sol) and np.all(num_iter_sharded == num_iter)
+"""
+    env = os.environ | {"XLA_FLAGS": "--xla_force_host_platform_device_count=4", "JAX_PLATFORMS": "cpu"}
+    subprocess.run([sys.executable, "-c", script], check=True, env=env)
@@ -0,0 +1,26 @@
+import numpy as np
+from ..bracketing import bracketed_newton, bisection_max_iter
+
+
+def test_bracketed_newton():
+    """Check that the safeguarded Newton iteration finds the roots of a - x^3 from poor starting points within the
+    iteration limit, including where the Newton steps alone would diverge or land where the function cannot be
+    evaluated, and gives up on entries whose bracket contains no root or whose function cannot be evaluated at all"""
+    a = np.array([1e-3, 1.0, 8.0, 1e3, -1.0, 2.0, 8.0])
+    x0 = np.array([10.0, 1e-6, 0.0, 0.1, 1.0, 1.0, 1.0])
+    evaluations = []
+
+    def evaluate(x, mask):
+        evaluations.append(mask.sum())
+        f = a - x**3
+        with np.errstate(divide="ignore"):
+            step = f / (3 * x**2)
+        f = np.where((np.arange(len(x)) == 5) | ((np.arange(len(x)) == 6) & (x > 3)), np.nan, f)
+        return f, step, np.ones(len(x), dtype=int)
+
+    lo, hi, xtol = np.zeros(len(a)), np.full(len(a), 20.0), 1e-8
+    x, cost, converged = bracketed_newton(evaluate, x0, lo, hi, xtol)
+    assert np.all(converged == [True, True, True, True, False, False, True])
+    assert np.allclose(x[[0, 1, 2, 3, 6]], np.cbrt(a[[0, 1, 2, 3, 6]]), rtol=1e-6)
+    assert len(evaluations) <= bisection_max_iter(lo, hi, xtol)
+    assert cost[5] == 1
@@ -0,0 +1,34 @@
+import numpy as np
+import jax
+from ..continuation import continuation_lines, continuation_sweep
+from ..solvers import newton_rootsolve
+
+
+def test_continuation_lines():
+    """Check that a grid is split into lines of fixed values of the other parameters, sorted along the continued one"""
+    a, b = np.meshgrid(np.arange(4.0), np.array([1.0, 2.0, 3.0]))
+    params = np.c_[a.ravel(), b.ravel()]
+    np.random.seed(0)
+    params = params[np.random.permutation(len(params))]
+
+    lines = continuation_lines(params, 0, reverse=True)
+    assert lines.shape == (3, 4)
+    assert np.all(params[lines, 0] == [3, 2, 1, 0])
+    assert np.all(params[lines, 1] == params[lines[:, :1], 1])
+
+
+def test_continuation_sweep():
+    """Check that continuation in the parameter of x^3 + x = a over a wide range converges to the solution, taking
+    intermediate steps when the warm-started solve is limited to a few iterations per step"""
+    a = np.logspace(0, 6, 20)
+    func = jax.jit(lambda x, *params: x**3 + x - params[0])
+
+    def solve(guesses, params, mask, max_iter=4):
+        return newton_rootsolve(func, guesses, params, mask=mask, rtol=1e-3, max_iter=max_iter, return_num_iter=True)
+
+    sol, num_iter, converged = continuation_sweep(
+        solve, np.ones((len(a), 1)), a[:, None], 0, max_iter=4, cold_solve=lambda *args: solve(*args, max_iter=100)
+    )
+    assert np.all(converged)
+    assert np.allclose(sol[:, 0] ** 3 + sol[:, 0], a, rtol=1e-4)
+    assert num_iter[1:].max() > 4  # some points needed intermediate steps
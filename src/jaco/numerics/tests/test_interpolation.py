@@ -0,0 +1,23 @@
+import numpy as np
+import jax, jax.numpy as jnp
+from ..interpolation import multilinear_interpolate
+
+
+def test_multilinear_interpolate():
+    """Check that multilinear interpolation reproduces a multilinear function exactly on an irregular grid, clamps
+    points off the grid to its edges, and gives the same result with numpy and jitted JAX"""
+    axes = [np.array([0.0, 0.5, 2.0, 3.0]), np.array([-1.0, 1.0, 4.0])]
+    X, Y = np.meshgrid(*axes, indexing="ij")
+    data = np.stack([1 + 2 * X - Y + 0.5 * X * Y, X * Y], axis=-1)
+
+    np.random.seed(0)
+    points = np.c_[3 * np.random.rand(100), -1 + 5 * np.random.rand(100)]
+    values = multilinear_interpolate(axes, data, points)
+    x, y = points.T
+    assert np.allclose(values, np.c_[1 + 2 * x - y + 0.5 * x * y, x * y])
+
+    outside = np.array([[-1.0, 0.0], [10.0, 10.0]])
+    assert np.allclose(multilinear_interpolate(axes, data, outside), [[1.0, 0.0], [9.0, 12.0]])
+
+    values_jax = jax.jit(lambda p: multilinear_interpolate(axes, data, p, xp=jnp))(points)
+    assert np.allclose(values_jax, values, rtol=1e-5, atol=1e-5)
@@ -30,5 +30,101 @@ def test_newton_rootsolve(N=10**5):
     assert jnp.all(jnp.isclose(sol[converged], exact[converged], rtol=1e-3, atol=0))
 
 
+def test_compacting_rootsolve(N=1000):
+    """Test: solving with compaction of the unconverged entries should give the same answers and iteration counts as
+    the plain vmapped solve, with much less total work than N * max(num_iter)"""
+    from jaco.numerics.solvers import compacting_rootsolve
+
+    p = 0.1 + np.random.rand(N) * 10
+    a = 0.1 + np.random.rand(N)
+    params = jnp.c_[p, a]
+    guess = jnp.ones(N)
+
+    def func(x, *params):
+        return x ** params[0] - params[1]
+
+    func = jax.jit(func)
+
+    sol, num_iter = newton_rootsolve(func, guess, params, nonnegative=True, return_num_iter=True)
+    sol2, num_iter2 = compacting_rootsolve(
+        func, guess, params, nonnegative=True, return_num_iter=True, iters_per_round=4, buckets=(100, 1000)
+    )
+    finite = jnp.all(jnp.isfinite(sol), axis=1)
+    assert jnp.all(num_iter == num_iter2)
+    assert jnp.all(jnp.isclose(sol[finite], sol2[finite], rtol=1e-5))
+
+
+def test_quasi_newton(N=1000):
+    """Test: chord and Broyden iterations should converge to the same solutions as Newton with fewer Jacobian
+    evaluations and factorizations"""
+    a = 0.1 + np.random.rand(N)
+
+    def func(x, *params):
+        return jnp.array([x[0] ** 3 - params[0], x[0] * x[1] - 1])
+
+    sol, stats = newton_rootsolve(func, jnp.ones((N, 2)), a, rtol=1e-5, return_stats=True)
+    for method in "chord", "broyden":
+        sol2, num_iter, stats2 = newton_rootsolve(
+            func, jnp.ones((N, 2)), a, rtol=1e-5, method=method, return_num_iter=True, return_stats=True
+        )
+        assert jnp.all(jnp.isclose(sol, sol2, rtol=1e-4))
+        assert jnp.all(stats2["num_factor"] <= num_iter)
+        assert stats2["num_jac"].mean() < stats["num_jac"].mean()
+        assert stats2["num_factor"].mean() < stats["num_factor"].mean()
+
+
+def test_line_search(N=1000):
+    """Test: with a line search, full Newton steps are taken when they make progress, so the iteration should need
+    fewer iterations than the careful-step ramp, both on average and in the worst case, and converge to the same
+    solutions"""
+    rng = np.random.default_rng(0)
+    p = 0.1 + rng.random(N) * 10
+    a = 0.1 + rng.random(N)
+    params = jnp.c_[p, a]
+    guess = jnp.ones(N)
+    exact = np.atleast_2d(a ** (1.0 / p)).T
+
+    def func(x, *params):
+        return x ** params[0] - params[1]
+
+    sol, num_iter = newton_rootsolve(func, guess, params, nonnegative=True, careful_steps=10, return_num_iter=True)
+    sol2, num_iter2 = newton_rootsolve(func, guess, params, nonnegative=True, line_search=True, return_num_iter=True)
+    assert jnp.all(jnp.isclose(sol2, exact, rtol=1e-4))
+    assert num_iter2.mean() < num_iter.mean()
+    assert num_iter2.max() <= num_iter.max()
+
+
+def test_log_variables(N=1000):
+    """Test: solve the linear equilibrium x = a for a spanning many orders of magnitude from a guess of 1 without
+    clipping, checking that the iterate stays positive"""
+    a = 10 ** np.linspace(-30, 10, N)
+    guess = jnp.ones(N)
+
+    def func(x, *params):
+        return 1 - x / params[0]
+
+    sol, num_iter = newton_rootsolve(func, guess, a, rtol=1e-4, log_variables=True, return_num_iter=True)
+    assert jnp.all(newton_rootsolve(func, guess, a, rtol=1e-4, log_variables=True) == sol)
+    assert jnp.all(jnp.isclose(sol[:, 0], a, rtol=1e-4))
+    assert num_iter.max() < 20
+
+
+def test_implicit_differentiation(N=100):
+    """Test: derivatives of the solution of x^p = a with respect to a, in forward and reverse mode, should match the
+    exact solution's"""
+    p = 0.5 + np.random.rand(N) * 3
+    a = 0.1 + np.random.rand(N)
+
+    def func(x, *params):
+        return x ** params[0] - params[1]
+
+    def solution(a):
+        return newton_rootsolve(func, jnp.ones(N), jnp.c_[p, a], nonnegative=True, rtol=1e-7)[:, 0]
+
+    exact = a ** (1 / p - 1) / p
+    assert jnp.allclose(jnp.diag(jax.jacfwd(solution)(a)), exact, rtol=1e-4)
+    assert jnp.allclose(jax.grad(lambda a: solution(a).sum())(a), exact, rtol=1e-4)
+
+
 if __name__ == "__main__":
     test_newton_rootsolve()
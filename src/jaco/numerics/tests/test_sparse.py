@@ -0,0 +1,52 @@
+from time import perf_counter
+import numpy as np
+import jax, jax.numpy as jnp
+from ..sparse import column_coloring, sparse_jacfwd, sparse_lu_solver
+
+
+def random_sparse_system(n=30, density=0.1, seed=0):
+    """Returns a random sparse, diagonally-dominant matrix and its sparsity pattern"""
+    rng = np.random.default_rng(seed)
+    pattern = (rng.random((n, n)) < density) | np.eye(n, dtype=bool)
+    J = np.where(pattern, rng.normal(size=(n, n)), 0) + n * np.eye(n)
+    return pattern, J
+
+
+def test_sparse_lu_solver():
+    """Check that the sparse LU solve agrees with a dense solve"""
+    pattern, J = random_sparse_system()
+    b = np.random.default_rng(1).normal(size=len(J))
+    solve = jax.jit(sparse_lu_solver(pattern))
+    x = solve(jnp.array(J), jnp.array(b))
+    assert np.allclose(x, np.linalg.solve(J, b), rtol=1e-4, atol=1e-6)
+
+
+def test_sparse_lu_solver_large():
+    """Check a batched sparse LU solve of a larger system against a dense solve, both with sound diagonal pivots and
+    with zero diagonal entries that need the dense fallback, and that the time to trace it stays bounded"""
+    n = 150
+    pattern, J = random_sparse_system(n, density=3 / n)
+    pattern[:3] = pattern[:, :3] = True  # a few dense rows and columns, as for electrons in a chemical network
+    swap = np.arange(n).reshape(-1, 2)[:, ::-1].ravel()  # interchanging pairs of rows zeroes the diagonal
+    rng = np.random.default_rng(1)
+    for pattern, J in (pattern, J), (pattern[swap] | np.eye(n, dtype=bool), J[swap]):
+        J = jnp.array(np.where(pattern, J, 0) * rng.uniform(0.5, 2, (16, 1, 1)), dtype=jnp.float32)
+        b = jnp.array(rng.normal(size=(16, n)), dtype=jnp.float32)
+        start = perf_counter()
+        solve = jax.jit(jax.vmap(sparse_lu_solver(pattern))).lower(J, b).compile()
+        assert perf_counter() - start < 30
+        assert np.allclose(solve(J, b), jnp.linalg.solve(J, b[..., None])[..., 0], rtol=1e-4, atol=1e-6)
+
+
+def test_sparse_jacfwd():
+    """Check that column coloring needs few colors for a banded Jacobian, and that the compressed Jacobian is exact"""
+    n = 21
+
+    def func(x, a):
+        return a * x**2 + jnp.roll(x, 1) * jnp.roll(x, -1)
+
+    jac_dense = jax.jacfwd(func)(jnp.arange(1.0, n + 1), 2.0)
+    pattern = np.array(jac_dense != 0)
+    assert column_coloring(pattern).max() + 1 == 3
+    jac_sparse = jax.jit(sparse_jacfwd(func, pattern))(jnp.arange(1.0, n + 1), 2.0)
+    assert np.all(jac_sparse == jac_dense)
@@ -1,5 +1,6 @@
 """Implementation of base Process class with methods for managing and solving systems of equations"""
 
+import sympy as sp
 from .symbols import n_, d_dt
 from .equation import Equation
 from .equation_system import EquationSystem
@@ -40,24 +41,49 @@ class Process:
         """Sum 2 processes together: define a new process whose rates are the sum of the input process"""
         if other == 0:  # necessary for native sum() routine to work
             return self
+        return Process.compose([self, other])
 
-        attrs_to_sum = "heat", "subprocesses", "network", "bibliography", "equations"  # all rates
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    @staticmethod
+    def compose(processes):
+        """
+        Sums a number of processes together, as sum(processes) does, but in time linear in the number of processes:
+        sum() adds them pairwise, rebuilding the network of every partial sum, whereas this gathers the rate terms of
+        all of the processes and builds each equation once. Use this to assemble large networks.
+
+        Parameters
+        ----------
+        processes: iterable
+            Processes to sum. Zeros are skipped, like the start value of sum().
+
+        Returns
+        -------
+        process: Process
+            Process whose rates, heat, network, subprocesses, bibliography and equations are the sums of those of the
+            input processes, or the input process itself if there is only one
+        """
+        processes = [p for p in processes if not (isinstance(p, int) and p == 0)]
+        if len(processes) == 1:
+            return processes[0]
 
         sum_process = Process()
         sum_process.rate = None  # "rate" ceases to be meaningful for composite processes
-        for summed_attr in attrs_to_sum:
-            attr1, attr2 = getattr(self, summed_attr), getattr(other, summed_attr)
-            if attr1 is None or attr2 is None:
+        for summed_attr in "heat", "subprocesses", "network", "bibliography", "equations":  # all rates
+            attrs = [getattr(p, summed_attr) for p in processes]
+            if any(attr is None for attr in attrs):
                 setattr(sum_process, summed_attr, None)
+            elif summed_attr == "heat":
+                sum_process.heat = sp.Add(*attrs)
+            elif summed_attr == "network":
+                sum_process.network = EquationSystem.compose(attrs)
             else:
-                setattr(sum_process, summed_attr, attr1 + attr2)
+                setattr(sum_process, summed_attr, [x for attr in attrs for x in attr])
 
-        sum_process.name = f"{self.name} + {other.name}"
+        sum_process.name = " + ".join(p.name for p in processes)
         return sum_process
 
-    def __radd__(self, other):
-        return self.__add__(other)
-
     def initialize_network(self):
         self.network = EquationSystem()  # this is a dict for which unknown keys are initialized to 0 by default
 
@@ -75,12 +101,13 @@ class Process:
     def solve(
         self,
         known_quantities,
-        guess,
+        guess=None,
         time_dependent=[],
         dt=None,
         verbose=False,
         tol=1e-3,
-        careful_steps=10,
+        careful_steps=None,
+        **options,
     ):
         """
         Solves the equations for a set of desired quantities given a set of known quantities
@@ -93,8 +120,9 @@ class Process:
             equilibrium. If T is not included, solve for thermochemical equilibrium.
         guess: dict, optional
             Dict of symbolic quantities and their values that will be plugged into the network solve as guesses for the
-            unknown quantities. Can be arrays if you want to substitute multiple values. Will default to trying sensible
-            guesses for recognized quantities.
+            unknown quantities. Can be arrays if you want to substitute multiple values. If no abundances are given,
+            they are guessed automatically, in which case only guesses for any other unknowns (e.g. T) need to be
+            given. Or a list of such dicts of alternative guesses to race (see racing_guesses).
         normalize_to_H: bool, optional
             Whether to return abundances normalized by the number density of H nucleons (default: True)
         reduce_network: bool, optional
@@ -103,14 +131,17 @@ class Process:
             Desired relative error in chemical abundances (default: 1e-3)
         careful_steps: int, optional
             Number of careful initial steps in the Newton solve before full step size is used - try increasing this if
-            your solve has trouble converging.
+            your solve has trouble converging. (default: 10, or 1 with log_variables=True)
+        **options:
+            Further solver options passed to CompiledSolver, e.g. buckets
 
         Returns
         -------
         soldict: dict
             Dict of solved quantities
         """
-
+        if careful_steps is None and not options.get("log_variables"):
+            careful_steps = 10
         return self.network.solve(
             known_quantities,
             guess,
@@ -119,12 +150,75 @@ class Process:
             careful_steps=careful_steps,
             dt=dt,
             verbose=verbose,
+            **options,
         )
 
-    def solver_functions(self, solve_vars, time_dependent=[], return_jac=False, return_dict=False):
+    def compile(
+        self,
+        knowns,
+        unknowns,
+        time_dependent=[],
+        tol=1e-3,
+        careful_steps=None,
+        verbose=False,
+        cache_dir=None,
+        **options,
+    ):
+        """
+        Returns a reusable, jitted numerical solver for the process network with a fixed signature of known
+        quantities, unknowns and time-dependent quantities. See EquationSystem.compile.
+
+        Parameters
+        ----------
+        knowns: iterable
+            Names of the quantities that will be specified numerically, e.g. "T", "n_Htot"
+        unknowns: iterable
+            Names of the quantities to solve for, e.g. "H+", "T"
+        time_dependent: list, optional
+            Names of the quantities whose time derivatives are retained
+        tol: float, optional
+            Desired relative error in chemical abundances (default: 1e-3)
+        careful_steps: int, optional
+            Number of careful initial steps in the Newton solve before full step size is used (default: 10, or 1 with
+            log_variables=True)
+        cache_dir: str, optional
+            Directory of the persistent on-disk cache of compiled solvers (default: JACO_CACHE_DIR environment
+            variable, if set)
+        **options:
+            Further solver options passed to CompiledSolver, e.g. buckets
+
+        Returns
+        -------
+        solver: CompiledSolver
+            Callable solver taking dicts of numerical knowns and guesses and returning the solution dict
+        """
+        if careful_steps is None and not options.get("log_variables"):
+            careful_steps = 10
+        return self.network.compile(
+            knowns,
+            unknowns,
+            time_dependent=time_dependent,
+            tol=tol,
+            careful_steps=careful_steps,
+            verbose=verbose,
+            cache_dir=cache_dir,
+            **options,
+        )
+
+    def initial_guesses(self, knowns, guesses={}, time_dependent=[]):
+        """Returns guesses for all of the abundances solved for given a set of known quantities. See
+        EquationSystem.initial_guesses."""
+        return self.network.initial_guesses(knowns, guesses, time_dependent)
+
+    def racing_guesses(self, knowns, guesses={}, time_dependent=[]):
+        """Returns a list of alternative guesses for all of the abundances solved for, to be raced against each other.
+        See EquationSystem.racing_guesses."""
+        return self.network.racing_guesses(knowns, guesses, time_dependent)
+
+    def solver_functions(self, solve_vars, time_dependent=[], return_jac=False, return_dict=False, auxiliary=False):
         """Returns the RHS of the system to solve and its Jacobian, applying simplifications"""
-        return self.network.solver_functions(solve_vars, time_dependent, return_jac, return_dict)
+        return self.network.solver_functions(solve_vars, time_dependent, return_jac, return_dict, auxiliary)
 
-    def generate_code(self, solve_vars, time_dependent=[], language="c", jac=True, cse=True):
+    def generate_code(self, solve_vars, time_dependent=[], language="c", jac=True, cse=True, auxiliary=False):
         """Generates numerical code that implements the system RHS and/or Jacobian in the specified language."""
-        return self.network.generate_code(solve_vars, time_dependent, language, jac, cse)
+        return self.network.generate_code(solve_vars, time_dependent, language, jac, cse, auxiliary)
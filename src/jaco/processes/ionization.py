@@ -81,7 +81,7 @@ def CollisionalIonization(species=None) -> Ionization:
     """
 
     if species is None:
-        return sum([CollisionalIonization(s) for s in collisional_ionization_rates], Process())
+        return Process.compose(CollisionalIonization(s) for s in collisional_ionization_rates)
 
     process = Ionization(species)
     process.name = f"Collisional Ionization of {species}"
@@ -42,7 +42,7 @@ def LineCoolingSimple(emitter: str, collider=None) -> NBodyProcess:
 
     if collider is None:  # if we haven't specified a collider, just take all of them and return the sum
         p = [LineCoolingSimple(emitter, c) for c in coeffs]
-        return sum(p)  # type: ignore # have to put a 0-process in here as start variable or it will try to add 0 + process
+        return Process.compose(p)
 
     process = NBodyProcess({emitter, collider})
     if collider not in line_cooling_coeffs[emitter]:
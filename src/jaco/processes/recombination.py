@@ -100,7 +100,7 @@ def GasPhaseRecombination(ion=None) -> Recombination:
         `Process` instance describing the gas-phase recombination process
     """
     if ion is None:
-        return sum([GasPhaseRecombination(s) for s in gasphase_recombination_rates], Process())
+        return Process.compose(GasPhaseRecombination(s) for s in gasphase_recombination_rates)
 
     process = Recombination(ion)
     process.name = f"Gas-phase recombination of {ion}"
@@ -64,12 +64,9 @@ def sanitize_symbols(expr):
     """
     if hasattr(expr, "__iter__"):  # if iterable call recursively until we get down to actual expressions
         expr = [sanitize_symbols(e) for e in expr]
-    else:
-        for s in expr.free_symbols:
-            if "+" in str(s):
-                expr = expr.subs(s, sp.Symbol(str(s).replace("+", "plus")))
-            if "-" in str(s):
-                expr = expr.subs(s, sp.Symbol(str(s).replace("-", "minus")))
+    else:  # rename all of the symbols at once, in a single traversal of the expression
+        renamed = {s: sp.Symbol(str(s).replace("+", "plus").replace("-", "minus")) for s in expr.free_symbols}
+        expr = expr.xreplace({s: r for s, r in renamed.items() if r != s})
     return expr
 
 
@@ -0,0 +1,336 @@
+"""Implementation of LookupTable: tabulation of equilibrium solutions and heating/cooling rates over a grid of known
+quantities, with fast multilinear interpolation queries and code generation for embedding a table in C"""
+
+import os
+import json
+import numpy as np
+import sympy as sp
+from importlib.metadata import version
+from .numerics import multilinear_interpolate
+from .compiled_solver import prescriptions
+from .symbols import sanitize_symbols
+
+
+def evaluate(expr, values: dict):
+    """
+    Evaluates an expression numerically, given the values of the quantities it depends on keyed by name, e.g. a
+    solution dict. Number densities n_X not given are computed from n_Htot and the abundance of X.
+    """
+    args = {}
+    for s in expr.free_symbols:
+        name = str(s)
+        species = name[2:] if name[:2] in ("x_", "n_") else None
+        if name in values:
+            args[s] = values[name]
+        elif name.startswith("x_") and species in values:
+            args[s] = values[species]
+        elif name.startswith("n_") and species in values:
+            args[s] = values["n_Htot"] * values[species]
+        elif name in prescriptions:
+            args[s] = prescriptions[name]
+        else:
+            raise ValueError(f"No value of {s} to evaluate {expr} with.")
+    return sp.lambdify(sanitize_symbols(list(args)), sanitize_symbols(expr))(*args.values())
+
+
+def c_identifier(name: str) -> str:
+    """Turns a quantity name into a valid C identifier, e.g. "He++" -> "Heplusplus" """
+    name = name.replace("+", "plus").replace("-", "minus")
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def c_array(values, fmt: str, per_line=8) -> str:
+    """Formats the values of a flat array as the body of a C array initializer"""
+    values = [format(v, fmt) for v in np.ravel(values)]
+    lines = [", ".join(values[i : i + per_line]) for i in range(0, len(values), per_line)]
+    return "{\n    " + ",\n    ".join(lines) + "\n}"
+
+
+class LookupTable:
+    """
+    Table of quantities on a rectilinear grid of known quantities, e.g. equilibrium abundances and the net heating rate
+    as functions of n_Htot and T, to be interpolated instead of solving the system for every cell.
+
+    Axes and quantities are stored and interpolated in log10 wherever they are positive over the whole grid, which is
+    far more accurate for quantities spanning many orders of magnitude. Queries off the grid are clamped to its edges.
+    Tables are normally obtained from LookupTable.generate or LookupTable.load.
+
+    Parameters
+    ----------
+    axes: dict
+        Dict of the names of the known quantities varied over the grid and their increasing 1D arrays of grid values
+    data: array_like
+        Shape (M_1, ..., M_d, q) array of the tabulated quantities, in the log10 space they are interpolated in where
+        log_quantities is True
+    quantities: list
+        Names of the q tabulated quantities
+    log_axes: list
+        Whether each axis is interpolated in log10
+    log_quantities: list
+        Whether each quantity is stored and interpolated in log10
+    """
+
+    def __init__(self, axes, data, quantities, log_axes, log_quantities):
+        self.axes = {k: np.asarray(v, dtype=np.float64) for k, v in axes.items()}
+        self.data = data
+        self.quantities = list(quantities)
+        self.log_axes = [bool(l) for l in log_axes]
+        self.log_quantities = [bool(l) for l in log_quantities]
+        self.grid_axes = [np.log10(a) if l else a for a, l in zip(self.axes.values(), self.log_axes)]
+
+    @classmethod
+    def from_values(cls, axes, values, dtype=np.float32):
+        """
+        Constructs a table from arrays of quantities tabulated on a grid
+
+        Parameters
+        ----------
+        axes: dict
+            Dict of the names of the known quantities varied over the grid and their increasing 1D arrays of values
+        values: dict
+            Dict of quantity names and their shape (M_1, ..., M_d) arrays of values on the grid
+        dtype: type, optional
+            Floating-point type to store the table in (default: float32)
+
+        Returns
+        -------
+        table: LookupTable
+        """
+        log_axes = [np.all(np.asarray(a) > 0) for a in axes.values()]
+        log_quantities = [np.all(np.asarray(v) > 0) for v in values.values()]
+        data = np.stack([np.log10(v) if l else v for v, l in zip(values.values(), log_quantities)], axis=-1)
+        return cls(axes, data.astype(dtype), list(values), log_axes, log_quantities)
+
+    @classmethod
+    def generate(cls, system, axes, guesses=None, knowns={}, quantities=None, dtype=np.float32, **options):
+        """
+        Solves a system on every point of a grid of known quantities and tabulates the solution
+
+        Parameters
+        ----------
+        system: Process or EquationSystem
+            The system to solve
+        axes: dict
+            Dict of the names of the known quantities varied over the grid and their increasing 1D arrays of values,
+            e.g. {"n_Htot": np.logspace(-2, 4, 61), "T": np.logspace(1, 8, 141)}
+        guesses: dict, optional
+            Dict of guesses for the unknowns, either for every point of the flattened grid or a single value for all of
+            them. Guesses for the abundances are generated automatically if not given.
+        knowns: dict, optional
+            Dict of further known quantities held fixed over the grid
+        quantities: list or dict, optional
+            Names of the quantities in the solution to tabulate, or dict of names and sympy expressions in terms of
+            the quantities of the solution and the knowns to tabulate. Defaults to the whole solution, plus the net
+            heating rate per unit volume "heat" if the system has a heat equation.
+        dtype: type, optional
+            Floating-point type to store the table in (default: float32)
+        **options:
+            Further options passed to solve, e.g. tol or continuation
+
+        Returns
+        -------
+        table: LookupTable
+        """
+        grids = np.meshgrid(*axes.values(), indexing="ij")
+        shape = grids[0].shape
+        N = grids[0].size
+        grid_knowns = {k: g.ravel() for k, g in zip(axes, grids)}
+        grid_knowns |= {k: np.broadcast_to(v, (N,)).astype(np.float64) for k, v in knowns.items()}
+        if guesses is not None:
+            guesses = {k: np.broadcast_to(v, (N,)).astype(np.float64) for k, v in guesses.items()}
+        sol = system.solve(grid_knowns, guesses, **options)
+
+        network = getattr(system, "network", system)
+        if quantities is None:
+            quantities = {k: k for k in sol if k not in grid_knowns}
+            if "heat" in network:
+                quantities["heat"] = network["heat"].rhs
+        elif not isinstance(quantities, dict):
+            quantities = {k: k for k in quantities}
+        values = grid_knowns | {k: np.asarray(v) for k, v in sol.items()}
+        tabulated = {}
+        for name, q in quantities.items():
+            value = values[q] if isinstance(q, str) else evaluate(q, values)
+            tabulated[name] = np.broadcast_to(value, (N,)).reshape(shape)
+        return cls.from_values(axes, tabulated, dtype)
+
+    @property
+    def shape(self):
+        """Shape of the grid"""
+        return self.data.shape[:-1]
+
+    def save(self, path: str):
+        """
+        Saves the table as a .npy array of the data, which can be memory-mapped by load, and a .json sidecar of the
+        axes and quantities
+
+        Parameters
+        ----------
+        path: str
+            Path of the table without extension
+        """
+        path = os.path.splitext(path)[0] if path.endswith(".npy") else path
+        np.save(path + ".npy", np.asarray(self.data))
+        metadata = {
+            "axes": {k: v.tolist() for k, v in self.axes.items()},
+            "quantities": self.quantities,
+            "log_axes": self.log_axes,
+            "log_quantities": self.log_quantities,
+            "jaco_version": version("jaco"),
+        }
+        with open(path + ".json", "w") as f:
+            json.dump(metadata, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str, mmap=True):
+        """
+        Loads a table saved with save
+
+        Parameters
+        ----------
+        path: str
+            Path of the table without extension
+        mmap: bool, optional
+            Whether to memory-map the data rather than reading it into memory (default: True)
+
+        Returns
+        -------
+        table: LookupTable
+        """
+        path = os.path.splitext(path)[0] if path.endswith(".npy") else path
+        with open(path + ".json") as f:
+            metadata = json.load(f)
+        data = np.load(path + ".npy", mmap_mode="r" if mmap else None)
+        return cls(metadata["axes"], data, metadata["quantities"], metadata["log_axes"], metadata["log_quantities"])
+
+    def interpolate(self, points, xp=np):
+        """
+        Interpolates all of the tabulated quantities to a set of points
+
+        Parameters
+        ----------
+        points: array_like
+            Shape (N,d) array of the values of the known quantities at each point, in the order of the axes
+        xp: module, optional
+            Array module to compute with: numpy, or jax.numpy to get a jittable and differentiable interpolation
+            (default: numpy)
+
+        Returns
+        -------
+        values: array_like
+            Shape (N,q) array of the tabulated quantities, in the order of quantities
+        """
+        points = xp.asarray(points)
+        points = xp.stack([xp.log10(points[:, i]) if l else points[:, i] for i, l in enumerate(self.log_axes)], 1)
+        values = multilinear_interpolate(self.grid_axes, self.data, points, xp)
+        log = xp.asarray(self.log_quantities)
+        return xp.where(log, 10 ** xp.where(log, values, 0), values)
+
+    def __call__(self, coords: dict, xp=np):
+        """
+        Interpolates the tabulated quantities to a set of points
+
+        Parameters
+        ----------
+        coords: dict
+            Dict of the names of the axes of the table and their arrays of values at each point
+        xp: module, optional
+            Array module to compute with: numpy or jax.numpy (default: numpy)
+
+        Returns
+        -------
+        values: dict
+            Dict of the tabulated quantities and their arrays of interpolated values
+        """
+        points = xp.stack([xp.atleast_1d(xp.asarray(coords[k], dtype=float)) for k in self.axes], 1)
+        values = self.interpolate(points, xp)
+        return {q: values[:, i] for i, q in enumerate(self.quantities)}
+
+    def generate_code(self, name="jaco_table", language="c"):
+        """
+        Generates source code embedding the table as static arrays, together with a function name_interpolate(x,
+        result) that interpolates all of the quantities to the point x, in the order of the axes, and writes them to
+        result, in the order of the quantities. Index macros give the positions of each axis and quantity. The data are
+        embedded as float or double to match the precision the table is stored in.
+
+        Parameters
+        ----------
+        name: str, optional
+            Prefix of the names of the arrays, macros and function (default: "jaco_table")
+        language: str, optional
+            Language to generate code for: only "c" (C99) is supported (default: "c")
+
+        Returns
+        -------
+        code: str
+            The generated source code
+        """
+        if language.lower() != "c":
+            raise ValueError(f"Code generation for lookup tables is not implemented for {language}")
+        NAME = name.upper()
+        d, q = len(self.axes), len(self.quantities)
+        blocks = [
+            f"/* Lookup table of {self.quantities} as a function of {list(self.axes)}\n\n"
+            f"This code was auto-generated by jaco v{version('jaco')} and is not intended to be modified or "
+            "maintained by human beings. */",
+            "#include <math.h>",
+            "\n".join(
+                [f"#define {NAME}_NUM_AXES {d}", f"#define {NAME}_NUM_QUANTITIES {q}"]
+                + [f"#define {NAME}_AXIS_{c_identifier(k)} {i}" for i, k in enumerate(self.axes)]
+                + [f"#define {NAME}_INDEX_{c_identifier(k)} {i}" for i, k in enumerate(self.quantities)]
+            ),
+            f"static const int {name}_shape[{d}] = {c_array(self.shape, 'd')};",
+            f"static const int {name}_log_axis[{d}] = {c_array(np.array(self.log_axes, int), 'd')};",
+            f"static const int {name}_log_quantity[{q}] = {c_array(np.array(self.log_quantities, int), 'd')};",
+        ]
+        for i, axis in enumerate(self.grid_axes):
+            blocks.append(f"static const double {name}_axis_{i}[{len(axis)}] = {c_array(axis, '.17g')};")
+        axes = ", ".join(f"{name}_axis_{i}" for i in range(d))
+        blocks.append(f"static const double *const {name}_axes[{d}] = {{{axes}}};")
+        ctype, fmt = ("double", ".17g") if self.data.dtype == np.float64 else ("float", ".9g")
+        blocks.append(f"static const {ctype} {name}_data[{np.size(self.data)}] = {c_array(self.data, fmt)};")
+        blocks.append(
+            f"""/* Interpolates the tabulated quantities multilinearly to the point x[{NAME}_NUM_AXES], clamped to the
+edges of the table, and writes them to result[{NAME}_NUM_QUANTITIES] */
+void {name}_interpolate(const double *x, double *result) {{
+    int index[{d}];
+    double weight[{d}];
+    for (int i = 0; i < {d}; i++) {{
+        const double *axis = {name}_axes[i];
+        const double xi = {name}_log_axis[i] ? log10(x[i]) : x[i];
+        int lo = 0, hi = {name}_shape[i] - 1;
+        while (hi - lo > 1) {{ /* bisect for the grid interval containing xi */
+            const int mid = (lo + hi) / 2;
+            if (axis[mid] <= xi) {{
+                lo = mid;
+            }} else {{
+                hi = mid;
+            }}
+        }}
+        const double w = (xi - axis[lo]) / (axis[lo + 1] - axis[lo]);
+        index[i] = lo;
+        weight[i] = w < 0 ? 0 : (w > 1 ? 1 : w);
+    }}
+    for (int k = 0; k < {q}; k++) {{
+        result[k] = 0;
+    }}
+    for (int corner = 0; corner < (1 << {d}); corner++) {{ /* sum over the corners of the enclosing cell */
+        double w = 1;
+        long offset = 0;
+        for (int i = 0; i < {d}; i++) {{
+            const int c = (corner >> ({d} - 1 - i)) & 1;
+            w *= c ? weight[i] : 1 - weight[i];
+            offset = offset * {name}_shape[i] + index[i] + c;
+        }}
+        for (int k = 0; k < {q}; k++) {{
+            result[k] += w * {name}_data[offset * {q} + k];
+        }}
+    }}
+    for (int k = 0; k < {q}; k++) {{
+        if ({name}_log_quantity[k]) {{
+            result[k] = pow(10, result[k]);
+        }}
+    }}
+}}"""
+        )
+        return "\n\n".join(blocks) + "\n"
@@ -0,0 +1,57 @@
+from jaco.processes import CollisionalIonization, GasPhaseRecombination
+from jaco.cache import system_hash
+import numpy as np
+import pytest
+import os
+
+
+def test_cache(tmp_path):
+    """Check that a solver saved to the on-disk cache is loaded for an identical system and gives the same answer"""
+    processes = [CollisionalIonization(s) for s in ("H", "He", "He+")] + [
+        GasPhaseRecombination(i) for i in ("H+", "He+", "He++")
+    ]
+    system = sum(processes)
+
+    Tgrid = np.logspace(3, 6, 100)
+    ones = np.ones_like(Tgrid)
+    knowns = {"T": Tgrid, "n_Htot": ones}
+    guesses = {"H+": 0.9 * ones, "He+": 1e-2 * ones, "He++": 1e-2 * ones}
+
+    solver = system.compile(knowns, guesses, cache_dir=tmp_path)
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".jax")]) == 1
+    sol = solver(knowns, guesses)
+
+    # an identical system built from scratch should hash the same and load from the cache
+    system2 = sum(
+        [CollisionalIonization(s) for s in ("H", "He", "He+")]
+        + [GasPhaseRecombination(i) for i in ("H+", "He+", "He++")]
+    )
+    assert system_hash(system.network, knowns, guesses) == system_hash(system2.network, knowns, guesses)
+    sol_cached = system2.compile(knowns, guesses, cache_dir=tmp_path)(knowns, guesses)
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".jax")]) == 1
+    for s in sol:
+        assert np.allclose(sol[s], sol_cached[s])
+
+    # a different system or signature should not
+    assert system_hash(system.network, knowns, guesses) != system_hash(system.network, knowns, guesses, tol=1e-4)
+    system2.network["H"] += 1
+    assert system_hash(system.network, knowns, guesses) != system_hash(system2.network, knowns, guesses)
+
+
+def test_cache_corrupted(tmp_path):
+    """Check that an unusable cache entry is ignored with a warning, and the solver is built from the equations"""
+    knowns = {"T": np.logspace(3, 6, 10), "n_Htot": np.ones(10)}
+    guesses = {"H+": 0.5 * np.ones(10)}
+
+    # a new system each time, so that the solver is not just returned from the in-memory cache
+    def compile_new():
+        return (CollisionalIonization("H") + GasPhaseRecombination("H+")).compile(knowns, guesses, cache_dir=tmp_path)
+
+    sol = compile_new()(knowns, guesses)
+    (path,) = tmp_path.glob("*.jax")
+    path.write_bytes(b"not an exported function")
+    with pytest.warns(UserWarning, match="could not be loaded"):
+        solver = compile_new()
+    sol_rebuilt = solver(knowns, guesses)
+    for s in sol:
+        assert np.allclose(sol[s], sol_rebuilt[s])
@@ -2,6 +2,8 @@ from jaco.processes.chemical_reaction import ChemicalReaction
 from jaco.processes.recombination import GasPhaseRecombination, gasphase_recombination_rates, mean_kinetic_energy
 import sympy as sp
 from jaco.symbols import T, n_
+from jaco.process import Process
+from functools import reduce
 
 
 def test_chemical_reaction():
@@ -24,5 +26,21 @@ def test_chemical_reaction():
     assert reaction2.network == GasPhaseRecombination("H+").network
 
 
+def test_compose():
+    """Check that composing processes in bulk gives the same process as adding them up pairwise"""
+    processes = [GasPhaseRecombination(s) for s in ("H+", "He+", "He++")] + [
+        ChemicalReaction("H + H -> H_2", 1e-17 * T**0.5, bibliography=["test"]),
+        ChemicalReaction("H_2 + e- -> H + H + e-", 1e-10 * sp.exp(-5e4 / T), bibliography=["test"]),
+    ]
+    composite = Process.compose(processes)
+    assert composite.network == reduce(lambda a, b: a + b, [p.network for p in processes])
+    assert composite.heat == sum(p.heat for p in processes)
+    assert composite.subprocesses == processes
+    assert composite.bibliography == sum((p.bibliography for p in processes), [])
+    assert composite.name == " + ".join(p.name for p in processes)
+    assert Process.compose([0, processes[0]]) is processes[0]
+    assert sum(processes).network == composite.network
+
+
 if __name__ == "__main__":
     test_chemical_reaction()
@@ -0,0 +1,347 @@
+from contextlib import nullcontext
+from jaco.processes import CollisionalIonization, GasPhaseRecombination
+import numpy as np
+import pytest
+
+
+def cie_system():
+    """Returns the collisional ionization equilibrium network of H and He that the solver options are tested on"""
+    processes = [CollisionalIonization(s) for s in ("H", "He", "He+")] + [
+        GasPhaseRecombination(i) for i in ("H+", "He+", "He++")
+    ]
+    return sum(processes)
+
+
+def cie_inputs(Tgrid, x_Hplus=0.9):
+    """Returns the known quantities and the guesses for solving the CIE network on a temperature grid"""
+    ones = np.ones_like(Tgrid)
+    return {"T": Tgrid, "n_Htot": ones}, {"H+": x_Hplus * ones, "He+": 1e-2 * ones, "He++": 1e-2 * ones}
+
+
+def test_compile():
+    """Check that a compiled solver is reused for solves with the same signature, reproduces the result of solve(),
+    and is invalidated when the system changes"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+
+    solver = system.compile(knowns, guesses)
+    assert system.compile(["n_Htot", "T"], ["He++", "He+", "H+"]) is solver
+
+    sol = system.solve(knowns, guesses)
+    assert system.compile(knowns, guesses) is solver
+    sol_compiled = solver(knowns, guesses)
+    for s in "H", "H+", "He", "He+", "He++", "e-":
+        assert np.allclose(sol[s], sol_compiled[s])
+
+    # different number of solves should reuse the same solver
+    sol_half = solver({k: v[::2] for k, v in knowns.items()}, {g: v[::2] for g, v in guesses.items()})
+    assert np.allclose(sol_half["He+"], sol["He+"][::2])
+
+    system.network["H"] += 0
+    assert system.compile(knowns, guesses) is not solver
+
+
+def test_buckets():
+    """Check that solving batches of varying size with bucketing gives the same answer as without, and only compiles
+    one executable per bucket"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+    sol = system.solve(knowns, guesses)
+
+    solver = system.compile(knowns, guesses, buckets=(16, 64))
+    for N in 3, 10, 40, 50, 100:
+        sol_bucketed = solver({k: v[:N] for k, v in knowns.items()}, {k: v[:N] for k, v in guesses.items()})
+        for s in sol:
+            assert sol_bucketed[s].shape == (N,)
+            assert np.allclose(sol[s][:N], sol_bucketed[s])
+    assert solver.rootsolve._cache_size() == 2
+
+
+def test_compacting():
+    """Check that solving with compaction of unconverged cells gives the same answer as the plain solve"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+    sol = system.solve(knowns, guesses)
+    sol_compacting = system.solve(knowns, guesses, iters_per_round=5, buckets=(10, 100))
+    for s in sol:
+        assert np.allclose(sol[s], sol_compacting[s])
+
+
+def test_chunked():
+    """Check that streaming the solve through in chunks gives the same answer as the plain solve, that the automatic
+    chunk size is not stored in place of the option, and that an empty batch gives empty solutions"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+    sol = system.solve(knowns, guesses)
+    for chunk_size in 32, "auto":
+        solver = system.compile(knowns, guesses, chunk_size=chunk_size, memory_budget=2**18)
+        sol_chunked = solver(knowns, guesses)
+        assert solver.chunk_size == chunk_size
+        for s in sol:
+            assert np.allclose(sol[s], sol_chunked[s])
+        sol_empty = solver(*cie_inputs(np.array([])))
+        assert all(sol_empty[s].shape == (0,) for s in sol)
+
+
+def test_symbolic_jacobian():
+    """Check that the symbolic Jacobian agrees with autodiff and gives the same solution"""
+    import jax
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+
+    solver_symbolic = system.compile(knowns, guesses, jacobian="symbolic")
+    solver_jacfwd = system.compile(knowns, guesses, jacobian="jacfwd")
+    X, params = solver_symbolic.numerical_inputs(knowns, guesses)
+    J_symbolic = jax.vmap(lambda x, p: solver_symbolic.jac_numerical(x, *p))(X, params)
+    J_jacfwd = jax.vmap(lambda x, p: jax.jacfwd(solver_symbolic.f_numerical)(x, *p))(X, params)
+    assert np.allclose(J_symbolic, J_jacfwd, rtol=1e-4, atol=0)
+
+    sol_symbolic, sol_jacfwd = solver_symbolic(knowns, guesses), solver_jacfwd(knowns, guesses)
+    for s in sol_jacfwd:
+        assert np.allclose(sol_symbolic[s], sol_jacfwd[s], rtol=1e-3)
+
+
+def test_sparse():
+    """Check that the sparse Jacobian and linear solve give the same solution as the dense ones, also when the sparse
+    factorization is reused by the chord method"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+
+    sol_dense = system.solve(knowns, guesses, sparse=False)
+    for options in dict(jacobian="symbolic"), dict(jacobian="jacfwd"), dict(method="chord", iters_per_round=5):
+        sol_sparse = system.solve(knowns, guesses, sparse=True, **options)
+        for s in sol_dense:
+            assert np.allclose(sol_sparse[s], sol_dense[s], rtol=1e-3, atol=1e-5)
+
+
+def test_chord():
+    """Check that reusing Jacobians with the chord method gives the same solution as Newton"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+
+    sol = system.solve(knowns, guesses)
+    sol_chord = system.solve(knowns, guesses, method="chord", iters_per_round=5)
+    for s in sol:
+        assert np.allclose(sol_chord[s], sol[s], rtol=1e-3, atol=1e-5)
+
+
+def test_line_search():
+    """Check that the line search converges to the same CIE solution in fewer iterations than the careful steps"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 1000))
+
+    num_iter, sols = {}, {}
+    for line_search in False, True:
+        solver = system.compile(knowns, guesses, line_search=line_search)
+        sols[line_search], num_iter[line_search], _ = solver.solve_arrays(*solver.numerical_inputs(knowns, guesses))
+    assert np.allclose(sols[True], sols[False], rtol=1e-3, atol=1e-5)
+    assert num_iter[True].mean() < num_iter[False].mean()
+    assert num_iter[True].max() <= num_iter[False].max()
+
+
+def test_log_variables():
+    """Check that solving in log abundances gives the same CIE solution in fewer iterations, without clipping"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 1000))
+
+    num_iter, sols = {}, {}
+    for log_variables in False, True:
+        solver = system.compile(knowns, guesses, log_variables=log_variables)
+        sols[log_variables], num_iter[log_variables], _ = solver.solve_arrays(*solver.numerical_inputs(knowns, guesses))
+    assert np.allclose(sols[True], sols[False], rtol=1e-3, atol=1e-5)
+    assert np.all(sols[True] > 0)
+    assert num_iter[True].mean() < num_iter[False].mean()
+
+
+def test_precision():
+    """Check that iterating in float32 and refining in float64 agrees with a float64 solve to within the tolerance, and
+    that this warns on CPU, where it is no faster"""
+    import jax
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+
+    sol32 = system.solve(knowns, guesses, precision="float32")
+    sol64 = system.solve(knowns, guesses, precision="float64")
+    with pytest.warns(UserWarning, match="CPU") if jax.default_backend() == "cpu" else nullcontext():
+        sol_mixed = system.solve(knowns, guesses, precision="mixed")
+    for s in guesses:
+        assert sol32[s].dtype == np.float32
+        assert sol_mixed[s].dtype == sol64[s].dtype == np.float64
+        assert np.allclose(sol_mixed[s], sol64[s], rtol=1e-3, atol=1e-20)
+
+
+def test_sensitivities():
+    """Check the implicitly-differentiated temperature derivatives of CIE abundances against finite differences"""
+    system = cie_system()
+    Tgrid = np.logspace(4, 6, 100)
+    knowns, guesses = cie_inputs(Tgrid)
+
+    solver = system.compile(knowns, guesses, tol=1e-6)
+    sol, sensitivities = solver.sensitivities(knowns, guesses)
+    assert set(sensitivities) == set(guesses)
+    assert set(sensitivities["H+"]) == {"T", "n_Htot"} | set(solver.assumed_values)
+
+    dT = 1e-3
+    sol2 = solver(knowns | {"T": Tgrid * (1 + dT)}, guesses)
+    for s in guesses:
+        finite_difference = (sol2[s] - sol[s]) / (Tgrid * dT)
+        significant = np.abs(finite_difference * Tgrid) > 1e-2 * sol[s]  # away from round-off-dominated differences
+        assert np.allclose(sensitivities[s]["T"][significant], finite_difference[significant], rtol=0.02)
+
+
+def test_continuation():
+    """Check that sweeping down a temperature grid by continuation agrees with solving each point from the guesses in
+    far fewer iterations"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(4, 6, 200))
+
+    solver = system.compile(knowns, guesses)
+    sol = solver(knowns, guesses)
+    sol_continued = system.solve(knowns, guesses, continuation={"parameter": "T", "reverse": True})
+    for s in guesses:
+        significant = sol[s] > 1e-6
+        assert np.allclose(sol_continued[s][significant], sol[s][significant], rtol=1e-2)
+
+    from jaco.numerics import continuation_sweep
+
+    guessvals, paramvals = solver.numerical_inputs(knowns, guesses)
+    _, num_iter, _ = solver.solve_arrays(guessvals, paramvals)
+    _, num_iter_continued, converged = continuation_sweep(
+        lambda X, p, mask: solver.continuation_step(X, p, mask, 20),
+        guessvals,
+        paramvals,
+        solver.param_names.index("T"),
+        cold_solve=solver.solve_batch,
+        reverse=True,
+    )
+    assert np.all(converged)
+    assert num_iter_continued.mean() < num_iter.mean() / 3
+
+
+def test_initial_guesses():
+    """Check that solving without guesses for the abundances gives the same solution as solving from explicit guesses,
+    in fewer iterations"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(4, 6, 200))
+
+    sol = system.solve(knowns, guesses)
+    sol_auto = system.solve(knowns)
+    for s in guesses:
+        significant = sol[s] > 1e-6
+        assert np.allclose(sol_auto[s][significant], sol[s][significant], rtol=1e-2)
+
+    solver = system.compile(knowns, guesses)
+    auto_guesses = system.initial_guesses(knowns)
+    assert set(auto_guesses) == set(guesses)
+    _, num_iter, _ = solver.solve_arrays(*solver.numerical_inputs(knowns, guesses))
+    _, num_iter_auto, _ = solver.solve_arrays(*solver.numerical_inputs(knowns, auto_guesses))
+    assert num_iter_auto.mean() < num_iter.mean() / 3
+
+
+def test_pseudo_transient():
+    """Check that pseudo-transient continuation from poor guesses agrees with the solution found by continuation"""
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(4, 6, 200), x_Hplus=0.5)
+
+    sol = system.solve(knowns, guesses, continuation={"parameter": "T", "reverse": True})
+    sol_ptc = system.solve(knowns, guesses, method="ptc")
+    for s in guesses:
+        significant = sol[s] > 1e-6
+        assert np.allclose(sol_ptc[s][significant], sol[s][significant], rtol=1e-2)
+
+
+def test_resolve_failed(monkeypatch):
+    """Check that with resolve_failed the pseudo-transient solver is only built once some cells have failed with every
+    other setting, and that it then re-solves them"""
+    import jaco.compiled_solver
+    from jaco.compiled_solver import STATUS_CONVERGED, STATUS_MAX_ITER
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+    solver = system.compile(knowns, guesses, resolve_failed=True)
+    sol = solver(knowns, guesses)
+    assert solver.pseudo_transient is None
+
+    # pretend that every cell failed, with pseudo-transient continuation as the only setting left to try
+    monkeypatch.setattr(jaco.compiled_solver, "RESOLVE_ESCALATION", ({"method": "ptc"},))
+    guessvals, paramvals = solver.numerical_inputs(knowns, guesses)
+    N = len(guessvals)
+    stats = {"num_jac": np.zeros(N, int), "num_factor": np.zeros(N, int), "status": np.full(N, STATUS_MAX_ITER)}
+    X, _, stats = solver.resolve_arrays(guessvals, np.zeros(N, int), stats, guessvals, paramvals)
+    assert solver.pseudo_transient is not None and np.all(stats["status"] == STATUS_CONVERGED)
+    sol_ptc = solver.package_solution(X, paramvals)
+    for s in guesses:
+        significant = sol[s] > 1e-6
+        assert np.allclose(sol_ptc[s][significant], sol[s][significant], rtol=1e-2)
+
+
+def test_warm_start():
+    """Check that re-solving from perturbed solutions, whose residuals are only round-off noise, converges in every
+    cell without being mistaken for a stalled iteration and re-solved"""
+    from jaco.compiled_solver import STATUS_CONVERGED
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 200))
+    solver = system.compile(knowns, guesses, resolve_failed=True)
+    sol = solver(knowns, guesses)
+    for eps in (1e-5, 1e-2):
+        _, status = solver(knowns, {s: sol[s] * (1 + eps) for s in guesses}, return_status=True)
+        assert np.all(status == STATUS_CONVERGED)
+    assert not solver.escalation_solves and solver.pseudo_transient is None
+
+
+def test_devices():
+    """Check that sharding the solves across all devices gives the same answer as the unsharded solve, and that the
+    sharded solver can be pickled"""
+    import pickle
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 101))
+
+    sol = system.solve(knowns, guesses)
+    solver = system.compile(knowns, guesses, devices="all")
+    solver = pickle.loads(pickle.dumps(solver))
+    sol_sharded = solver(knowns, guesses)
+    for s in sol:
+        assert np.allclose(sol_sharded[s], sol[s])
+
+
+def test_stoichiometry():
+    """Check that assembling the RHS and Jacobian from the distinct rates with the stoichiometry matrix gives the same
+    RHS, Jacobian and solution, and survives pickling"""
+    import jax
+    import pickle
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+
+    solver = system.compile(knowns, guesses, stoichiometry=False, jacobian="symbolic")
+    solver_stoichiometric = system.compile(knowns, guesses, stoichiometry=True, jacobian="symbolic")
+    assert solver_stoichiometric.rate_terms is not None and solver.rate_terms is None
+    solver_stoichiometric = pickle.loads(pickle.dumps(solver_stoichiometric))
+    X, params = solver.numerical_inputs(knowns, guesses)
+    for func in "f_numerical", "jac_numerical":
+        values = jax.vmap(lambda x, p: getattr(solver, func)(x, *p))(X, params)
+        values_stoichiometric = jax.vmap(lambda x, p: getattr(solver_stoichiometric, func)(x, *p))(X, params)
+        assert np.allclose(values_stoichiometric, values, rtol=1e-5, atol=1e-30)
+
+    sol, sol_stoichiometric = solver(knowns, guesses), solver_stoichiometric(knowns, guesses)
+    for s in sol:
+        assert np.allclose(sol_stoichiometric[s], sol[s], rtol=1e-4)
+
+
+def test_auxiliary():
+    """Check that evaluating the eliminated abundances once as auxiliary variables gives the same solution as
+    substituting them into the equations, and survives pickling"""
+    import pickle
+
+    system = cie_system()
+    knowns, guesses = cie_inputs(np.logspace(3, 6, 100))
+    sol = system.solve(knowns, guesses)
+    solver = system.compile(knowns, guesses, auxiliary=True)
+    assert solver.auxiliary_func is not None
+    sol_auxiliary = pickle.loads(pickle.dumps(solver))(knowns, guesses)
+    for s in sol:
+        assert np.allclose(sol_auxiliary[s], sol[s], rtol=1e-3, atol=1e-5)
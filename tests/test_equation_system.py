@@ -0,0 +1,118 @@
+from jaco.equation_system import EquationSystem
+from jaco.symbols import x_, n_, n_Htot
+import pickle
+from .test_compile import cie_system
+
+
+def indexed_symbols(system):
+    """The symbols of a system found by walking all of its equations"""
+    return set().union(*(EquationSystem.equation_symbols(e) for e in system.values()))
+
+
+def test_symbol_index():
+    """Check that the symbol index stays consistent with the equations as they are set, substituted and deleted, and
+    through pickling"""
+    system = cie_system().network.copy()
+    assert system.symbols == indexed_symbols(system)
+    assert set(system.chemical_species) == {"H", "H+", "He", "He+", "He++", "e-"}
+    assert system.equations_with(x_("He++")) == set()
+    assert system.equations_with("n_He++") == {"He++"}
+
+    assert len(system.equations_with(n_("He++"))) > 1
+    system.subs(n_("He++"), 0)
+    assert system.equations_with(n_("He++")) == set()
+    assert system.symbols == indexed_symbols(system)
+    assert "He++" in system.chemical_species  # still time-differentiated
+
+    reduced = system.reduced(["T", "n_Htot"])
+    assert reduced.symbols == indexed_symbols(reduced)
+    assert n_Htot in reduced.symbols and "e-" not in reduced
+    for s, keys in reduced.symbol_index.items():
+        assert keys == {k for k, e in reduced.items() if s in EquationSystem.equation_symbols(e)}
+
+    del reduced["He++"]
+    assert reduced.symbols == indexed_symbols(reduced)
+    unpickled = pickle.loads(pickle.dumps(reduced))
+    assert unpickled.symbol_index == reduced.symbol_index
+    assert set(unpickled.chemical_species) == set(reduced.chemical_species)
+
+
+def test_substitute():
+    """Check that applying a sequence of substitutions in a single pass gives the same system as applying them one at
+    a time, and that symbols are sanitized in a single pass"""
+    import sympy as sp
+    from jaco.symbols import sanitize_symbols
+
+    system = cie_system().network
+    substitutions = [
+        (n_("H+"), n_Htot * x_("H+")),
+        (n_("e-"), n_Htot * x_("e-")),
+        (x_("e-"), x_("H+") + x_("He+") + 2 * x_("He++")),
+        (x_("H+"), 1 - x_("H")),
+    ]
+    sequential, batched = system.copy(), system.copy()
+    for expr, replacement in substitutions:
+        sequential.subs(expr, replacement)
+    batched.substitute(substitutions)
+    assert batched.keys() == sequential.keys()
+    for k in batched:
+        assert sp.simplify(batched[k].rhs - sequential[k].rhs) == 0
+    assert batched.symbols == indexed_symbols(batched)
+
+    x = sp.Symbol("x_H+") * sp.Symbol("x_e-") + sp.Symbol("x_H+-")
+    assert {str(s) for s in sanitize_symbols(x).free_symbols} == {"x_Hplus", "x_eminus", "x_Hplusminus"}
+
+
+def test_auxiliary():
+    """Check that keeping the eliminated abundances as auxiliary variables gives the same RHS and Jacobian as
+    substituting them in, also through the Process entry points"""
+    import sympy as sp
+
+    process = cie_system()
+    system = process.network
+    solve_vars = ("H+", "He+", "He++")
+    func, jac, indices = system.solver_functions(solve_vars, return_jac=True)
+    func_aux, jac_aux, indices_aux, auxiliary = system.solver_functions(solve_vars, return_jac=True, auxiliary=True)
+    assert set(indices_aux) == set(indices)
+    order = [indices_aux[x] for x in indices]  # index order follows set iteration, so compare by symbol
+    assert set(auxiliary) == {x_("H"), x_("He"), x_("e-")}
+    assert all(not set(auxiliary).intersection(d.free_symbols) for d in auxiliary.values())  # fully resolved
+
+    values = {s: 0.5 + 0.1 * i for i, s in enumerate(sorted(set().union(*(f.free_symbols for f in func)), key=str))}
+    for i, f in enumerate(func):
+        f_aux = func_aux[order[i]].xreplace(auxiliary)
+        assert abs(float((f - f_aux).subs(values))) <= 1e-12 * abs(float(f.subs(values)))
+        for j, d in enumerate(jac[i]):
+            assert sp.simplify(d - jac_aux[order[i]][order[j]].xreplace(auxiliary)) == 0
+
+    assert "x_He =" in system.generate_code(solve_vars, language="c", auxiliary=True)
+    assert "x_He =" not in system.generate_code(solve_vars, language="c")
+    assert len(process.solver_functions(solve_vars, return_jac=True, auxiliary=True)) == 4
+    assert "x_He =" in process.generate_code(solve_vars, language="c", auxiliary=True)
+
+
+def test_stoichiometry():
+    """Check that factoring the RHS of a reaction network as S @ r reproduces it, with one rate per reaction whose
+    column of S is the net stoichiometry of the reaction (the other rates being the time derivatives)"""
+    import sympy as sp
+    import numpy as np
+    from jaco.process import Process
+    from jaco.processes.chemical_reaction import ChemicalReaction
+
+    equations = ("H + e- -> H+ + 2e-", "H+ + e- -> H", "2H -> H_2", "H_2 + H -> 3H")
+    reactions = [ChemicalReaction(e, sp.Symbol(f"k_{i}"), bibliography=["test"]) for i, e in enumerate(equations)]
+    system = Process.compose(reactions).network
+    keys = list(system.rhs)
+    rates, S = system.stoichiometry(keys)
+    assert S.shape == (len(keys), len(rates)) and S.dtype.kind == "i"
+    for i, k in enumerate(keys):
+        assert sp.simplify(sum(int(c) * r for c, r in zip(S[i], rates)) - system.rhs[k]) == 0
+
+    for reaction in reactions:
+        j = rates.index(reaction.rate)
+        lhs, rhs = reaction.species_and_coeffs(reaction.equation)
+        for i, k in enumerate(keys):
+            assert S[i, j] == rhs.get(k, 0) - lhs.get(k, 0)
+
+    rates, S = cie_system().network.reduced(["T", "n_Htot"], auxiliary=True).stoichiometry()
+    assert np.count_nonzero(S) > len(rates)  # rates are shared by the remaining equations
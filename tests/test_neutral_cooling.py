@@ -9,6 +9,7 @@ import numpy as np
 from matplotlib import pyplot as plt
 import sympy as sp
 from jaco.data import SolarAbundances
+from jaco.compiled_solver import STATUS_CONVERGED
 import pytest
 import matplotlib
 import os
@@ -18,14 +19,11 @@ matplotlib.use("Agg")
 test_temperatures = [
     100.0,
 ]  # initial temperature guesses. We aspire to make the solver converge from any initial guess, but for now it's sensitive...
+ptc_test_temperatures = [100.0, 1e4, 1e5]  # pseudo-transient continuation should converge from all of these
 
 
-@pytest.mark.parametrize("T0", test_temperatures)
-def test_neutral_cooling(T0):
-    """Solve for thermochemical structure of neutral ISM at a range of densities. This can potentially change
-    as we update the data or process implementations...
-    """
-
+def neutral_cooling_system():
+    """Returns the thermochemical network of the neutral ISM test problem"""
     processes = (
         [CollisionalIonization(s) for s in ("H", "He", "He+")]
         + [GasPhaseRecombination(i) for i in ("H+", "He+", "He++")]
@@ -49,6 +47,26 @@ def test_neutral_cooling(T0):
         * sp.exp(-91.211 / T)
         * (4890 / sp.sqrt(T) * (x_C * sp.Symbol("n_Htot")) + 0.47 * T**0.15 * sp.Symbol("n_Htot"))
     )
+    return system
+
+
+def neutral_cooling_inputs(T0, stride=10):
+    """Returns the known quantities, the guesses from an initial temperature guess T0 and the reference temperatures
+    of the neutral ISM test problem, on every stride-th point of the reference density grid"""
+    ngrid = np.logspace(-2, 3, 10**4)[::stride]
+    ones = np.ones_like(ngrid)
+    y = SolarAbundances.x("He")
+    guesses = {"T": T0 * ones, "H+": ones * 0.5, "He+": y * ones * 0.01, "He++": y * ones * 0.01}
+    T_test = np.load(os.path.dirname(os.path.abspath(__file__)) + "/neutral_cooling_testdata.npy")[::stride, 1]
+    return {"n_Htot": ngrid}, guesses, T_test
+
+
+@pytest.mark.parametrize("T0", test_temperatures)
+def test_neutral_cooling(T0):
+    """Solve for thermochemical structure of neutral ISM at a range of densities. This can potentially change
+    as we update the data or process implementations...
+    """
+    system = neutral_cooling_system()
 
     ngrid = np.logspace(-2, 3, 10**4)
     ones = np.ones_like(ngrid)
@@ -80,6 +98,61 @@ def test_neutral_cooling(T0):
     assert np.all(np.abs((T_test - sol["T"]) / sol["T"]) < 0.1)
 
 
+@pytest.mark.parametrize("T0", ptc_test_temperatures)
+def test_neutral_cooling_ptc(T0):
+    """Check that pseudo-transient continuation finds the reference thermochemical structure from initial temperature
+    guesses on either side of it, without careful steps"""
+    system = neutral_cooling_system()
+    knowns, guesses, T_test = neutral_cooling_inputs(T0)
+
+    sol = system.solve(knowns, guesses, tol=1e-3, method="ptc")
+    assert np.all(np.abs((T_test - sol["T"]) / sol["T"]) < 0.1)
+
+
+@pytest.mark.parametrize("T0", ptc_test_temperatures)
+def test_neutral_cooling_bisection(T0):
+    """Check that the bracketed search for thermal equilibrium finds the reference thermochemical structure from
+    initial temperature guesses on either side of it"""
+    system = neutral_cooling_system()
+    knowns, guesses, T_test = neutral_cooling_inputs(T0)
+
+    sol = system.solve(knowns, guesses, tol=1e-3, method="bisection")
+    assert np.all(np.abs((T_test - sol["T"]) / sol["T"]) < 0.01)
+
+
+def test_neutral_cooling_race():
+    """Check that racing alternative temperature guesses finds the reference thermochemical structure in one pass,
+    where solving from the first of them alone fails, and that the limiting-state guesses of the abundances are
+    generated"""
+    system = neutral_cooling_system()
+    knowns, guesses, T_test = neutral_cooling_inputs(1e5)
+    ones, y = np.ones_like(T_test), SolarAbundances.x("He")
+
+    sol = system.solve(knowns, guesses, tol=1e-3)
+    assert np.all(np.abs((T_test - sol["T"]) / sol["T"]) > 0.1)
+    sol = system.solve(knowns, [guesses | {"T": T * ones} for T in (1e5, 1e2, 1e4, 1e6)], tol=1e-3)
+    assert np.all(np.abs((T_test - sol["T"]) / sol["T"]) < 0.01)
+
+    alternatives = system.racing_guesses(knowns, {"T": 1e5 * ones})
+    assert len(alternatives) == 3  # linearized, ionized and neutral: there are no molecules
+    assert np.all(alternatives[1]["H+"] == 1) and np.allclose(alternatives[1]["He++"], y)
+    assert np.all(alternatives[2]["H+"] < 1e-20)
+
+
+def test_neutral_cooling_resolve():
+    """Check that the cells that fail to converge from a poor temperature guess are flagged, and that re-solving them
+    with escalating robustness settings finds the reference thermochemical structure"""
+    system = neutral_cooling_system()
+    knowns, guesses, T_test = neutral_cooling_inputs(1e4)
+
+    sol, status = system.solve(knowns, guesses, tol=1e-3, return_status=True)
+    wrong = np.abs((T_test - sol["T"]) / sol["T"]) > 0.1
+    assert wrong.any() and np.all(status[wrong] != STATUS_CONVERGED)
+    sol, status = system.solve(knowns, guesses, tol=1e-3, return_status=True, resolve_failed=True)
+    assert np.all(status == STATUS_CONVERGED)
+    assert np.all(np.abs((T_test - sol["T"]) / sol["T"]) < 0.01)
+
+
 if __name__ == "__main__":
     for t in test_temperatures:
         test_neutral_cooling(t)
@@ -0,0 +1,77 @@
+from jaco.processes import CollisionalIonization, GasPhaseRecombination, FreeFreeEmission
+from jaco import LookupTable
+import numpy as np
+import jax, jax.numpy as jnp
+import shutil
+import subprocess
+import pytest
+
+
+@pytest.fixture(scope="module")
+def cie_table():
+    processes = (
+        [CollisionalIonization(s) for s in ("H", "He", "He+")]
+        + [GasPhaseRecombination(i) for i in ("H+", "He+", "He++")]
+        + [FreeFreeEmission(i) for i in ("H+", "He+", "He++")]
+    )
+    system = sum(processes)
+    axes = {"n_Htot": np.logspace(-2, 2, 5), "T": np.logspace(4, 6, 41)}
+    return system, LookupTable.generate(system, axes)
+
+
+def test_table(cie_table, tmp_path):
+    """Check that a CIE table reproduces the solution at and between its grid points, survives a save/load round trip,
+    and interpolates identically with numpy and JAX"""
+    system, table = cie_table
+    assert table.shape == (5, 41)
+    assert "heat" in table.quantities and not table.log_quantities[table.quantities.index("heat")]
+
+    coords = {"n_Htot": np.full(40, 10.0), "T": np.sqrt(table.axes["T"][1:] * table.axes["T"][:-1])}
+    sol = system.solve(coords)
+    values = table(coords)
+    for s in ("H+", "He+", "He++", "e-"):
+        significant = sol[s] > 1e-4
+        assert np.allclose(values[s][significant], sol[s][significant], rtol=0.1)
+
+    table.save(str(tmp_path / "cie"))
+    loaded = LookupTable.load(str(tmp_path / "cie"))
+    assert isinstance(loaded.data, np.memmap)
+    assert loaded.quantities == table.quantities
+    loaded_values = loaded(coords)
+    for q in table.quantities:
+        assert np.all(loaded_values[q] == values[q])
+
+    points = np.c_[coords["n_Htot"], coords["T"]]
+    values_jax = jax.jit(lambda p: table.interpolate(p, xp=jnp))(points)
+    assert np.allclose(values_jax, table.interpolate(points), rtol=1e-4)
+
+
+@pytest.mark.skipif(shutil.which("cc") is None, reason="no C compiler")
+def test_table_codegen(cie_table, tmp_path):
+    """Check that the generated C interpolation routine agrees with the numpy one, for tables stored in float32 and in
+    float64, whose data are written out without loss of precision"""
+    _, table32 = cie_table
+    points = np.c_[np.logspace(-3, 3, 7), np.logspace(3.5, 6.5, 7)]  # including points off the grid
+    main = f"""
+#include <stdio.h>
+int main(void) {{
+    double points[7][2] = {{{", ".join(f"{{{n:.17g}, {T:.17g}}}" for n, T in points)}}};
+    double result[JACO_TABLE_NUM_QUANTITIES];
+    for (int i = 0; i < 7; i++) {{
+        jaco_table_interpolate(points[i], result);
+        for (int k = 0; k < JACO_TABLE_NUM_QUANTITIES; k++) printf("%.9g ", result[k]);
+        printf("\\n");
+    }}
+    return 0;
+}}
+"""
+    # perturbed so that the data are not representable in float32
+    data64 = table32.data.astype(np.float64) * (1 + 1e-7)
+    table64 = LookupTable(table32.axes, data64, table32.quantities, table32.log_axes, table32.log_quantities)
+    for table, ctype, rtol in (table32, "float", 1e-5), (table64, "double", 1e-8):
+        code = table.generate_code()
+        assert f"static const {ctype} jaco_table_data" in code
+        (tmp_path / "table.c").write_text(code + main)
+        subprocess.run(["cc", "-std=c99", "-o", str(tmp_path / "table"), str(tmp_path / "table.c"), "-lm"], check=True)
+        output = subprocess.run([str(tmp_path / "table")], check=True, capture_output=True, text=True).stdout
+        assert np.allclose(np.loadtxt(output.splitlines()), table.interpolate(points), rtol=rtol, atol=0)